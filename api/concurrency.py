@@ -0,0 +1,158 @@
+import asyncio, math, time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, status
+from utils.instrumentation import METRICS
+
+# Admission control for the retrieval endpoints. Every request has a deadline (its X-Request-Timeout-Ms header or
+# the default budget), the controller keeps running estimates of how long a request waits for a slot and how long
+# each kind of request runs once it has one. A request that would miss its deadline (or hold up the queue behind it
+# for longer than its share) is degraded, smallest loss in answer quality first, until its estimate fits instead
+# of everyone slowing down together. Shedding (429) is the last resort: a full queue, or a queue wait that alone
+# would use up the deadline.
+
+TIMEOUT_HEADER = "x-request-timeout-ms"
+# applied in this order, each only while the estimate still misses the deadline:
+# - shrink_k: k (and the hybrid candidate pool) shrinks, the answer only cites the top 3 chunks anyway
+# - hybrid_to_baseline: hybrid-bm25 runs as baseline (no BM25 retrieval or fusion), the biggest saving
+DEGRADATIONS = ("shrink_k", "hybrid_to_baseline")
+# weight of the newest observation in the running service time estimates
+SMOOTHING = 0.2
+
+class AdmissionController:
+    """
+    Caps how many requests run retrieval at once and how many may wait for a turn, and picks the degradations
+    each admitted request runs with so it finishes within its deadline.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, default_timeout_ms: float, degraded_k: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout_ms / 1000
+        self.degraded_k = degraded_k
+        self.in_flight = 0 # running + waiting
+        self.rejected = 0
+        self.degraded = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # seconds a request holds its slot: (mode it ran as, shrink_k) -> running estimate
+        self._service_time = {}
+        self._mean_service_time = None
+
+    def deadline(self, headers) -> float:
+        """perf_counter time by which a request should be answered, from its timeout header or the default budget."""
+        value = headers.get(TIMEOUT_HEADER)
+        if value is None:
+            return time.perf_counter() + self.default_timeout
+        try:
+            timeout_ms = float(value)
+        except ValueError:
+            timeout_ms = math.nan
+        if not timeout_ms > 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{TIMEOUT_HEADER} must be a positive number of ms")
+        return time.perf_counter() + timeout_ms / 1000
+
+    def _plan_key(self, mode: str, degradations) -> tuple:
+        ran_as = "baseline" if "hybrid_to_baseline" in degradations else mode
+        return ran_as, "shrink_k" in degradations
+
+    def estimate(self, mode: str, degradations=()):
+        """Expected seconds in a slot for a request of `mode` with these degradations, None if not measured yet."""
+        return self._service_time.get(self._plan_key(mode, degradations))
+
+    def estimated_wait(self, fastest: bool = False) -> float:
+        """
+        Expected seconds until a request arriving now gets a slot, at the mean service time so far or, fastest=True,
+        with every request ahead running as the cheapest baseline plan measured (as they will once they are late
+        too), 0 until one was measured.
+        """
+        ahead = self.in_flight - self.max_concurrency + 1
+        if fastest:
+            service_time = min((seconds for (ran_as, *_), seconds in self._service_time.items() if ran_as == "baseline"), default=0.0)
+        else:
+            service_time = self._mean_service_time or 0.0
+        return max(ahead, 0) * service_time / self.max_concurrency
+
+    def plan(self, mode: str, k: int, budget: float, weight: int = 1) -> tuple:
+        """Degradations for a request that has `budget` seconds left once it runs (`weight` queries' worth of work)."""
+        degradations = []
+        for degradation in DEGRADATIONS:
+            estimate = self.estimate(mode, degradations)
+            if estimate is None:
+                if degradations:
+                    break # this combination wasn't measured yet, try it (it may be enough) before degrading further
+                estimate = self._mean_service_time or 0.0
+            if estimate * weight <= budget:
+                break
+            # hybrid-bm25 also shrinks its candidate pool, whatever its k
+            if degradation == "shrink_k" and k <= self.degraded_k and mode != "hybrid-bm25":
+                continue
+            if degradation == "hybrid_to_baseline" and mode != "hybrid-bm25":
+                continue
+            degradations.append(degradation)
+        return tuple(degradations)
+
+    def _shed(self, reason: str):
+        self.rejected += 1
+        METRICS.inc("qna_shed_total", reason=reason)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Server is overloaded, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    def _observe(self, key: tuple, elapsed: float):
+        previous = self._service_time.get(key)
+        self._service_time[key] = elapsed if previous is None else previous + SMOOTHING * (elapsed - previous)
+        mean = self._mean_service_time
+        self._mean_service_time = elapsed if mean is None else mean + SMOOTHING * (elapsed - mean)
+
+    @asynccontextmanager
+    async def admit(self, mode: str, k: int, deadline: float, weight: int = 1):
+        """
+        Hold a retrieval slot for a request of `mode`/`k` due at `deadline` (`weight` queries for a batch), yields
+        the degradations it has to run with (planned once the slot is free, on the time actually left).
+        Sheds with a 429 when the queue is full or the request would only get its slot after its deadline.
+        """
+        if self.in_flight >= self.max_concurrency + self.max_queue:
+            self._shed("queue_full")
+        # even if everyone ahead degrades all the way, this one would only get its slot after its deadline
+        if self.estimated_wait(fastest=True) >= deadline - time.perf_counter():
+            self._shed("deadline")
+
+        self.in_flight += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline - time.perf_counter(), 0))
+            except asyncio.TimeoutError:
+                self._shed("queue_timeout")
+            try:
+                started = time.perf_counter()
+                # the requests still queued behind this one have to be served in time too, so it gets at most its
+                # share of the default budget: under a growing queue everyone degrades before anyone runs late
+                waiting = max(self.in_flight - self.max_concurrency, 0)
+                budget = min(deadline - started, self.default_timeout * self.max_concurrency / (waiting + 1))
+                degradations = self.plan(mode, k, budget, weight)
+                if degradations:
+                    self.degraded += 1
+                    for degradation in degradations:
+                        METRICS.inc("qna_degradations_total", degradation=degradation)
+                yield degradations
+                self._observe(self._plan_key(mode, degradations), (time.perf_counter() - started) / weight)
+            finally:
+                self._semaphore.release()
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "degraded": self.degraded,
+            "default_timeout_ms": self.default_timeout * 1000,
+            "estimated_wait_ms": self.estimated_wait() * 1000,
+            "service_ms": {
+                "/".join([mode] + [name for name, applied in zip(DEGRADATIONS, flags) if applied]): seconds * 1000
+                for (mode, *flags), seconds in self._service_time.items()
+            }
+        }
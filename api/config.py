@@ -0,0 +1,54 @@
+import os
+
+# API settings, every knob can be overridden with an environment variable of the same name
+
+def _optional_float(name: str):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+# vector search backend: "chroma" (HNSW) or "numpy" (exact search over the memory-mapped export, see vector_db/vector_backends.py)
+QNA_VECTOR_BACKEND = os.getenv("QNA_VECTOR_BACKEND", "chroma")
+# with the numpy backend: "int8" or "binary" searches quantized codes and rescores the candidates exactly
+QNA_VECTOR_QUANTIZATION = os.getenv("QNA_VECTOR_QUANTIZATION") or None
+
+# production launch (python -m api.serve): worker processes sharing the memory-mapped indexes
+QNA_WORKERS = int(os.getenv("QNA_WORKERS", os.cpu_count() or 1))
+QNA_HOST = os.getenv("QNA_HOST", "0.0.0.0")
+QNA_PORT = int(os.getenv("QNA_PORT", 8000))
+
+# "background": bind the port straight away and warm the model/indexes up behind /readyz (503 until ready),
+# "blocking": warm up before the server accepts connections
+QNA_STARTUP_MODE = os.getenv("QNA_STARTUP_MODE", "background")
+
+# query result cache in front of /ask
+QNA_CACHE_SIZE = int(os.getenv("QNA_CACHE_SIZE", 1024))
+QNA_CACHE_TTL_SECONDS = _optional_float("QNA_CACHE_TTL_SECONDS") # no expiry unless set
+QNA_CACHE_DISK_PATH = os.getenv("QNA_CACHE_DISK_PATH") or None # e.g. "cache/query_cache.db" to keep entries across restarts
+
+# semantic (near duplicate) query cache: a query whose embedding has at least this cosine similarity to a cached
+# query with the same mode/k is answered from it, 0 entries turns it off
+QNA_SEMANTIC_CACHE_SIZE = int(os.getenv("QNA_SEMANTIC_CACHE_SIZE", 1024))
+QNA_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("QNA_SEMANTIC_CACHE_THRESHOLD", 0.95))
+
+# micro-batching of concurrent query embeddings / collection queries
+QNA_BATCH_WINDOW_MS = float(os.getenv("QNA_BATCH_WINDOW_MS", 5))
+QNA_MAX_BATCH_SIZE = int(os.getenv("QNA_MAX_BATCH_SIZE", 32))
+# most items one /ask/batch request may carry (422 above it), the whole batch runs as one retrieval job
+QNA_MAX_BATCH_ITEMS = int(os.getenv("QNA_MAX_BATCH_ITEMS", 64))
+
+# blocking retrieval/formatting runs in this many threads, off the event loop
+QNA_RETRIEVAL_WORKERS = int(os.getenv("QNA_RETRIEVAL_WORKERS", min(8, (os.cpu_count() or 1) + 2)))
+# requests allowed to run retrieval at once, and how many more may wait before we answer 429
+QNA_MAX_CONCURRENCY = int(os.getenv("QNA_MAX_CONCURRENCY", QNA_RETRIEVAL_WORKERS))
+QNA_MAX_QUEUE = int(os.getenv("QNA_MAX_QUEUE", 64))
+# admission control: a request's deadline when it has no X-Request-Timeout-Ms header, and what a degraded request
+# shrinks to (k, and the candidate pool of each side for hybrid-bm25) when it would miss its deadline
+QNA_REQUEST_TIMEOUT_MS = float(os.getenv("QNA_REQUEST_TIMEOUT_MS", 2000))
+QNA_DEGRADED_K = int(os.getenv("QNA_DEGRADED_K", 3))
+QNA_DEGRADED_CANDIDATE_K = int(os.getenv("QNA_DEGRADED_CANDIDATE_K", 10))
+
+# sampling profiler for slow requests (also switchable at runtime with POST /profiler), writes collapsed stacks
+QNA_PROFILER_ENABLED = os.getenv("QNA_PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
+QNA_PROFILER_SLOW_MS = float(os.getenv("QNA_PROFILER_SLOW_MS", 500))
+QNA_PROFILER_INTERVAL_MS = float(os.getenv("QNA_PROFILER_INTERVAL_MS", 5))
+QNA_PROFILER_DIR = os.getenv("QNA_PROFILER_DIR", "profiles")
@@ -1,31 +1,536 @@
+import time
+_import_started = time.perf_counter()
+
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, status
-from api.qna_model import QnAModel
-from vector_db.baseline_search import cosine_search, filter_results_by_threshold
-from hybrid_reranker.bm25_reranker import hybrid_reranking
-from utils.retrieval_utils import query_result_with_citations
+import asyncio, contextvars, json
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from api.qna_model import QnAModel, QnABatchModel, ProfilerModel
+from api import config
+from api.concurrency import AdmissionController
+from api.startup import StartupTracker
+from utils.query_cache import QueryCache, make_cache_key
+from utils.semantic_cache import semantic_scope
+from utils.instrumentation import METRICS, span, start_request_timings, request_timings, server_timing_header, process_memory
+from utils.profiler import SlowRequestProfiler
 import uvicorn
 
-app = FastAPI(title="Mini-QnA System")
+# NOTE : chromadb, bm25s/scipy, numpy and pyspellchecker are imported by warm_up (and lazily inside the
+# functions below), not here, so the port is bound in well under a second and /healthz answers right away.
 
-@app.post("/ask", status_code=status.HTTP_200_OK)
-async def ask_qna(payload: QnAModel):
-    if payload.mode == "baseline":
-        raw_results = cosine_search(payload.query, payload.k)
-        results = filter_results_by_threshold(raw_results)
-    elif payload.mode == 'hybrid-bm25':
-        results = hybrid_reranking(payload.query)
-    
-    answer_with_citations = query_result_with_citations(results)
-
-    return {
+WARMUP_QUERY = "What is OSHA?"
+
+def warm_up(state, tracker: StartupTracker):
+    """
+    Heavy imports, open the vector backend and BM25 index, load (or download) the embedding model and run a
+    dummy query through every stage, so the first real request doesn't pay for any of it.
+    Runs in the retrieval executor, the service and batcher are only published on app.state once warm.
+    """
+    with tracker.phase("imports"):
+        from vector_db.retrieval_service import RetrievalService
+        from vector_db.query_batcher import QueryBatcher
+        from hybrid_reranker.bm25_reranker import HYBRID_CANDIDATE_K
+        from hybrid_reranker.bm25_index import lexical_search
+        from utils.retrieval_utils import get_spell_checker
+        from utils.semantic_cache import SemanticQueryCache
+    with tracker.phase("open_indexes"):
+        service = RetrievalService(backend=config.QNA_VECTOR_BACKEND, quantization=config.QNA_VECTOR_QUANTIZATION)
+    # the warm up calls go around the instrumented service methods so they don't land in the stage metrics
+    with tracker.phase("embedding_model"):
+        embeddings = service.embedding_function([WARMUP_QUERY])
+    with tracker.phase("vector_search"):
+        results = service.backend.query(embeddings, HYBRID_CANDIDATE_K, quantization=config.QNA_VECTOR_QUANTIZATION)
+    if service.lexical_index is not None:
+        with tracker.phase("lexical_index"):
+            lexical_search(service.lexical_index, [WARMUP_QUERY], HYBRID_CANDIDATE_K)
+    # the spell checker (~35MB per process) only formats chunks ingested before snippets were stored with them
+    if any('snippet' not in meta for meta in results['metadatas'][0]):
+        with tracker.phase("spell_checker"):
+            get_spell_checker()
+
+    # near duplicate questions ("What is OSHA?" / "what's osha") answered from the closest cached query's embedding
+    state.semantic_cache = SemanticQueryCache(
+        max_entries=config.QNA_SEMANTIC_CACHE_SIZE,
+        threshold=config.QNA_SEMANTIC_CACHE_THRESHOLD
+    ) if config.QNA_SEMANTIC_CACHE_SIZE > 0 else None
+    state.query_batcher = QueryBatcher(
+        service,
+        max_wait_ms=config.QNA_BATCH_WINDOW_MS,
+        max_batch_size=config.QNA_MAX_BATCH_SIZE,
+        executor=state.executor,
+        semantic_cache=state.semantic_cache
+    )
+    state.retrieval_service = service
+
+async def run_warm_up(app: FastAPI):
+    tracker = app.state.startup
+    try:
+        await asyncio.get_running_loop().run_in_executor(app.state.executor, warm_up, app.state, tracker)
+    except Exception as e:
+        tracker.mark_failed(e)
+        return
+    tracker.mark_ready()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.startup = StartupTracker(started=_import_started)
+    app.state.startup.record_phase("app_import", time.perf_counter() - _import_started)
+    # the vector backend and the embedding model are opened once (by warm_up), every request reuses them
+    app.state.retrieval_service = None
+    app.state.query_batcher = None
+    # all blocking retrieval/formatting runs here so the event loop stays free for other requests
+    # (threads, not processes: the model and the indexes are shared and onnx/numpy release the GIL)
+    app.state.executor = ThreadPoolExecutor(
+        max_workers=config.QNA_RETRIEVAL_WORKERS,
+        thread_name_prefix="retrieval"
+    )
+    # retrieval slots, per request deadlines and the degradations that keep requests within them under load
+    app.state.limiter = AdmissionController(
+        config.QNA_MAX_CONCURRENCY, config.QNA_MAX_QUEUE,
+        default_timeout_ms=config.QNA_REQUEST_TIMEOUT_MS,
+        degraded_k=config.QNA_DEGRADED_K
+    )
+    app.state.query_cache = QueryCache(
+        max_entries=config.QNA_CACHE_SIZE,
+        ttl_seconds=config.QNA_CACHE_TTL_SECONDS,
+        disk_path=config.QNA_CACHE_DISK_PATH
+    )
+    # created by warm_up (it needs numpy), None until then or when turned off
+    app.state.semantic_cache = None
+    app.state.profiler = SlowRequestProfiler(
+        interval_ms=config.QNA_PROFILER_INTERVAL_MS,
+        slow_ms=config.QNA_PROFILER_SLOW_MS,
+        output_dir=config.QNA_PROFILER_DIR
+    )
+    if config.QNA_PROFILER_ENABLED:
+        app.state.profiler.enable()
+
+    # "background": bind the port now and warm up behind /readyz, "blocking": warm up before serving anything
+    warm_up_task = asyncio.create_task(run_warm_up(app))
+    if config.QNA_STARTUP_MODE == "blocking":
+        await warm_up_task
+        if not app.state.startup.ready:
+            raise RuntimeError(f"Warm up failed: {app.state.startup.error}")
+    yield
+    app.state.profiler.disable()
+    app.state.executor.shutdown(wait=True)
+    app.state.query_cache.close()
+    app.state.retrieval_service = None
+
+app = FastAPI(title="Mini-QnA System", lifespan=lifespan)
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Per request latency/status metrics, Server-Timing header with the stage timings, slow request profiles."""
+    timings = start_request_timings()
+    started = time.perf_counter()
+    response = await call_next(request)
+    finished = time.perf_counter()
+
+    # the route template, not the raw path, so unknown urls don't each get their own series
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    METRICS.observe("qna_request_seconds", finished - started, endpoint=endpoint)
+    METRICS.inc("qna_requests_total", endpoint=endpoint, status=response.status_code)
+    response.headers["Server-Timing"] = server_timing_header(timings, finished - started)
+    profiler = getattr(request.app.state, "profiler", None)
+    if profiler is not None:
+        profiler.request_finished(endpoint, started, finished)
+    return response
+
+def in_request_context(fn, *args):
+    """
+    fn(*args) bound to the current context, for run_in_executor (which doesn't carry contextvars over), so
+    stages timed in the executor thread land in this request's Server-Timing.
+    """
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args)
+
+def require_ready(request: Request):
+    """503 while the model and indexes are still warming up (readiness probes keep traffic away until then)."""
+    if not request.app.state.startup.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is warming up, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+def build_response(results, mode: str, degradations=()) -> dict:
+    """Format retrieval results into the /ask response shape, a degraded response lists its degradations."""
+    from utils.retrieval_utils import query_result_with_citations
+    with span("format"):
+        answer_with_citations = query_result_with_citations(results)
+    if answer_with_citations.get('answer') is None:
+        METRICS.inc("qna_abstentions_total", mode=mode)
+
+    response = {
         'answer' : answer_with_citations.get('answer'),
         'contexts' : [answer_with_citations.get('citations'), answer_with_citations.get('scores')],
-        'mode' : payload.mode
+        'mode' : mode
+    }
+    if degradations:
+        response['degradations'] = list(degradations)
+    return response
+
+def cacheable(response: dict) -> bool:
+    """Degraded responses are never cached, the same question asked once the load is gone gets a full answer."""
+    return 'degradations' not in response
+
+def response_params(item: QnAModel) -> dict:
+    """Request options besides query/mode/k that change the response (cache keys and semantic cache scopes)."""
+    params = {"alpha": item.alpha, "fusion": item.fusion} if item.mode == "hybrid-bm25" else {}
+    sources = item.source_ids()
+    if sources is not None:
+        params["sources"] = sources
+    return params
+
+def apply_degradations(item: QnAModel, degradations) -> tuple:
+    """
+    (item as admission control lets it run, the degradations that apply to it): baseline instead of hybrid-bm25,
+    a smaller k (and hybrid candidate pool).
+    """
+    update, applied = {}, []
+    for degradation in degradations:
+        if degradation == "shrink_k":
+            if item.k <= config.QNA_DEGRADED_K and item.mode == "baseline":
+                continue
+            update["k"] = min(item.k, config.QNA_DEGRADED_K)
+        elif degradation == "hybrid_to_baseline":
+            if item.mode != "hybrid-bm25":
+                continue
+            update["mode"] = "baseline"
+        applied.append(degradation)
+    return (item.model_copy(update=update) if update else item), tuple(applied)
+
+def candidate_k(degradations=()) -> int:
+    """How many candidates each side brings into hybrid fusion."""
+    from hybrid_reranker.bm25_reranker import HYBRID_CANDIDATE_K
+    if "shrink_k" in degradations:
+        return min(config.QNA_DEGRADED_CANDIDATE_K, HYBRID_CANDIDATE_K)
+    return HYBRID_CANDIDATE_K
+
+def vector_k(item: QnAModel, degradations=()) -> int:
+    """How many vector hits an item needs: its k for baseline, the fusion candidate pool for hybrid-bm25."""
+    return item.k if item.mode == "baseline" else candidate_k(degradations)
+
+def rerank(item: QnAModel, vector_results, service, degradations=()):
+    """Abstain filter (baseline) or BM25 fusion (hybrid-bm25, best k by the item's strategy/alpha) of one query's vector results."""
+    from vector_db.baseline_search import filter_results_by_threshold
+    from hybrid_reranker.bm25_reranker import hybrid_reranking
+    if item.mode == "baseline":
+        return filter_results_by_threshold(vector_results)
+    elif item.mode == 'hybrid-bm25':
+        return hybrid_reranking(
+            item.query, k=item.k, alpha=item.alpha, service=service, vector_results=vector_results, strategy=item.fusion,
+            candidate_k=candidate_k(degradations), sources=item.source_ids()
+        )
+
+def rerank_and_respond(item: QnAModel, vector_results, service, degradations=()) -> dict:
+    """Blocking half of /ask (BM25 fusion + answer formatting), runs in the retrieval executor."""
+    return build_response(rerank(item, vector_results, service, degradations), item.mode, degradations)
+
+def store_response(state, cache_key: str, scope: str, embedding, response: dict):
+    """Cache a response under its exact key and, when the query was embedded, in the semantic cache."""
+    state.query_cache.set(cache_key, response)
+    if embedding is not None and state.semantic_cache is not None:
+        state.semantic_cache.set(embedding, scope, response)
+
+def answer_batch(items, service, semantic_cache=None, degradations=()) -> list:
+    """
+    Blocking /ask/batch work: one embedding pass, semantic cache lookups, then one chroma query + batched fusion for
+    the items that missed (run with `degradations` where they apply), runs in the retrieval executor. Returns
+    (response, query embedding) per item, the embedding is None for semantic cache hits (nothing new to cache).
+    """
+    embeddings = service.embed([item.query for item in items])
+    responses = [None] * len(items)
+    if semantic_cache is not None:
+        with span("semantic_cache"):
+            responses = [
+                semantic_cache.get(embedding, semantic_scope(item.mode, item.k, **response_params(item)))
+                for embedding, item in zip(embeddings, items)
+            ]
+    misses = [row for row, response in enumerate(responses) if response is None]
+    answered = [(response, None) for response in responses]
+    if misses:
+        miss_embeddings = [embeddings[row] for row in misses]
+        miss_responses = search_and_answer([items[row] for row in misses], miss_embeddings, service, degradations)
+        for row, embedding, response in zip(misses, miss_embeddings, miss_responses):
+            answered[row] = (response, embedding)
+    return answered
+
+def search_and_answer(items, embeddings, service, degradations=()) -> list:
+    """
+    Responses for embedded /ask/batch items: one chroma query per source scope at the largest k any of its items
+    needs + batched fusion.
+    """
+    from vector_db.baseline_search import filter_results_by_threshold, slice_query_result
+    from hybrid_reranker.bm25_reranker import hybrid_reranking_batch
+    items, item_degradations = zip(*[apply_degradations(item, degradations) for item in items])
+    item_ks = [vector_k(item, applied) for item, applied in zip(items, item_degradations)]
+    item_sources = [item.source_ids() for item in items]
+    vector_results = [None] * len(items)
+    scope_groups = {}
+    for row, sources in enumerate(item_sources):
+        scope_groups.setdefault(sources, []).append(row)
+    for sources, rows in scope_groups.items():
+        raw_results = service.search([embeddings[row] for row in rows], max(item_ks[row] for row in rows), sources=sources)
+        for i, row in enumerate(rows):
+            vector_results[row] = slice_query_result(raw_results, i, item_ks[row])
+
+    results = [None] * len(items)
+    # hybrid items are fused as a batch per (k, alpha, strategy, source scope, candidate pool)
+    hybrid_groups = {}
+    for row, item in enumerate(items):
+        if item.mode == "hybrid-bm25":
+            hybrid_groups.setdefault((item.k, item.alpha, item.fusion, item_sources[row], item_ks[row]), []).append(row)
+    for (k, alpha, strategy, sources, n_candidates), hybrid_rows in hybrid_groups.items():
+        reranked = hybrid_reranking_batch(
+            [items[row].query for row in hybrid_rows], k, alpha,
+            service=service,
+            vector_results=[vector_results[row] for row in hybrid_rows],
+            strategy=strategy,
+            candidate_k=n_candidates,
+            sources=sources
+        )
+        for row, reranked_results in zip(hybrid_rows, reranked):
+            results[row] = reranked_results
+    for row, item in enumerate(items):
+        if item.mode == "baseline":
+            results[row] = filter_results_by_threshold(vector_results[row])
+
+    return [
+        build_response(result, item.mode, applied)
+        for result, item, applied in zip(results, items, item_degradations)
+    ]
+
+@app.post("/ask", status_code=status.HTTP_200_OK)
+async def ask_qna(payload: QnAModel, request: Request):
+    require_ready(request)
+    service = request.app.state.retrieval_service
+    batcher = request.app.state.query_batcher
+    cache = request.app.state.query_cache
+    limiter = request.app.state.limiter
+    deadline = limiter.deadline(request.headers)
+
+    # repeated questions skip embedding, search and formatting entirely
+    cache_key = make_cache_key(payload.query, payload.mode, payload.k, **response_params(payload))
+    with span("cache"):
+        cached_response = cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response
+
+    loop = asyncio.get_running_loop()
+    scope = semantic_scope(payload.mode, payload.k, **response_params(payload))
+    # past this point we hold one of the limited retrieval slots (429 if the queue is full or the deadline would
+    # pass while queued), running with whatever degradations it takes to answer before the deadline
+    async with limiter.admit(payload.mode, payload.k, deadline) as degradations:
+        item, degradations = apply_degradations(payload, degradations)
+        # a near duplicate of a cached question comes back as its (full) response, skipping search, fusion and formatting
+        response, vector_results, embedding = await batcher.search_or_cached(
+            payload.query, vector_k(item, degradations), scope, sources=payload.source_ids()
+        )
+        if response is None:
+            response = await loop.run_in_executor(
+                request.app.state.executor,
+                in_request_context(rerank_and_respond, item, vector_results, service, degradations)
+            )
+        else:
+            embedding = None # already in the semantic cache
+    if cacheable(response):
+        store_response(request.app.state, cache_key, scope, embedding, response)
+
+    return response
+
+def encode_event(event: str, data: dict, sse: bool) -> str:
+    """One stream event, as a server-sent event or as an NDJSON line ({"event": ..., **data})."""
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+async def stream_answer(results, cached_response, payload: QnAModel, store, executor, sse: bool, header: dict):
+    """
+    Body of /ask/stream: the retrieval header, then every ranked citation as soon as it is formatted, the
+    combined answer last. A cache hit replays the cached response, otherwise the assembled response is
+    handed to `store` (None for degraded responses) to be cached like /ask's.
+    """
+    from utils.retrieval_utils import ranked_chunks, build_citation, combine_answer
+    yield encode_event("retrieval", header, sse)
+
+    if cached_response is not None:
+        for rank, (citation, score) in enumerate(zip(*cached_response['contexts'])):
+            yield encode_event("citation", {"rank": rank, "score": score, "citation": citation}, sse)
+        yield encode_event("answer", {"answer": cached_response['answer']}, sse)
+        return
+
+    loop = asyncio.get_running_loop()
+    snippets, citations, scores = [], [], []
+    for rank, (doc, meta, score) in enumerate(ranked_chunks(results)):
+        # snippets missing from older chunks need the spell checker, keep that off the event loop
+        snippet, citation = await loop.run_in_executor(executor, build_citation, doc, meta, score)
+        snippets.append(snippet)
+        citations.append(citation)
+        scores.append(score)
+        yield encode_event("citation", {"rank": rank, "score": score, "citation": citation}, sse)
+
+    answer = combine_answer(snippets) if snippets else None
+    if answer is None:
+        METRICS.inc("qna_abstentions_total", mode=payload.mode)
+    yield encode_event("answer", {"answer": answer}, sse)
+    if store is not None:
+        store({'answer': answer, 'contexts': [citations, scores], 'mode': payload.mode})
+
+@app.post("/ask/stream", status_code=status.HTTP_200_OK)
+async def ask_qna_stream(payload: QnAModel, request: Request):
+    """
+    Streaming /ask: NDJSON by default, server-sent events with `Accept: text/event-stream`.
+    Retrieval (and fusion) runs before the response starts, so errors still come back as status codes.
+    """
+    require_ready(request)
+    service = request.app.state.retrieval_service
+    cache = request.app.state.query_cache
+    limiter = request.app.state.limiter
+    deadline = limiter.deadline(request.headers)
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    header = {"query": payload.query, "mode": payload.mode, "k": payload.k, "sources": payload.source_ids()}
+
+    cache_key = make_cache_key(payload.query, payload.mode, payload.k, **response_params(payload))
+    with span("cache"):
+        cached_response = cache.get(cache_key)
+
+    results, embedding, item, degradations = None, None, payload, ()
+    scope = semantic_scope(payload.mode, payload.k, **response_params(payload))
+    header["cached"] = cached_response is not None
+    if cached_response is None:
+        loop = asyncio.get_running_loop()
+        async with limiter.admit(payload.mode, payload.k, deadline) as degradations:
+            item, degradations = apply_degradations(payload, degradations)
+            cached_response, vector_results, embedding = await request.app.state.query_batcher.search_or_cached(
+                payload.query, vector_k(item, degradations), scope, sources=payload.source_ids()
+            )
+            if cached_response is None:
+                results = await loop.run_in_executor(
+                    request.app.state.executor,
+                    in_request_context(rerank, item, vector_results, service, degradations)
+                )
+            else:
+                header["cached"] = "semantic"
+                degradations = () # the cached response is a full one
+                store_response(request.app.state, cache_key, scope, None, cached_response)
+    if degradations:
+        header.update({"mode": item.mode, "k": item.k, "degradations": list(degradations)})
+    header["timings_ms"] = {stage: elapsed * 1000 for stage, elapsed in (request_timings() or {}).items()}
+
+    store = partial(store_response, request.app.state, cache_key, scope, embedding) if not degradations else None
+    return StreamingResponse(
+        stream_answer(
+            results, cached_response, item, store, request.app.state.executor, sse, header
+        ),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # no proxy buffering, each event should reach the client as soon as it is written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/ask/batch", status_code=status.HTTP_200_OK)
+async def ask_qna_batch(payload: QnABatchModel, request: Request):
+    require_ready(request)
+    service = request.app.state.retrieval_service
+    cache = request.app.state.query_cache
+    limiter = request.app.state.limiter
+    deadline = limiter.deadline(request.headers)
+
+    items = payload.items
+    cache_keys = [make_cache_key(item.query, item.mode, item.k, **response_params(item)) for item in items]
+    with span("cache"):
+        responses = [cache.get(cache_key) for cache_key in cache_keys]
+    pending = [i for i, response in enumerate(responses) if response is None]
+
+    if pending:
+        loop = asyncio.get_running_loop()
+        # admitted as one request that costs as much as its pending items, degradations apply to every item
+        mode = "hybrid-bm25" if any(items[i].mode == "hybrid-bm25" for i in pending) else "baseline"
+        async with limiter.admit(mode, max(items[i].k for i in pending), deadline, weight=len(pending)) as degradations:
+            answered = await loop.run_in_executor(
+                request.app.state.executor,
+                in_request_context(
+                    answer_batch, [items[i] for i in pending], service, request.app.state.semantic_cache, degradations
+                )
+            )
+        for i, (response, embedding) in zip(pending, answered):
+            responses[i] = response
+            if cacheable(response):
+                store_response(request.app.state, cache_keys[i], semantic_scope(items[i].mode, items[i].k, **response_params(items[i])), embedding, response)
+
+    return {'results' : responses}
+
+@app.get("/healthz", status_code=status.HTTP_200_OK)
+async def healthz(request: Request):
+    """Liveness: the process is up and serving, only fails if warm up crashed (a restart is the fix)."""
+    startup = request.app.state.startup
+    if startup.error is not None:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "failed", "error": startup.error})
+    return {"status": "ok"}
+
+@app.get("/readyz", status_code=status.HTTP_200_OK)
+async def readyz(request: Request):
+    """Readiness: 200 once the model and indexes are warm, 503 (with the current startup phase) until then."""
+    startup = request.app.state.startup
+    if not startup.ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=startup.status())
+    return startup.status()
+
+@app.get("/cache/stats", status_code=status.HTTP_200_OK)
+async def cache_stats(request: Request):
+    stats = request.app.state.query_cache.stats()
+    semantic_cache = request.app.state.semantic_cache
+    stats["semantic"] = semantic_cache.stats() if semantic_cache is not None else None
+    return stats
+
+@app.get("/concurrency/stats", status_code=status.HTTP_200_OK)
+async def concurrency_stats(request: Request):
+    return request.app.state.limiter.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus scrape endpoint: stage/request histograms plus the cache, limiter and batcher stats."""
+    state = request.app.state
+    component_stats = {
+        "qna_cache": state.query_cache.stats(),
+        "qna_semantic_cache": state.semantic_cache.stats() if state.semantic_cache is not None else {},
+        "qna_concurrency": state.limiter.stats(),
+        "qna_batcher": {
+            "batches": state.query_batcher.batches if state.query_batcher else 0,
+            "batched_queries": state.query_batcher.batched_queries if state.query_batcher else 0
+        },
+        "qna_profiler": {"profiles_written": state.profiler.profiles_written, "profiles_dropped": state.profiler.profiles_dropped}
     }
+    for prefix, stats in component_stats.items():
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                METRICS.set_gauge(f"{prefix}_{name}", value)
+    for kind, value in process_memory().items():
+        METRICS.set_gauge("qna_process_memory_bytes", value, kind=kind)
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiler", status_code=status.HTTP_200_OK)
+async def profiler_stats(request: Request):
+    return request.app.state.profiler.stats()
+
+@app.post("/profiler", status_code=status.HTTP_200_OK)
+async def configure_profiler(payload: ProfilerModel, request: Request):
+    """Switch the slow request profiler on/off at runtime."""
+    profiler = request.app.state.profiler
+    if payload.enabled:
+        profiler.enable(slow_ms=payload.slow_ms, interval_ms=payload.interval_ms)
+    else:
+        # joins the sampler thread, keep that off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, profiler.disable)
+    return profiler.stats()
 
 # Run the app with Uvicorn
 if __name__ == "__main__":
@@ -1,10 +1,16 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Literal
+from pydantic import BaseModel, Field, ConfigDict, model_validator
+from typing import List, Literal, Optional
+from vector_db.source_filters import resolve_sources
+from api import config
 
 class QnAModel(BaseModel):
     query: str = Field(..., description="User's query to the System")
-    k: int = Field(default=5, description="Number of k Chunks to retrieve as an answer")
+    k: int = Field(default=5, ge=1, description="Number of k Chunks to retrieve as an answer")
     mode: Literal["baseline", "hybrid-bm25"] = Field(default="baseline", description="Mode of chunk retrieval (base retrieve or hybrid-bm25 reranking)")
+    alpha: float = Field(default=0.6, ge=0, le=1, description="hybrid-bm25 only: weight of the vector side in the fusion (1 - alpha for BM25)")
+    fusion: Literal["minmax", "zscore", "rrf"] = Field(default="minmax", description="hybrid-bm25 only: score fusion strategy (min-max or z-score blend, reciprocal rank fusion)")
+    sources: Optional[List[str]] = Field(default=None, min_length=1, description="Only search the chunks of these source ids (e.g. \"src03\")")
+    titles: Optional[List[str]] = Field(default=None, min_length=1, description="Only search the chunks of the sources with these titles (case insensitive), adds to `sources`")
 
     model_config = ConfigDict(
         from_attributes=True,
@@ -15,3 +21,42 @@ class QnAModel(BaseModel):
                 "mode" : "baseline"
             }
     })
+
+    @model_validator(mode="after")
+    def check_sources(self):
+        # unknown source ids / titles are a 422, not a search that silently finds nothing
+        self.source_ids()
+        return self
+
+    def source_ids(self):
+        """Sorted tuple of the source ids this query is limited to, None to search every source."""
+        return resolve_sources(self.sources, self.titles)
+
+
+class QnABatchModel(BaseModel):
+    items: List[QnAModel] = Field(
+        ..., min_length=1, max_length=config.QNA_MAX_BATCH_ITEMS,
+        description="Queries to answer in one batch, each with its own k and mode"
+    )
+
+    model_config = ConfigDict(
+        from_attributes=True,
+        json_schema_extra={
+            "example" : {
+                "items" : [
+                    {"query" : "What is OSHA?", "k" : 5, "mode" : "baseline"},
+                    {"query" : "What is the role of PPE?", "k" : 5, "mode" : "hybrid-bm25"}
+                ]
+            }
+    })
+
+
+class ProfilerModel(BaseModel):
+    enabled: bool = Field(..., description="Turn the slow request profiler on or off")
+    slow_ms: Optional[float] = Field(default=None, gt=0, description="Requests slower than this get a profile written")
+    interval_ms: Optional[float] = Field(default=None, gt=0, description="Stack sampling interval")
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example" : {"enabled" : True, "slow_ms" : 250, "interval_ms" : 5}
+    })
@@ -0,0 +1,79 @@
+# Production launch: several uvicorn worker processes over one copy of the indexes.
+#   python -m api.serve --workers 4
+# The parent exports the vector matrix (+ chunk text/metadata) from Chroma if needed and pages every index file
+# into the OS page cache, the workers use the numpy backend and memory-map the vectors, the quantized codes,
+# the chunk store and the BM25 postings/corpus read only, so they all share one copy of them.
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse, json, time
+import uvicorn
+from api import config
+
+PAGE_IN_BLOCK = 16 * 1024 * 1024
+
+def numpy_index_current(index_path: str) -> bool:
+    """True if there is an export in the memory-mapped layout (chunk store and source partitions included) the workers can attach to."""
+    from vector_db.vector_backends import SIDECAR_FILE
+    try:
+        with open(os.path.join(index_path, SIDECAR_FILE), "r", encoding="utf-8") as sidecar:
+            info = json.load(sidecar)
+            return "count" in info and "sources" in info
+    except (OSError, ValueError):
+        return False
+
+def prepare_shared_indexes(quantization: str = None, refresh: bool = False) -> str:
+    """
+    Make sure the numpy export exists (and has the quantized codes the workers will search), exporting it from
+    the Chroma collection otherwise. This is the only place Chroma is opened in this mode. Returns the index path.
+    """
+    from vector_db.vector_backends import NUMPY_INDEX_PATH, export_numpy_index, exported_quantizations
+    quantizations = set(exported_quantizations(NUMPY_INDEX_PATH))
+    if quantization:
+        quantizations.add(quantization)
+
+    if refresh or not numpy_index_current(NUMPY_INDEX_PATH) or quantizations != set(exported_quantizations(NUMPY_INDEX_PATH)):
+        from chromadb import PersistentClient
+        from vector_db.retrieval_service import VECTOR_DB_PATH, COLLECTION_NAME
+        collection = PersistentClient(path=VECTOR_DB_PATH).get_collection(COLLECTION_NAME)
+        export_numpy_index(collection, NUMPY_INDEX_PATH, quantizations=sorted(quantizations))
+    return NUMPY_INDEX_PATH
+
+def page_in(paths) -> int:
+    """Read every file under `paths` once so it sits in the page cache before the workers map it, returns bytes read."""
+    total = 0
+    for path in paths:
+        for root, _, files in os.walk(path):
+            for name in files:
+                with open(os.path.join(root, name), "rb") as index_file:
+                    while block := index_file.read(PAGE_IN_BLOCK):
+                        total += len(block)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes sharing memory-mapped indexes")
+    parser.add_argument("--workers", type=int, default=config.QNA_WORKERS)
+    parser.add_argument("--host", default=config.QNA_HOST)
+    parser.add_argument("--port", type=int, default=config.QNA_PORT)
+    parser.add_argument("--refresh-index", action="store_true", help="re-export the numpy index from Chroma first")
+    parser.add_argument("--chroma", action="store_true",
+                        help="keep the Chroma backend (every worker then opens its own HNSW index)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    from hybrid_reranker.bm25_index import BM25_INDEX_PATH
+    shared_paths = [BM25_INDEX_PATH]
+    if not args.chroma:
+        shared_paths.append(prepare_shared_indexes(config.QNA_VECTOR_QUANTIZATION, args.refresh_index))
+        # read by api.config in every worker process (they are spawned and inherit the environment)
+        os.environ["QNA_VECTOR_BACKEND"] = "numpy"
+    paged_in = page_in(path for path in shared_paths if os.path.isdir(path))
+    print(f"Shared indexes ready in {time.perf_counter() - start:.2f}s ({paged_in / 2**20:.1f} MiB paged in), "
+          f"starting {args.workers} workers")
+
+    uvicorn.run("api.main:app", host=args.host, port=args.port, workers=args.workers, ws="none")
+
+if __name__ == "__main__":
+    main()
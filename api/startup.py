@@ -0,0 +1,54 @@
+import time
+from contextlib import contextmanager
+from utils.instrumentation import METRICS
+
+METRICS.describe("qna_startup_phase_seconds", "gauge", "Time spent in each startup phase")
+METRICS.describe("qna_ready", "gauge", "1 once the model and indexes are warm and requests are served")
+
+class StartupTracker:
+    """
+    Startup phases (name -> seconds) and readiness of the app. The port is bound before the heavy imports,
+    the model load and the index warm up run, /readyz reports from here until they are done.
+    """
+
+    def __init__(self, started: float = None):
+        # perf_counter at process start (e.g. taken before the app module's imports), defaults to now
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}
+        self.current_phase = None
+        self.ready = False
+        self.error = None
+        self.ready_after = None # seconds from process startup to ready
+        METRICS.set_gauge("qna_ready", 0)
+
+    @contextmanager
+    def phase(self, name: str):
+        self.current_phase = name
+        start = time.perf_counter()
+        yield
+        # a phase that raised stays the current one, so /readyz shows where warm up failed
+        self.record_phase(name, time.perf_counter() - start)
+        self.current_phase = None
+
+    def record_phase(self, name: str, elapsed: float):
+        self.phases[name] = elapsed
+        METRICS.set_gauge("qna_startup_phase_seconds", elapsed, phase=name)
+
+    def mark_ready(self):
+        self.ready_after = time.perf_counter() - self.started
+        self.ready = True
+        METRICS.set_gauge("qna_ready", 1)
+        print(f"Ready after {self.ready_after:.2f}s ({', '.join(f'{name} {elapsed:.2f}s' for name, elapsed in self.phases.items())})")
+
+    def mark_failed(self, error: Exception):
+        self.error = f"{type(error).__name__}: {error}"
+        print(f"Warm up failed during {self.current_phase or 'startup'}: {self.error}")
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "phase": self.current_phase,
+            "error": self.error,
+            "phases_seconds": dict(self.phases),
+            "ready_after_seconds": self.ready_after
+        }
@@ -0,0 +1,48 @@
+# Side by side of two benchmark.run result files
+#   python -m benchmark.compare before.json after.json
+
+import argparse, json
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as result_file:
+        return json.load(result_file)
+
+def metrics(result: dict) -> dict:
+    """Flat {metric: value} of one target / concurrency level."""
+    flat = {"qps": result["qps"]}
+    flat.update({f"{name} ms": value for name, value in result["latency_ms"].items() if name != "mean"})
+    for stage, latency in (result.get("stages_ms") or {}).items():
+        flat[f"{stage} p50 ms"] = latency["p50"]
+    for name, value in (result.get("quality") or {}).items():
+        if name != "queries":
+            flat[name] = value
+    return flat
+
+def change(before, after) -> str:
+    if before is None or after is None:
+        return ""
+    if before == 0:
+        return "" if after == 0 else "new"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    print(f"before: {before['meta'].get('git_commit')}  after: {after['meta'].get('git_commit')}")
+    for section in ("in_process", "http"):
+        for name in after[section]:
+            if name not in before[section]:
+                continue
+            print(f"\n[{section}] {name}")
+            old, new = metrics(before[section][name]), metrics(after[section][name])
+            for metric, value in new.items():
+                previous = old.get(metric)
+                print(f"  {metric:<24}{previous if previous is not None else float('nan'):>12.3f}"
+                      f"{value if value is not None else float('nan'):>12.3f}  {change(previous, value)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import asyncio, time
+import httpx
+import numpy as np
+
+async def run_level(url: str, concurrency: int, n_requests: int, mode: str, queries, k: int = 5, headers=None):
+    """
+    Fire n_requests at the /ask endpoint with `concurrency` requests in flight, cycling through the queries.
+    Returns latencies (ms), status codes, wall time (s) and the cited chunk ids of each query's first full
+    (not degraded by admission control) 200.
+    """
+    latencies, status_codes, rankings = [], [], {}
+    queue = asyncio.Queue()
+    for i in range(n_requests):
+        queue.put_nowait(queries[i % len(queries)])
+
+    async def worker(client):
+        while not queue.empty():
+            query = queue.get_nowait()
+            start = time.perf_counter()
+            resp = await client.post(url, json={"query": query, "k": k, "mode": mode}, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            status_codes.append(resp.status_code)
+            if resp.status_code == 200 and query not in rankings and "degradations" not in resp.json():
+                rankings[query] = [citation["chunk_id"] for citation in resp.json()["contexts"][0]]
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return np.array(latencies) * 1000, status_codes, elapsed, rankings
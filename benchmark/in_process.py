@@ -0,0 +1,65 @@
+import time
+from vector_db.baseline_search import filter_results_by_threshold, slice_query_result
+from hybrid_reranker.bm25_reranker import HYBRID_CANDIDATE_K, hybrid_reranking
+
+# what a replay can exercise in-process: the vector search alone, vector + BM25 fusion, or the whole /ask path
+TARGETS = ("cosine", "hybrid", "ask")
+
+def ranked_chunk_ids(results) -> list:
+    """Chunk ids in rank order from either result shape (chroma dict, or hybrid [(doc, meta, score)])."""
+    if isinstance(results, list):
+        return [meta.get("chunk_id") for _, meta, _ in results]
+    return [meta.get("chunk_id") for meta in results["metadatas"][0]]
+
+def run_query(target: str, query: str, service, k: int, mode: str = "baseline"):
+    """
+    One query through a target, timing each stage (embed, vector search, rerank/filter, format).
+    Returns (ranked chunk ids, {stage: ms}).
+    """
+    hybrid = target == "hybrid" or (target == "ask" and mode == "hybrid-bm25")
+    vector_k = HYBRID_CANDIDATE_K if hybrid else k
+    stages = {}
+
+    start = time.perf_counter()
+    embeddings = service.embed([query])
+    stages["embed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vector_results = slice_query_result(service.backend.query(embeddings, vector_k), 0, vector_k)
+    stages["vector_search"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if hybrid:
+        results = hybrid_reranking(query, k=k, service=service, vector_results=vector_results)
+        stages["rerank"] = time.perf_counter() - start
+    else:
+        results = filter_results_by_threshold(vector_results)
+        stages["filter"] = time.perf_counter() - start
+
+    if target == "ask":
+        # imported here so the cosine/hybrid replays don't need the API's dependencies
+        from api.main import build_response
+        start = time.perf_counter()
+        response = build_response(results, mode)
+        stages["format"] = time.perf_counter() - start
+        ranked = [citation["chunk_id"] for citation in response["contexts"][0]]
+    else:
+        ranked = ranked_chunk_ids(results)[:k]
+
+    return ranked, {stage: elapsed * 1000 for stage, elapsed in stages.items()}
+
+def replay(target: str, queries, service, k: int, mode: str = "baseline", repeat: int = 1):
+    """
+    Run every query `repeat` times, one after another. Returns per query latencies (ms), per query stage times,
+    the ranking of each query (from its first run) and the wall time in seconds.
+    """
+    latencies, stage_times, rankings = [], [], {}
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            ranked, stages = run_query(target, query, service, k, mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            stage_times.append(stages)
+            rankings.setdefault(query, ranked)
+    return latencies, stage_times, rankings, time.perf_counter() - wall_start
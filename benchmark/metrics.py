@@ -0,0 +1,43 @@
+import numpy as np
+
+def latency_summary(latencies_ms) -> dict:
+    """p50/p95/p99/mean of a list of latencies in ms."""
+    if not len(latencies_ms):
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(latencies_ms))}
+
+def stage_summary(stage_times) -> dict:
+    """Latency summary per stage from a list of {stage: ms} dicts (one per query)."""
+    stages = {}
+    for times in stage_times:
+        for stage, elapsed in times.items():
+            stages.setdefault(stage, []).append(elapsed)
+    return {stage: latency_summary(times) for stage, times in stages.items()}
+
+def recall_at_k(reference, ranked, k: int) -> float:
+    """Share of the reference's top-k found in the ranked top-k (1.0 when the reference is empty, nothing to find)."""
+    expected = set(reference[:k])
+    if not expected:
+        return 1.0
+    return len(expected & set(ranked[:k])) / len(expected)
+
+def reciprocal_rank(reference, ranked) -> float:
+    """1 / rank of the reference's top hit in the ranked list, 0 if it's missing (1.0 for an empty reference)."""
+    if not reference:
+        return 1.0
+    try:
+        return 1.0 / (list(ranked).index(reference[0]) + 1)
+    except ValueError:
+        return 0.0
+
+def quality_summary(reference_rankings: dict, rankings: dict, k: int) -> dict:
+    """Mean recall@k and MRR over the queries the reference has a ranking for."""
+    queries = [query for query in rankings if query in reference_rankings]
+    if not queries:
+        return {"recall_at_k": None, "mrr": None, "queries": 0}
+    return {
+        "recall_at_k": float(np.mean([recall_at_k(reference_rankings[q], rankings[q], k) for q in queries])),
+        "mrr": float(np.mean([reciprocal_rank(reference_rankings[q], rankings[q]) for q in queries])),
+        "queries": len(queries)
+    }
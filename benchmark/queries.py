@@ -0,0 +1,43 @@
+import random
+from chunk_db.schema import DB_PATH
+from utils.common_utils import get_conn_and_cursor
+
+# the questions of 8_Question_Batch.txt
+QUESTIONS = [
+    "What is OSHA?",
+    "What are the main safety regulations?",
+    "Define workplace ergonomics",
+    "What is machinery safety?",
+    "What is the role of PPE?",
+    "What are some U.S. regulatory requirements for machine guarding?",
+    "What are common hazards of wood dust?",
+    "Who enforces safety laws in Ontario?"
+]
+
+def synthetic_queries(n: int, seed: int = 42, db_path: str = DB_PATH, min_words: int = 4, max_words: int = 10):
+    """
+    `n` reproducible queries cut out of random chunks (a few consecutive words each), so they look like what
+    users ask about this corpus and always have an answer in it. Same seed + same Chunk DB = same queries.
+    """
+    if n <= 0:
+        return []
+    conn, cur = get_conn_and_cursor(db_path)
+    try:
+        chunks = [row[0] for row in cur.execute("SELECT chunk FROM document_chunks ORDER BY chunk_id;")]
+    finally:
+        conn.close()
+
+    rng = random.Random(seed)
+    queries = []
+    for chunk in rng.sample(chunks, min(n, len(chunks))):
+        words = chunk.split()
+        n_words = rng.randint(min_words, max_words)
+        start = rng.randint(0, max(0, len(words) - n_words))
+        query = " ".join(words[start:start + n_words])
+        if query:
+            queries.append(query)
+    return queries
+
+def load_query_set(n_synthetic: int = 0, seed: int = 42):
+    """The 8 questions followed by `n_synthetic` synthetic ones."""
+    return QUESTIONS + synthetic_queries(n_synthetic, seed)
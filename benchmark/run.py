@@ -0,0 +1,126 @@
+# Retrieval benchmark: replays the 8 questions (+ synthetic queries) in-process and/or over HTTP, reports latency,
+# QPS, per stage time and recall@k/MRR against a stored reference ranking, and writes it all as JSON.
+#   python -m benchmark.run --synthetic 200 --write-reference           # record the reference rankings once
+#   python -m benchmark.run --synthetic 200 --output after.json         # later runs are scored against them
+#   python -m benchmark.run --targets ask --http-url http://localhost:8000/ask --concurrency 1 8 32
+#   python -m benchmark.compare before.json after.json
+
+import argparse, asyncio, json, os, platform, subprocess, time
+from benchmark.queries import load_query_set
+from benchmark.metrics import latency_summary, stage_summary, quality_summary
+from benchmark.in_process import TARGETS, replay
+from utils.common_utils import read_corpus_version
+
+REFERENCE_PATH = "benchmark/reference_rankings.json"
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_reference(path: str) -> dict:
+    """{target: {query: [chunk ids]}} recorded by --write-reference, empty if there is none yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as reference_file:
+        return json.load(reference_file)["rankings"]
+
+def save_reference(path: str, rankings: dict, k: int):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as reference_file:
+        json.dump({"k": k, "corpus_version": read_corpus_version(), "created_at": time.time(), "rankings": rankings}, reference_file, indent=1)
+    print(f"Saved reference rankings for {', '.join(rankings)} at {path}")
+
+def result_name(target: str, mode: str) -> str:
+    """/ask results (and reference rankings) are kept per mode, the other targets don't have one."""
+    return f"ask-{mode}" if target == "ask" else target
+
+def print_row(name: str, result: dict):
+    latency, quality = result["latency_ms"], result.get("quality") or {}
+    recall, mrr = quality.get("recall_at_k"), quality.get("mrr")
+    print(f"{name:<18}{result['qps']:>8.1f}{latency['p50']:>9.2f}{latency['p95']:>9.2f}{latency['p99']:>9.2f}"
+          f"{recall if recall is not None else float('nan'):>10.3f}{mrr if mrr is not None else float('nan'):>8.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, throughput and recall benchmark for retrieval")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--mode", default="baseline", choices=["baseline", "hybrid-bm25"], help="/ask mode (in-process and HTTP)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, default=0, help="synthetic queries added to the 8 questions")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="in-process passes over the queries")
+    parser.add_argument("--http-url", default=None, help="also load test a running server, e.g. http://localhost:8000/ask")
+    parser.add_argument("--http-only", action="store_true", help="skip the in-process replays")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--reference", default=REFERENCE_PATH)
+    parser.add_argument("--write-reference", action="store_true", help="store this run's rankings as the reference")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+    if args.http_only and not args.http_url:
+        parser.error("--http-only needs --http-url")
+
+    queries = load_query_set(args.synthetic, args.seed)
+    reference = {} if args.write_reference else load_reference(args.reference)
+    report = {
+        "meta": {
+            "timestamp": time.time(), "git_commit": git_commit(), "corpus_version": read_corpus_version(),
+            "python": platform.python_version(), "cpus": os.cpu_count(), "queries": len(queries),
+            "k": args.k, "mode": args.mode, "vector_backend": os.getenv("QNA_VECTOR_BACKEND", "chroma"),
+            "quantization": os.getenv("QNA_VECTOR_QUANTIZATION")
+        },
+        "in_process": {},
+        "http": {}
+    }
+    rankings = {}
+
+    print(f"{len(queries)} queries, k={args.k}, reference: {'none (recording)' if args.write_reference else args.reference}")
+    print(f"{'target':<18}{'qps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'recall@k':>10}{'mrr':>8}")
+
+    # --http-only benchmarks the server without loading the model/indexes in this process too
+    in_process_targets = [] if args.http_only else args.targets
+    if in_process_targets:
+        from vector_db.retrieval_service import get_retrieval_service
+        service = get_retrieval_service()
+        for target in in_process_targets:
+            name = result_name(target, args.mode)
+            # one untimed pass so model/index warm up doesn't land in the numbers
+            replay(target, queries[:1], service, args.k, args.mode)
+            latencies, stage_times, target_rankings, elapsed = replay(target, queries, service, args.k, args.mode, args.repeat)
+            rankings[name] = target_rankings
+            result = {
+                "qps": len(latencies) / elapsed,
+                "latency_ms": latency_summary(latencies),
+                "stages_ms": stage_summary(stage_times),
+                "quality": quality_summary(reference[name], target_rankings, args.k) if name in reference else None
+            }
+            report["in_process"][name] = result
+            print_row(name, result)
+
+    if args.http_url:
+        from benchmark.http_load import run_level
+        ask_name = result_name("ask", args.mode)
+        for concurrency in args.concurrency:
+            latencies, status_codes, elapsed, http_rankings = asyncio.run(
+                run_level(args.http_url, concurrency, args.requests, args.mode, queries, args.k)
+            )
+            result = {
+                "concurrency": concurrency,
+                "qps": len(latencies) / elapsed,
+                "latency_ms": latency_summary(latencies),
+                "status_codes": {str(code): status_codes.count(code) for code in sorted(set(status_codes))},
+                # /ask responses cite their top chunks, so this is scored against the in-process ask reference
+                "quality": quality_summary(reference[ask_name], http_rankings, args.k) if ask_name in reference else None
+            }
+            report["http"][str(concurrency)] = result
+            print_row(f"http c={concurrency}", result)
+
+    if args.write_reference:
+        save_reference(args.reference, rankings, args.k)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=1)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
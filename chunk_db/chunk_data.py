@@ -1,33 +1,46 @@
 import pymupdf as pdf
+import numpy as np
 import re
-from typing import List
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List
 
-def load_data(document):
+def iter_pages(document):
     """
-    Load PDF using layout-aware extraction and clean OCR artifacts.
-    Returns clean, well-structured text ready for chunking.
+    Yield the layout-aware text of each PDF page (blocks in reading order), one page at a time.
+    Only the current page is held in memory.
     """
-    full_text = ""
+    doc = pdf.open(document)
     try:
-        doc = pdf.open(document)
         for page in doc:
             # Use blocks for better paragraph structure
             blocks = page.get_text("blocks")
-            page_text = ""
-            
+
             # Sort blocks by reading order (top to bottom, left to right)
             blocks = sorted(blocks, key=lambda b: (b[1], b[0]))  # y, then x coordinate
-            
+
+            block_texts = []
             for block in blocks:
                 if len(block) >= 5:  # Valid text block
                     block_text = block[4].strip()  # Text content is at index 4
                     if block_text:
-                        page_text += block_text + "\n\n"
-            
+                        block_texts.append(block_text + "\n\n")
+
+            page_text = "".join(block_texts)
             if page_text.strip():
-                full_text += page_text
-                
+                yield page_text
+    finally:
         doc.close()
+
+
+def load_data(document):
+    """
+    Load PDF using layout-aware extraction and clean OCR artifacts.
+    Returns clean, well-structured text ready for chunking.
+    """
+    full_text = ""
+    try:
+        # join once instead of growing one string page by page (that's quadratic on big manuals)
+        full_text = "".join(iter_pages(document))
         
         # Clean the extracted text
         full_text = clean_ocr_text(full_text)
@@ -38,62 +51,173 @@ def load_data(document):
     return full_text.strip()
 
 
+def iter_clean_text(pages, max_carry: int = None):
+    """
+    Clean a stream of page texts with `clean_ocr_text` without ever holding the whole document, the joined
+    output is the same as cleaning the joined pages. Text is only cut at a block boundary no cleaning rule
+    reaches across (see `_safe_cut`), everything after the last such boundary is carried over to the next
+    page. Cleaned segments are joined with a newline, like cleaned lines are.
+    Text without such boundaries (tables, headings, no sentence ends) is cut at its last blank line anyway once
+    the carry outgrows `max_carry` characters (MAX_CARRY by default): memory stays flat, and the lines the
+    cleaning would have joined across that cut end up on two lines instead.
+    """
+    max_carry = MAX_CARRY if max_carry is None else max_carry
+    carry = ""
+    first = True
+    for page_text in pages:
+        text = carry + page_text
+        # boundaries inside the old carry were already turned down, only the ones the new page completes can qualify
+        cut = _safe_cut(text, max(len(carry) - 3, 0))
+        if cut == -1 and len(text) > max_carry:
+            cut = _forced_cut(text)
+        if cut == -1:
+            carry = text
+            continue
+        carry = text[cut:]
+        segment = clean_ocr_text(text[:cut])
+        if segment:
+            yield segment if first else "\n" + segment
+            first = False
+
+    segment = clean_ocr_text(carry)
+    if segment:
+        yield segment if first else "\n" + segment
+
+
+# punctuation a block has to end with for the text to be cut after it: no hyphen/broken line repair joins
+# across a sentence end, and the blank line behind it is dropped whichever half it's cleaned in
+SENTENCE_END = ".!?"
+# shorter last lines could be OCR junk, a "12." line is a list number that step 8 merges with the next line
+MIN_CUT_LINE = 6
+LIST_NUMBER_LINE = re.compile(r'\s*\d+\.')
+# characters iter_clean_text carries at most before it cuts at a boundary a cleaning rule may reach across
+MAX_CARRY = 200_000
+
+
+def _safe_cut(text: str, scan_from: int = 0) -> int:
+    """
+    Offset just after the last block boundary (before the last block, starting at or after `scan_from`) that no
+    cleaning rule reaches across: the block before it ends its last line (of at least MIN_CUT_LINE characters,
+    not a list number) with sentence punctuation and the block after it starts with text. -1 if there is none yet.
+    """
+    # the last block stays in the carry, it may continue on the next page
+    cut = text.rfind("\n\n", scan_from, len(text) - 2)
+    while cut > 0:
+        line_start = text.rfind("\n", 0, cut) + 1
+        # as step 5 will see them, zero width characters become spaces
+        line, following = text[line_start:cut].translate(UNICODE_FIXES), text[cut + 2].translate(UNICODE_FIXES)
+        if (len(line) >= MIN_CUT_LINE and line[-1] in SENTENCE_END and not following.isspace()
+                and not LIST_NUMBER_LINE.fullmatch(line)):
+            return cut + 2
+        cut = text.rfind("\n\n", scan_from, cut)
+    return -1
+
+
+def _forced_cut(text: str) -> int:
+    """Offset just after the last blank line before the last block, followed by text. -1 if there is none."""
+    cut = text.rfind("\n\n", 0, len(text) - 2)
+    while cut > 0 and text[cut + 2].isspace():
+        cut = text.rfind("\n\n", 0, cut)
+    return cut + 2 if cut > 0 else -1
+
+
+# OCR cleaning rules, compiled once. Rules that can't change each other's matches share a pass,
+# the rest keep their original order since each one has to see the previous one's output.
+
+# Step 1: Fix hyphenated line breaks / single char cutoffs
+HYPHEN_BREAK = re.compile(r'-\s*\n\s*')
+SINGLE_CHAR_CUTOFF = re.compile(r'\b([a-zA-Z])\s*\n')
+# Step 2: table of contents lines (dots + page numbers)
+TOC_LINE = re.compile(r'^.*\.{3,}.*?\d+\s*$', re.MULTILINE)
+# Step 3: standalone page numbers and section numbers
+PAGE_NUMBER_LINE = re.compile(r'^\s*\d+\s*$', re.MULTILINE)
+SECTION_NUMBER_LINE = re.compile(r'^\s*\d+\.\d+\s*$', re.MULTILINE)
+# Step 4: broken lines
+BROKEN_LINE = re.compile(r'(?<![.!?:])\n(?!\s*[•\-\d])')
+# Step 5: OCR unicode artifacts, all single character swaps so one translate does them all
+UNICODE_FIXES = str.maketrans({
+    '\xa0': ' ',
+    **{chr(c): ' ' for c in range(0x2000, 0x2010)},
+    **{chr(c): '-' for c in range(0x2010, 0x2016)}
+})
+# Step 6: common OCR letter substitutions
+WORD_FIXES = {'ngerous': 'dangerous', 'o new': 'no new'}
+WORD_FIX = re.compile(r'\b(ngerous|o new)\b')
+# Step 7: scientific notation
+MULTIPLICATION_DOT = re.compile(r'(\d+)\s*·\s*(\d+)')
+NEGATIVE_EXPONENT = re.compile(r'(\d+)-(\d+)')
+# Step 8: bullets and numbered lists
+BULLET = re.compile(r'^\s*[•▪▫‣⁃]\s*', re.MULTILINE)
+DASH_BULLET = re.compile(r'^\s*[-]\s+', re.MULTILINE)
+NUMBERED_ITEM = re.compile(r'^\s*(\d+)\.\s+', re.MULTILINE)
+# Step 9: figure/table references
+FIGURE_TABLE_REF = re.compile(r'(Figure|Table)\s+(\d+)\.(\d+):')
+# Step 10: whitespace normalization, space and tab runs both become one space so they share a pass
+NEWLINE_RUN = re.compile(r'\n{3,}')
+SPACE_OR_TAB_RUN = re.compile(r' {2,}|\t+')
+# Step 11: short lines are OCR junk unless they carry one of these
+SHORT_LINE_MARKERS = ('figure', 'table', '•', 'pl ')
+
+
+def keep_line(line: str) -> bool:
+    """Step 11 filter, long lines always stay, short ones only with a figure/table/bullet marker."""
+    if len(line) > 5:
+        return True
+    line = line.lower()
+    return any(marker in line for marker in SHORT_LINE_MARKERS)
+
+
 def clean_ocr_text(text: str) -> str:
     """
     OCR cleaning for the PDF data.
     Handles common OCR artifacts, formatting issues, and technical document quirks.
+    Output is byte for byte the same as the original chain of re.sub calls (see debug/test_ocr_cleaning.py).
     """
     # Step 1: Fix hyphenated line breaks
-    text = re.sub(r'-\s*\n\s*', '', text)
+    text = HYPHEN_BREAK.sub('', text)
 
     # Fix single char cutoffs
-    text = re.sub(r'\b([a-zA-Z])\s*\n', r'\1', text)
+    text = SINGLE_CHAR_CUTOFF.sub(r'\1', text)
 
     # Step 2: Remove table of contents lines (dots + page numbers)
-    text = re.sub(r'^.*\.{3,}.*?\d+\s*$', '', text, flags=re.MULTILINE)
+    if '...' in text:
+        text = TOC_LINE.sub('', text)
 
     # Step 3: Remove standalone page numbers and section numbers
-    text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*\d+\.\d+\s*$', '', text, flags=re.MULTILINE)
+    text = PAGE_NUMBER_LINE.sub('', text)
+    text = SECTION_NUMBER_LINE.sub('', text)
 
     # Step 4: Fix broken lines
-    text = re.sub(r'(?<![.!?:])\n(?!\s*[•\-\d])', ' ', text)
+    text = BROKEN_LINE.sub(' ', text)
 
     # Step 5: Clean OCR artifacts
-    text = re.sub(r'\xa0', ' ', text)
-    text = re.sub(r'\u2003', ' ', text)
-    text = re.sub(r'[\u2000-\u200f]', ' ', text)
-    text = re.sub(r'[\u2010-\u2015]', '-', text)
+    text = text.translate(UNICODE_FIXES)
 
     # Step 6: Fix common OCR letter substitutions
-    text = re.sub(r'\bngerous\b', 'dangerous', text)
-    text = re.sub(r'\bo new\b', 'no new', text)
+    if 'ngerous' in text or 'o new' in text:
+        text = WORD_FIX.sub(lambda m: WORD_FIXES[m.group(1)], text)
 
     # Step 7: Clean up scientific notation
-    text = re.sub(r'(\d+)\s*·\s*(\d+)', r'\1 × \2', text)
-    text = re.sub(r'(\d+)-(\d+)', r'\1^-\2', text)
+    if '·' in text:
+        text = MULTIPLICATION_DOT.sub(r'\1 × \2', text)
+    text = NEGATIVE_EXPONENT.sub(r'\1^-\2', text)
 
     # Step 8: Normalize bullets and numbered lists
-    text = re.sub(r'^\s*[•▪▫‣⁃]\s*', '• ', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*[-]\s+', '• ', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*(\d+)\.\s+', r'\1. ', text, flags=re.MULTILINE)
+    text = BULLET.sub('• ', text)
+    text = DASH_BULLET.sub('• ', text)
+    text = NUMBERED_ITEM.sub(r'\1. ', text)
 
     # Step 9: Fix figure/table references
-    text = re.sub(r'Figure\s+(\d+)\.(\d+):', r'Figure \1.\2:', text)
-    text = re.sub(r'Table\s+(\d+)\.(\d+):', r'Table \1.\2:', text)
+    if 'Figure' in text or 'Table' in text:
+        text = FIGURE_TABLE_REF.sub(r'\1 \2.\3:', text)
 
     # Step 10: Whitespace normalization
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
-    text = re.sub(r'\t+', ' ', text)
+    if '\n\n\n' in text:
+        text = NEWLINE_RUN.sub('\n\n', text)
+    text = SPACE_OR_TAB_RUN.sub(' ', text)
 
     # Step 11: Remove short OCR junk lines
-    lines = []
-    for line in text.split('\n'):
-        line = line.strip()
-        if len(line) > 5 or any(marker in line.lower() for marker in ['figure', 'table', '•', 'pl ']):
-            lines.append(line)
-    text = '\n'.join(lines)
+    text = '\n'.join(line for line in map(str.strip, text.split('\n')) if keep_line(line))
 
     return text.strip()    
 
@@ -112,52 +236,162 @@ def chunk_data(text, chunk_size: int = 400, chunk_overlap: int = 100, separators
     """
     if not text or len(text) <= chunk_size:
         return [text.strip()] if text.strip() else []
-    
+
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, chunk_overlap, separators)]
+
+
+def chunk_spans(text, chunk_size: int = 400, chunk_overlap: int = 100, separators: List[str] = None):
+    """
+    Same split as `chunk_data` but as (start, end) offsets into `text`, text[start:end] is the chunk.
+    No chunk string is built, callers slice the ones they keep.
+    """
+    # the whole text is already in memory, so the buffer is never rebased and offsets are into `text` as is
+    return [(start, end) for _, _, start, end in _split_spans([text], chunk_size, chunk_overlap, separators, rebase=False)]
+
+
+def iter_chunks(text_pieces: Iterable[str], chunk_size: int = 400, chunk_overlap: int = 100, separators: List[str] = None):
+    """
+    Streaming version of `chunk_data`: takes the text as an iterable of pieces (e.g. cleaned pages) and yields
+    (start, end, chunk) as soon as a chunk is final, the offsets are into the joined text.
+    Each window only looks at text[start:start + chunk_size], so we read just enough pieces to fill the next
+    window and drop text behind it, the output is the same as chunking the joined text.
+    """
+    for buffer, dropped, start, end in _split_spans(text_pieces, chunk_size, chunk_overlap, separators):
+        yield dropped + start, dropped + end, buffer[start:end]
+
+
+class SeparatorIndex:
+    """
+    Sorted start offsets of every occurrence of each separator in a (growing) text, found with one vectorized
+    scan per separator, so the chunker picks each break point with a binary search instead of rescanning
+    the window with str.rfind once per separator.
+    """
+
+    def __init__(self, separators: List[str]):
+        self.separators = separators
+        self._lengths = [len(separator) for separator in separators]
+        self._codes = [np.array([ord(char) for char in separator], dtype=np.uint32) for separator in separators]
+        self.positions = [[] for _ in separators]
+        self.indexed = 0 # offset up to which the text has been scanned
+
+    def extend(self, text: str, offset: int = 0):
+        """Index the occurrences ending in text appended since the last call, `text` starts at `offset`."""
+        # an occurrence can straddle the old end of the text
+        longest = max((len(separator) for separator in self.separators), default=1)
+        scan_from = max(0, self.indexed - offset - longest + 1)
+        # one code point per element, so a separator is a run of equal elements
+        codes = np.frombuffer(text[scan_from:].encode("utf-32-le"), dtype=np.uint32)
+
+        for separator, separator_codes, positions in zip(self.separators, self._codes, self.positions):
+            n_starts = len(codes) - len(separator) + 1
+            if not separator or n_starts <= 0:
+                continue
+            # every start, overlapping ones included ("\n\n" twice in "\n\n\n"), like rfind sees them
+            match = codes[:n_starts] == separator_codes[0]
+            for j in range(1, len(separator)):
+                match &= codes[j:j + n_starts] == separator_codes[j]
+            found = np.flatnonzero(match) + (scan_from + offset)
+            # skip the ones found by the previous call
+            first_new = self.indexed - len(separator) + 1
+            positions.extend(found[np.searchsorted(found, first_new):].tolist())
+        self.indexed = offset + len(text)
+
+    def discard_before(self, offset: int):
+        """Forget occurrences before offset (text the chunker won't look at again)."""
+        for positions in self.positions:
+            del positions[:bisect_left(positions, offset)]
+
+    def split_point(self, start: int, end: int) -> int:
+        """
+        End offset of the last occurrence, inside text[start:end] and not at `start`, of the first separator
+        (in priority order) that has one. Falls back to `end`.
+        """
+        for positions, length in zip(self.positions, self._lengths):
+            if not length:
+                return end # rfind finds "" at the very end
+            j = bisect_right(positions, end - length) - 1
+            if j >= 0 and positions[j] > start:
+                return positions[j] + length
+        return end
+
+
+def _strip_span(text: str, start: int, end: int):
+    """Offsets of text[start:end].strip() without building the string."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split_spans(text_pieces: Iterable[str], chunk_size: int, chunk_overlap: int, separators: List[str], rebase: bool = True):
+    """
+    The chunking loop shared by `chunk_spans` and `iter_chunks`. Yields (buffer, dropped, start, end):
+    the chunk is buffer[start:end] and `dropped` characters were already cut from the front of the buffer
+    (only with rebase=True). Separator offsets are kept relative to the whole text, only the buffer is rebased.
+    """
     # Default separators prioritize sentence boundaries
     if separators is None:
         separators = [". ", "! ", "? ", "• ", "\n\n", "\n", "; ", ", "]
-    
-    chunks = []
+
+    # Only add chunks that are substantial (avoid tiny fragments)
+    min_chunk_size = max(50, chunk_size // 8)  # At least 50 chars or 1/8 of target size
+
+    index = SeparatorIndex(separators)
+    pieces = iter(text_pieces)
+    exhausted = False
+    text = ""
+    dropped = 0 # characters already dropped from the front of text
     start = 0
-    text_len = len(text)
     last_end = 0
     
-    while start < text_len:
+    while True:
+        # read until the next window fits in the buffer (or there is nothing left to read)
+        if not exhausted and start + chunk_size >= len(text):
+            new_pieces = []
+            text_len = len(text)
+            while start + chunk_size >= text_len:
+                piece = next(pieces, None)
+                if piece is None:
+                    exhausted = True
+                    break
+                new_pieces.append(piece)
+                text_len += len(piece)
+            if new_pieces:
+                text += "".join(new_pieces)
+                index.extend(text, dropped)
+
+        # whole document fits in one chunk
+        if exhausted and dropped == 0 and start == 0 and len(text) <= chunk_size:
+            chunk_start, chunk_end = _strip_span(text, 0, len(text))
+            if chunk_end > chunk_start:
+                yield text, dropped, chunk_start, chunk_end
+            return
+
+        text_len = len(text)
+        if start >= text_len:
+            return
+
         # Calculate end position
         end = min(start + chunk_size, text_len)
         
         # If we're at the end, just take what's left
         if end == text_len:
-            chunk = text[start:end].strip()
-            if chunk and len(chunk) > 10:
-                chunks.append(chunk)
-            break
-        
-        # Try to find the BEST break point using separators
-        best_split = end  # Default to hard cut
-        best_separator_priority = len(separators)  # Lower is better
+            chunk_start, chunk_end = _strip_span(text, start, end)
+            if chunk_end - chunk_start > 10:
+                yield text, dropped, chunk_start, chunk_end
+            return
         
-        for i, separator in enumerate(separators):
-            split_pos = text.rfind(separator, start, end)
-            if split_pos > start:
-                # Prefer splits closer to our target size, but respect separator priority
-                distance_from_target = abs((split_pos + len(separator)) - end)
-                
-                # Only consider this split if:
-                # 1. It's a higher priority separator, OR
-                # 2. It's the same priority but closer to target size
-                if (i < best_separator_priority or 
-                    (i == best_separator_priority and distance_from_target < abs(best_split - end))):
-                    best_split = split_pos + len(separator)
-                    best_separator_priority = i
+        # Break after the highest priority separator found in the window (past its start), else hard cut.
+        # A lower priority separator never beats a higher priority one, however close it is to the target size,
+        # so the first separator that has an occurrence decides
+        best_split = index.split_point(start + dropped, end + dropped) - dropped
         
         # Extract chunk
-        chunk = text[start:best_split].strip()
+        chunk_start, chunk_end = _strip_span(text, start, best_split)
         
-        # Only add chunks that are substantial (avoid tiny fragments)
-        min_chunk_size = max(50, chunk_size // 8)  # At least 50 chars or 1/8 of target size
-        if chunk and len(chunk) >= min_chunk_size:
-            chunks.append(chunk)
+        if chunk_end - chunk_start >= min_chunk_size:
+            yield text, dropped, chunk_start, chunk_end
         
         # Calculate next start position with overlap
         if chunk_overlap > 0 and best_split > start + chunk_overlap:
@@ -170,7 +404,11 @@ def chunk_data(text, chunk_size: int = 400, chunk_overlap: int = 100, separators
             start = last_end + 1
         
         last_end = best_split
-    
-    return chunks
-
 
+        # nothing before start is looked at again, keep the buffer small while more pieces are coming
+        if rebase and not exhausted and start > 4 * chunk_size:
+            text = text[start:]
+            dropped += start
+            index.discard_before(dropped)
+            last_end -= start
+            start = 0
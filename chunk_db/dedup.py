@@ -0,0 +1,168 @@
+import argparse, re, sqlite3, zlib
+import numpy as np
+from chunk_db.schema import DB_PATH, create_schema
+
+# Near duplicate chunk collapse. Manuals quote the same regulations, so the Chunk DB holds many chunks that are
+# (almost) the same passage. Every chunk gets a MinHash signature of its word shingles (cached in the Chunk DB,
+# chunk text never changes for a row), LSH banding puts chunks that agree on a whole band of the signature in the
+# same bucket, and a bucket's members are checked against the bucket's first (lowest chunk_id) chunk only, so the
+# whole pass stays roughly linear in the number of chunks.
+# Every cluster keeps its lowest chunk_id as the canonical chunk, the others point to it (`duplicate_of`) and stay
+# in the Chunk DB (for context windows) but are left out of Chroma / BM25, the canonical chunk's metadata lists the
+# other sources its text appears in (`alt_sources`) for citations and source scoped search.
+
+SHINGLE_SIZE = 3      # words per shingle, short enough that one changed (OCR) word only breaks a few
+NUM_PERM = 128        # signature length
+BANDS = 32            # LSH bands of NUM_PERM // BANDS rows, candidates from ~0.4 estimated Jaccard on
+DEDUP_THRESHOLD = 0.8 # estimated Jaccard similarity of the shingle sets at which two chunks are collapsed
+MINHASH_SEED = 42
+MAX_HASH = np.uint64(4294967291) # largest prime below 2**32, signatures fit in uint32
+
+_rng = np.random.default_rng(MINHASH_SEED)
+# (a * x + b) mod MAX_HASH for 32 bit x, a and b below 2**32 keep it inside uint64
+_PERM_A = _rng.integers(1, int(MAX_HASH), NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(MAX_HASH), NUM_PERM, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+
+def shingle_hashes(text: str):
+    """32 bit hashes of the text's lowercase word `SHINGLE_SIZE`-grams (one shingle for shorter texts)."""
+    tokens = np.array([zlib.crc32(token.encode("utf-8")) for token in _WORD.findall(text.lower())], dtype=np.uint64)
+    if len(tokens) == 0:
+        return tokens
+    size = min(SHINGLE_SIZE, len(tokens))
+    hashes = np.zeros(len(tokens) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        hashes = (hashes * np.uint64(1000003) + tokens[offset:offset + len(hashes)]) & np.uint64(0xFFFFFFFF)
+    return np.unique(hashes)
+
+def minhash_signature(text: str):
+    """NUM_PERM uint32 MinHash values of the text's shingles, None for a text without words."""
+    hashes = shingle_hashes(text)
+    if len(hashes) == 0:
+        return None
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % MAX_HASH).min(axis=1).astype(np.uint32)
+
+def near_duplicate_clusters(signatures, threshold: float = DEDUP_THRESHOLD, bands: int = BANDS):
+    """
+    Canonical row of every row of a (chunks x NUM_PERM) signature matrix: the lowest row of its near duplicate
+    cluster, itself for unique chunks. Rows whose signatures agree on at least `threshold` of their values
+    (the MinHash estimate of the Jaccard similarity) end up in one cluster.
+    """
+    n_rows = len(signatures)
+    parent = np.arange(n_rows)
+    if n_rows == 0:
+        return parent
+    band_rows = signatures.shape[1] // bands
+
+    def find(row):
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[:, band * band_rows:(band + 1) * band_rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * band_rows))).ravel()
+        # first row of every bucket (rows are in chunk_id order) and the bucket of every row
+        _, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+        firsts = first[bucket.ravel()]
+        members = np.flatnonzero(firsts != np.arange(n_rows))
+        if len(members) == 0:
+            continue
+        agreement = (signatures[members] == signatures[firsts[members]]).mean(axis=1)
+        similar = members[agreement >= threshold]
+        for member, first_row in zip(similar.tolist(), firsts[similar].tolist()):
+            member_root, first_root = find(member), find(first_row)
+            if member_root != first_root:
+                # the lower row stays the root, so every cluster's root is its lowest row
+                parent[max(member_root, first_root)] = min(member_root, first_root)
+
+    return np.array([find(row) for row in range(n_rows)])
+
+def compute_missing_signatures(connection, batch_size: int = 1000) -> int:
+    """MinHash every chunk that has no signature yet (new chunks), returns how many were computed."""
+    read_cursor, write_cursor = connection.cursor(), connection.cursor()
+    read_cursor.execute("SELECT chunk_id, chunk FROM document_chunks WHERE minhash IS NULL;")
+    computed = 0
+    while rows := read_cursor.fetchmany(batch_size):
+        updates = []
+        for chunk_id, chunk in rows:
+            signature = minhash_signature(chunk or "")
+            # chunks without words get an empty signature, they are never anyone's duplicate
+            updates.append((signature.tobytes() if signature is not None else b"", chunk_id))
+        write_cursor.executemany("UPDATE document_chunks SET minhash = ? WHERE chunk_id = ?", updates)
+        computed += len(updates)
+    return computed
+
+def dedup_chunks(connection, threshold: float = DEDUP_THRESHOLD) -> dict:
+    """
+    Recompute the near duplicate clusters of the whole Chunk DB and store them (`duplicate_of`, `alt_sources`).
+    Vectors of chunks that just became duplicates are queued for deletion (deleted_chunks), chunks that became
+    canonical again and canonical chunks whose alternate sources changed are marked for (re-)embedding.
+    Commits nothing, the caller does. Returns the report (chunk counts and whether any chunk changed state).
+    """
+    cursor = connection.cursor()
+    computed = compute_missing_signatures(connection)
+    rows = cursor.execute(
+        "SELECT chunk_id, chunk_src, minhash, duplicate_of, alt_sources FROM document_chunks ORDER BY chunk_id;"
+    ).fetchall()
+
+    valid = np.array([len(row[2]) == NUM_PERM * 4 for row in rows], dtype=bool)
+    valid_rows = np.flatnonzero(valid)
+    signatures = np.frombuffer(b"".join(rows[i][2] for i in valid_rows), dtype=np.uint32).reshape(len(valid_rows), NUM_PERM)
+    canonical = np.arange(len(rows))
+    canonical[valid_rows] = valid_rows[near_duplicate_clusters(signatures, threshold)]
+
+    alt_sources = {} # canonical row -> other sources of its cluster
+    for row, canonical_row in enumerate(canonical.tolist()):
+        if canonical_row != row and rows[row][1] != rows[canonical_row][1]:
+            alt_sources.setdefault(canonical_row, set()).add(rows[row][1])
+
+    updates, collapsed_vectors, restored = [], [], []
+    for row, (chunk_id, _, _, duplicate_of, stored_alt_sources) in enumerate(rows):
+        canonical_row = int(canonical[row])
+        new_duplicate_of = rows[canonical_row][0] if canonical_row != row else None
+        new_alt_sources = ",".join(sorted(alt_sources.get(row, ()))) or None
+        if new_duplicate_of == duplicate_of and new_alt_sources == stored_alt_sources:
+            continue
+        if new_duplicate_of is not None and duplicate_of is None:
+            collapsed_vectors.append(chunk_id) # its vector (if it was embedded) has to leave the index
+        if new_duplicate_of is None and duplicate_of is not None:
+            restored.append(chunk_id)
+        # anything that changed is (re-)embedded if it is canonical now, with its new alternate sources
+        updates.append((new_duplicate_of, new_alt_sources, chunk_id))
+
+    cursor.executemany(
+        "UPDATE document_chunks SET duplicate_of = ?, alt_sources = ?, embedded_hash = NULL WHERE chunk_id = ?", updates
+    )
+    cursor.executemany("INSERT OR IGNORE INTO deleted_chunks (chunk_id) VALUES (?)", [(chunk_id,) for chunk_id in collapsed_vectors])
+    cursor.executemany("DELETE FROM deleted_chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in restored])
+
+    n_collapsed = int(np.count_nonzero(canonical != np.arange(len(rows))))
+    report = {
+        "chunks": len(rows),
+        "indexed": len(rows) - n_collapsed,
+        "collapsed": n_collapsed,
+        "clusters": len(set(canonical[canonical != np.arange(len(rows))].tolist())),
+        "signatures_computed": computed,
+        "changed": len(updates) > 0
+    }
+    shrink = n_collapsed / len(rows) * 100 if rows else 0.0
+    print(f"Near duplicate collapse: {report['chunks']} chunks -> {report['indexed']} indexed "
+          f"({n_collapsed} duplicates of {report['clusters']} canonical chunks, index {shrink:.1f}% smaller)")
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collapse near duplicate chunks of the Chunk DB (MinHash + LSH)")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD,
+                        help=f"estimated Jaccard similarity of two chunks' word shingles to collapse them (default: {DEDUP_THRESHOLD})")
+    parser.add_argument("--recompute", action="store_true", help="recompute every MinHash signature (after changing the shingling)")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(DB_PATH)
+    create_schema(connection.cursor())
+    if args.recompute:
+        connection.execute("UPDATE document_chunks SET minhash = NULL;")
+    dedup_chunks(connection, threshold=args.threshold)
+    connection.commit()
+    connection.close()
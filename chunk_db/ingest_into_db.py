@@ -1,67 +1,307 @@
-import sqlite3, os
-from utils.common_utils import get_conn_and_cursor, load_data_source
+import argparse, sqlite3, os, time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from utils.common_utils import get_conn_and_cursor, load_data_source, write_corpus_version, hash_file, hash_text
 from tqdm import tqdm
-from chunk_db.chunk_data import load_data, chunk_data
+from chunk_db.chunk_data import load_data, chunk_spans, iter_pages, iter_clean_text, iter_chunks
+from chunk_db.schema import DB_PATH, create_schema
+from chunk_db.dedup import DEDUP_THRESHOLD, dedup_chunks
+from utils.retrieval_utils import build_snippet
 
 sources = load_data_source()
 
 
-DB_PATH = "chunk_db/document_chunks.db"
 DATA_PATH = "sourced_data"
+STREAM_BATCH_SIZE = 256
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", "•","• ", " - ", ", "]
+
+def configure_connection(connection):
+    """WAL + relaxed sync for the bulk writer, a crash mid-ingest just means re-running it."""
+    connection.execute("PRAGMA journal_mode=WAL;")
+    connection.execute("PRAGMA synchronous=NORMAL;")
+    connection.execute("PRAGMA temp_store=MEMORY;")
+    connection.execute("PRAGMA cache_size=-65536;") # 64MB page cache
 
 def create_table():
     """Create the Table/Schema to store chunks in SQLite"""
     try:
         connection, cursor = get_conn_and_cursor(DB_PATH)
-        cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS document_chunks (
-        chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        chunk_src TEXT,
-        chunk TEXT
-        );
-        """
-        )
+        create_schema(cursor)
 
         connection.commit()
         print(f"Table was created at {DB_PATH}")
     except Exception as e:
         print(f"There was an issue creating the SQLite database/table : {e}")
 
-def ingest_chunks():
-    """Load each PDF and chunk and ingest it into the created DB/Table."""
-    connection = sqlite3.connect(DB_PATH)
+def process_source(source):
+    """
+    Extract, clean and chunk one source PDF (and precompute each chunk's answer snippet and hash).
+    Runs in a worker process in parallel mode, so it only returns data and never touches the DB.
+    Returns (src_id, [(chunk, snippet, chunk_hash, chunk_start, chunk_end), ...]) or None if the file is missing/broken,
+    the offsets are into the cleaned document text.
+    """
+    src_id = source["id"]
+    file_path = os.path.join(DATA_PATH, f"{src_id}.pdf")
+
+    if not os.path.exists(file_path):
+        print(f"{src_id} data file is missing. Moving on..")
+        return None
+
+    print(f"Processing {file_path} for chunking and ingestion..")
+
+    try:
+        doc = load_data(file_path)
+        chunks = []
+        for start, end in chunk_spans(doc, separators=CHUNK_SEPARATORS):
+            chunk = doc[start:end]
+            # answer snippet (sentence split + first word spell fix) is done once here instead of per request
+            chunks.append((chunk, build_snippet(chunk), hash_text(chunk), start, end))
+        return src_id, chunks
+    except Exception as e:
+        print(f"Encountered an issue while ingesting {file_path} : {e}")
+        return None
+
+def source_chunk_ids(cursor, src_id: str):
+    return [row[0] for row in cursor.execute("SELECT chunk_id FROM document_chunks WHERE chunk_src = ?", (src_id,)).fetchall()]
+
+def delete_chunks(cursor, chunk_ids):
+    """Drop chunks from the Chunk DB and remember them so vector ingestion deletes their vectors too."""
+    rows = [(chunk_id,) for chunk_id in chunk_ids]
+    cursor.executemany("DELETE FROM document_chunks WHERE chunk_id = ?", rows)
+    cursor.executemany("INSERT OR IGNORE INTO deleted_chunks (chunk_id) VALUES (?)", rows)
+
+def insert_chunks(cursor, src_id: str, chunks):
+    cursor.executemany(
+        """
+        INSERT INTO document_chunks (chunk_src, chunk, snippet, chunk_hash, chunk_start, chunk_end) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [(src_id, *chunk) for chunk in chunks]
+    )
+
+def replace_source_chunks(cursor, src_id: str, chunks):
+    """
+    Diff a re-chunked source against what's stored by chunk hash: unchanged chunks keep their row
+    (and chunk_id, so their vectors stay valid) with its offsets moved to where it is now, vanished ones are deleted
+    and only new ones are inserted. Returns (inserted, deleted) counts.
+    """
+    stored = defaultdict(list) # chunk_hash -> chunk_ids, a chunk can repeat within a source
+    for chunk_id, chunk_hash in cursor.execute(
+        "SELECT chunk_id, chunk_hash FROM document_chunks WHERE chunk_src = ? ORDER BY chunk_id", (src_id,)
+    ).fetchall():
+        stored[chunk_hash].append(chunk_id)
+
+    new_chunks, moved_offsets = [], []
+    for chunk in chunks:
+        if stored.get(chunk[2]):
+            moved_offsets.append((chunk[3], chunk[4], stored[chunk[2]].pop(0)))
+        else:
+            new_chunks.append(chunk)
+    stale_ids = [chunk_id for chunk_ids in stored.values() for chunk_id in chunk_ids]
+
+    delete_chunks(cursor, stale_ids)
+    cursor.executemany("UPDATE document_chunks SET chunk_start = ?, chunk_end = ? WHERE chunk_id = ?", moved_offsets)
+    insert_chunks(cursor, src_id, new_chunks)
+    return len(new_chunks), len(stale_ids)
+
+def stream_source(source, connection, batch_size: int = STREAM_BATCH_SIZE, vector_store=None, embedding_function=None):
+    """
+    Page by page pipeline for one source: extract -> clean -> chunk -> store, chunks are written in batches
+    as soon as they are produced, so memory stays flat no matter how big the PDF is.
+    With a Chroma collection (and the embedding function to use) given, every batch is embedded and upserted
+    right after it's stored.
+    Returns the number of chunks stored.
+    """
+    src_id = source["id"]
+    file_path = os.path.join(DATA_PATH, f"{src_id}.pdf")
+    print(f"Streaming {file_path} for chunking and ingestion..")
+
     cursor = connection.cursor()
+    # the source is re-chunked from scratch, its old chunks (and vectors) go
+    stale_ids = source_chunk_ids(cursor, src_id)
+    delete_chunks(cursor, stale_ids)
+    if vector_store is not None and stale_ids:
+        vector_store.delete(ids=[str(chunk_id) for chunk_id in stale_ids])
+        cursor.executemany("DELETE FROM deleted_chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in stale_ids])
+
+    stored = 0
+    batch = []
+    chunks = iter_chunks(iter_clean_text(iter_pages(file_path)), separators=CHUNK_SEPARATORS)
+    for start, end, chunk in chunks:
+        batch.append((chunk, build_snippet(chunk), hash_text(chunk), start, end))
+        if len(batch) >= batch_size:
+            write_chunk_batch(connection, src_id, batch, vector_store, embedding_function)
+            stored += len(batch)
+            batch = []
+    if batch:
+        write_chunk_batch(connection, src_id, batch, vector_store, embedding_function)
+        stored += len(batch)
 
-    for source in tqdm(sources, desc="Loading documents from source.."):
-        src_id = source["id"]
-        file_path = os.path.join(DATA_PATH, f"{src_id}.pdf")
+    print(f"Stored {stored} chunks for {src_id}")
+    return stored
 
+def write_chunk_batch(connection, src_id: str, batch, vector_store=None, embedding_function=None):
+    """Store one batch of streamed chunks (and embed it into Chroma with embedding_function if a collection is given)."""
+    cursor = connection.cursor()
+    insert_chunks(cursor, src_id, batch)
+
+    if vector_store is not None:
+        from vector_db.ingest_chunks import chunk_metadata
+        rows = cursor.execute(
+            """
+            SELECT chunk_id, chunk_src, chunk, snippet, chunk_start, chunk_end, alt_sources FROM document_chunks
+            WHERE chunk_src = ? AND embedded_hash IS NOT chunk_hash AND duplicate_of IS NULL ORDER BY chunk_id
+            """,
+            (src_id,)
+        ).fetchall()
+        vector_store.upsert(
+            ids=[str(row[0]) for row in rows],
+            embeddings=embedding_function([row[2] for row in rows]),
+            documents=[row[2] for row in rows],
+            metadatas=[chunk_metadata(row) for row in rows]
+        )
+        cursor.executemany("UPDATE document_chunks SET embedded_hash = chunk_hash WHERE chunk_id = ?", [(row[0],) for row in rows])
+
+    connection.commit()
+
+def ingest_chunks(workers: int = 1, incremental: bool = False, stream: bool = False, embed: bool = False,
+                  dedup: bool = True, dedup_threshold: float = DEDUP_THRESHOLD):
+    """
+    Load each PDF and chunk and ingest it into the created DB/Table.
+    With workers > 1 a process pool extracts/cleans/chunks PDFs concurrently while this process is the single DB writer.
+    With incremental=True only sources whose file hash changed are re-extracted, and their chunks are diffed by
+    content hash instead of appended (see `replace_source_chunks`).
+    With stream=True each source goes through the page by page pipeline (`stream_source`) instead,
+    and embed=True also writes the vectors to Chroma as the chunks are stored, then rebuilds the BM25 index and
+    the numpy export like vector_db/ingest_chunks.py does.
+    With dedup=True near duplicate chunks are collapsed at the end (see chunk_db/dedup.py), only canonical chunks
+    get embedded (with embed=True the streamed vectors of chunks found to be duplicates are deleted before the
+    indexes are rebuilt, otherwise the next vector ingestion deletes them).
+    """
+    connection = sqlite3.connect(DB_PATH)
+    configure_connection(connection)
+    cursor = connection.cursor()
+
+    stored_file_hashes = dict(cursor.execute("SELECT src_id, file_hash FROM source_files;").fetchall())
+    file_hashes, to_process = {}, []
+    for source in sources:
+        file_path = os.path.join(DATA_PATH, f"{source['id']}.pdf")
         if not os.path.exists(file_path):
-            print(f"{src_id} data file is missing. Moving on..")
+            print(f"{source['id']} data file is missing. Moving on..")
             continue
+        file_hashes[source["id"]] = hash_file(file_path)
+        if incremental and stored_file_hashes.get(source["id"]) == file_hashes[source["id"]]:
+            continue # same PDF as last time
+        to_process.append(source)
+
+    if incremental:
+        print(f"{len(to_process)} new/changed sources, {len(file_hashes) - len(to_process)} unchanged")
+
+    changed = False
+    if stream:
+        vector_store, embedding_function = None, None
+        if embed:
+            from chromadb import PersistentClient
+            from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+            from vector_db.retrieval_service import VECTOR_DB_PATH, COLLECTION_NAME
+            vector_store = PersistentClient(path=VECTOR_DB_PATH).get_or_create_collection(COLLECTION_NAME)
+            # one model for the whole run, chroma's default embedding function would reload it for every batch
+            embedding_function = ONNXMiniLM_L6_V2()
+        for source in tqdm(to_process, desc="Streaming documents from source.."):
+            try:
+                stream_source(source, connection, vector_store=vector_store, embedding_function=embedding_function)
+                changed = True
+            except Exception as e:
+                # batches already written stay, the source hash isn't recorded so the next run redoes it
+                print(f"Encountered an issue while ingesting {source['id']} : {e}")
+                connection.rollback()
+                continue
+            connection.execute(
+                "INSERT OR REPLACE INTO source_files (src_id, file_hash, ingested_at) VALUES (?, ?, ?)",
+                (source["id"], file_hashes[source["id"]], time.time())
+            )
+            connection.commit()
+        to_process = [] # nothing left for the batch path below
 
-        print(f"Processing {file_path} for chunking and ingestion..")
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        # map keeps source order so chunk_ids come out the same as a sequential run
+        processed = pool.map(process_source, to_process)
+    else:
+        pool = None
+        processed = map(process_source, to_process)
 
-        try:
-            doc = load_data(file_path)
-            chunks = chunk_data(doc, separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", "•","• ", " - ", ", "])
+    try:
+        # one transaction for the whole run, each source is a single executemany
+        for result in tqdm(processed, total=len(to_process), desc="Loading documents from source.."):
+            if result is None:
+                continue
+            src_id, chunks = result
+            if incremental:
+                inserted, deleted = replace_source_chunks(cursor, src_id, chunks)
+                changed = changed or inserted > 0 or deleted > 0
+                print(f"{src_id}: {inserted} new/changed chunks stored, {deleted} stale chunks deleted")
+            else:
+                # a full re-run replaces the source's chunks instead of appending duplicates
+                delete_chunks(cursor, source_chunk_ids(cursor, src_id))
+                insert_chunks(cursor, src_id, chunks)
+                changed = True
+                print(f"Stored {len(chunks)} chunks for {src_id}")
+            cursor.execute(
+                "INSERT OR REPLACE INTO source_files (src_id, file_hash, ingested_at) VALUES (?, ?, ?)",
+                (src_id, file_hashes[src_id], time.time())
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if incremental:
+        # sources dropped from sources.json lose their chunks too
+        source_ids = {source["id"] for source in sources}
+        for src_id in set(stored_file_hashes) - source_ids:
+            stale_ids = source_chunk_ids(cursor, src_id)
+            delete_chunks(cursor, stale_ids)
+            changed = True
+            cursor.execute("DELETE FROM source_files WHERE src_id = ?", (src_id,))
+            print(f"{src_id} was removed from the sources, deleted its {len(stale_ids)} chunks")
 
-            for chunk in chunks:
-                cursor.execute(
-                    """
-                    INSERT INTO document_chunks (chunk_src, chunk) VALUES (?, ?)
-                    """,
-                    (src_id, chunk)
-                )
-            print(f"Stored {len(chunks)} chunks for {file_path}")
-        except Exception as e:
-            print(f"Encountered an issue while ingesting {file_path} : {e}")
+    if dedup:
+        changed = dedup_chunks(connection, threshold=dedup_threshold)["changed"] or changed
 
     connection.commit()
     connection.close()
+    if stream and embed and changed:
+        from vector_db.ingest_chunks import (
+            encode_and_add_to_chroma, iter_chunk_batches, load_deleted_chunk_ids, mark_chunks_embedded, rebuild_search_indexes
+        )
+        # dedup queued the vectors of collapsed chunks for deletion and the chunks whose alternate sources changed
+        # for re-embedding, catch chroma up like a vector ingestion run, then rebuild the indexes derived from it
+        deleted_ids = load_deleted_chunk_ids()
+        row_batches = iter_chunk_batches(pending_only=True)
+        written_ids, complete = encode_and_add_to_chroma(row_batches, deleted_ids, embedding_function=embedding_function)
+        row_batches.close()
+        mark_chunks_embedded(written_ids, deleted_ids if complete else ())
+        rebuild_search_indexes()
+    if changed:
+        write_corpus_version()
     print(f"All data was chunked and stored in {DB_PATH}")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Chunk the source PDFs into the Chunk DB")
+    parser.add_argument("--workers", type=int, default=1, help="processes extracting/chunking PDFs in parallel (default: 1, sequential)")
+    parser.add_argument("--incremental", action="store_true", help="only re-chunk new/changed PDFs and diff their chunks by content hash")
+    parser.add_argument("--stream", action="store_true", help="page by page pipeline writing chunks in batches, flat memory for huge PDFs")
+    parser.add_argument("--embed", action="store_true", help="with --stream, also embed each batch into ChromaDB as it's stored")
+    parser.add_argument("--no-dedup", action="store_true", help="keep near duplicate chunks instead of collapsing them")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help=f"estimated Jaccard similarity (word shingles) at which chunks are collapsed (default: {DEDUP_THRESHOLD})")
+    args = parser.parse_args()
+    if args.stream and args.workers > 1:
+        parser.error("--stream processes one PDF at a time, it can't be combined with --workers")
+    if args.embed and not args.stream:
+        parser.error("--embed only works with --stream")
+
     create_table()
-    ingest_chunks()
+    ingest_chunks(
+        workers=args.workers, incremental=args.incremental, stream=args.stream, embed=args.embed,
+        dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold
+    )
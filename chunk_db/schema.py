@@ -0,0 +1,59 @@
+# Chunk DB schema (and the lookups built on it), shared by chunk ingestion (chunk_db) and vector ingestion (vector_db)
+
+DB_PATH = "chunk_db/document_chunks.db"
+
+# columns added after the first release, older Chunk DBs get them on the next ingest
+ADDED_CHUNK_COLUMNS = {
+    "snippet": "TEXT",       # precomputed answer snippet
+    "chunk_hash": "TEXT",    # content hash of the chunk text
+    "embedded_hash": "TEXT", # chunk_hash at the time the chunk was last embedded into Chroma
+    "chunk_start": "INTEGER", # chunk's [start, end) offsets in the cleaned text of its source
+    "chunk_end": "INTEGER",
+    "minhash": "BLOB",          # MinHash signature of the chunk's word shingles (chunk_db/dedup.py)
+    "duplicate_of": "INTEGER",  # canonical chunk_id if this chunk is a near duplicate, only canonical chunks are indexed
+    "alt_sources": "TEXT"       # on canonical chunks: other sources (comma separated ids) of its near duplicates
+}
+
+def create_schema(cursor):
+    """Create (or upgrade) the chunk, source file and deleted chunk tables."""
+    cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS document_chunks (
+    chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_src TEXT,
+    chunk TEXT,
+    snippet TEXT,
+    chunk_hash TEXT,
+    embedded_hash TEXT,
+    chunk_start INTEGER,
+    chunk_end INTEGER,
+    minhash BLOB,
+    duplicate_of INTEGER,
+    alt_sources TEXT
+    );
+    """
+    )
+    columns = [col[1] for col in cursor.execute("PRAGMA table_info(document_chunks);")]
+    for column, column_type in ADDED_CHUNK_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE document_chunks ADD COLUMN {column} {column_type};")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_document_chunks_src ON document_chunks (chunk_src);")
+
+    # content hash of every ingested source PDF, unchanged PDFs are skipped on incremental runs
+    cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS source_files (
+    src_id TEXT PRIMARY KEY,
+    file_hash TEXT,
+    ingested_at REAL
+    );
+    """
+    )
+    # chunks removed from the Chunk DB whose vectors still have to be deleted from Chroma
+    cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS deleted_chunks (
+    chunk_id INTEGER PRIMARY KEY
+    );
+    """
+    )
@@ -0,0 +1,41 @@
+# Microbenchmark: compiled OCR cleaning engine vs the original re.sub chain, on the real source PDFs
+#   python -m debug.bench_ocr_cleaning [--repeat 5]
+
+import argparse, os, time
+from chunk_db.chunk_data import clean_ocr_text, iter_pages
+from debug.test_ocr_cleaning import reference_clean_ocr_text, DATA_PATH
+
+def best_time(func, text: str, repeat: int) -> float:
+    """Best of `repeat` runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench_cleaning(repeat: int = 5):
+    if not os.path.isdir(DATA_PATH):
+        print(f"No PDFs found in {DATA_PATH}, download them first (utils/download_source_data.py)")
+        return
+
+    print(f"{'file':<12} {'chars':>10} {'original ms':>12} {'engine ms':>10} {'speedup':>8}")
+    total_original = total_engine = 0.0
+    for file_name in sorted(os.listdir(DATA_PATH)):
+        if not file_name.endswith(".pdf"):
+            continue
+        text = "".join(iter_pages(os.path.join(DATA_PATH, file_name)))
+        original = best_time(reference_clean_ocr_text, text, repeat)
+        engine = best_time(clean_ocr_text, text, repeat)
+        total_original += original
+        total_engine += engine
+        print(f"{file_name:<12} {len(text):>10} {original * 1000:>12.1f} {engine * 1000:>10.1f} {original / engine:>7.2f}x")
+
+    if total_engine:
+        print(f"{'total':<12} {'':>10} {total_original * 1000:>12.1f} {total_engine * 1000:>10.1f} {total_original / total_engine:>7.2f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark clean_ocr_text against the original implementation")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    bench_cleaning(args.repeat)
@@ -0,0 +1,70 @@
+# Memory, latency and recall@k of the numpy vector backend (float32 / int8 / binary) against Chroma's results.
+# Needs the numpy export with quantized codes :
+#   python -m vector_db.ingest_chunks --numpy-index --quantize int8 binary
+#   python -m debug.bench_quantized_search --k 5 --repeat 20
+
+import argparse, time
+import numpy as np
+from vector_db.retrieval_service import RetrievalService
+from benchmark.queries import QUESTIONS
+
+# synthetic queries on top of the 8 questions, so recall isn't measured on a handful of rows
+SYNTHETIC_QUERIES = [
+    "machine guarding requirements for saws",
+    "lockout tagout procedure for hazardous energy",
+    "employer duties under the occupational health and safety act",
+    "exposure limits for hardwood dust",
+    "risk assessment for machinery design",
+    "personal protective equipment for eye and face protection",
+    "ergonomic hazards of repetitive work",
+    "amputation hazards of power presses",
+    "emergency stop devices on machines",
+    "training requirements for forklift operators",
+    "noise exposure and hearing protection",
+    "inspection of guards and safety devices",
+]
+
+def recall_at_k(reference_ids, ids):
+    return np.mean([len(set(ref) & set(got)) / len(ref) for ref, got in zip(reference_ids, ids) if ref])
+
+def time_queries(backend, embeddings, k: int, repeat: int, quantization=None):
+    """Per query latencies in ms (one query at a time, like /ask without batching)."""
+    latencies = []
+    for _ in range(repeat):
+        for embedding in embeddings:
+            start = time.perf_counter()
+            backend.query([embedding], k, quantization=quantization)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector search against Chroma")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the queries when timing")
+    args = parser.parse_args()
+
+    chroma = RetrievalService()
+    numpy_backend = RetrievalService(backend="numpy", embedding_function=chroma.embedding_function).backend
+    queries = QUESTIONS + SYNTHETIC_QUERIES
+    embeddings = chroma.embed(queries)
+
+    # recall against the current Chroma results, and against exact search (Chroma's HNSW is approximate too)
+    reference = chroma.backend.query(embeddings, args.k)["ids"]
+    exact = numpy_backend.query(embeddings, args.k)["ids"]
+    print(f"{len(numpy_backend.chunks)} chunks, {len(queries)} queries, k={args.k}")
+    print(f"{'mode':<10}{'memory':>12}{'p50 ms':>10}{'p95 ms':>10}{'recall@k':>10}{'vs exact':>10}")
+
+    latencies = time_queries(chroma.backend, embeddings, args.k, args.repeat)
+    print(f"{'chroma':<10}{'-':>12}{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 95):>10.3f}"
+          f"{1.0:>10.3f}{recall_at_k(exact, reference):>10.3f}")
+
+    for quantization in (None, "int8", "binary"):
+        try:
+            ids = numpy_backend.query(embeddings, args.k, quantization=quantization)["ids"]
+        except ValueError as e:
+            print(f"{quantization}: {e}")
+            continue
+        latencies = time_queries(numpy_backend, embeddings, args.k, args.repeat, quantization)
+        memory = numpy_backend.memory_footprint(quantization) / 1024
+        print(f"{quantization or 'float32':<10}{memory:>10.1f}KB{np.percentile(latencies, 50):>10.3f}"
+              f"{np.percentile(latencies, 95):>10.3f}{recall_at_k(reference, ids):>10.3f}{recall_at_k(exact, ids):>10.3f}")
@@ -0,0 +1,29 @@
+# Concurrent load test for /ask, run it against a live server (start it with QNA_CACHE_SIZE=0 so the cache doesn't hide the work)
+#   python -m debug.load_test_ask --url http://localhost:8000/ask --concurrency 1 8 32 --requests 200
+
+import argparse, asyncio
+import numpy as np
+from benchmark.queries import QUESTIONS
+from benchmark.http_load import run_level
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the /ask endpoint")
+    parser.add_argument("--url", default="http://localhost:8000/ask")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mode", default="baseline", choices=["baseline", "hybrid-bm25"])
+    parser.add_argument("--timeout-ms", type=float, default=None, help="deadline sent with every request (X-Request-Timeout-Ms)")
+    args = parser.parse_args()
+    headers = {"X-Request-Timeout-Ms": str(args.timeout_ms)} if args.timeout_ms else None
+
+    print(f"{'conc':>5} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'429s':>5} {'503s':>5}")
+    for concurrency in args.concurrency:
+        latencies, status_codes, elapsed, _ = asyncio.run(
+            run_level(args.url, concurrency, args.requests, args.mode, QUESTIONS, headers=headers)
+        )
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{concurrency:>5} {len(latencies) / elapsed:>8.1f} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} "
+              f"{status_codes.count(429):>5} {status_codes.count(503):>5}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# Admission control: deadline parsing, the degradation ladder, which degradations apply to a request and the 429
+# paths, on a fake clock (perf_counter) with the queue depth set by hand, no server or model needed.
+#   python -m pytest debug/test_admission.py -q
+
+import asyncio, math
+from contextlib import contextmanager
+from types import SimpleNamespace
+from fastapi import HTTPException
+from api import concurrency
+from api.concurrency import AdmissionController, TIMEOUT_HEADER
+from api.main import apply_degradations
+from api.qna_model import QnAModel
+from api import config
+
+class FakeClock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@contextmanager
+def fake_clock(now: float = 100.0):
+    clock = FakeClock(now)
+    real_time = concurrency.time
+    concurrency.time = SimpleNamespace(perf_counter=clock)
+    try:
+        yield clock
+    finally:
+        concurrency.time = real_time
+
+def controller(max_concurrency: int = 2, max_queue: int = 4, default_timeout_ms: float = 1000, degraded_k: int = 3):
+    return AdmissionController(max_concurrency, max_queue, default_timeout_ms, degraded_k)
+
+def observe(limiter, mode, degradations, seconds):
+    limiter._observe(limiter._plan_key(mode, degradations), seconds)
+
+def shed_reason(limiter, mode, k, deadline):
+    """Status and Retry-After of admitting one request, None if it was admitted."""
+    async def run():
+        async with limiter.admit(mode, k, deadline):
+            pass
+    try:
+        asyncio.run(run())
+    except HTTPException as e:
+        return e.status_code, e.headers["Retry-After"]
+    return None
+
+def test_deadline_parsing():
+    limiter = controller(default_timeout_ms=1500)
+    with fake_clock(100.0):
+        assert limiter.deadline({}) == 101.5
+        assert limiter.deadline({TIMEOUT_HEADER: "250"}) == 100.25
+        assert math.isclose(limiter.deadline({TIMEOUT_HEADER: "0.5"}), 100.0005)
+        for value in ["0", "-20", "abc", "", "nan"]:
+            try:
+                limiter.deadline({TIMEOUT_HEADER: value})
+            except HTTPException as e:
+                assert e.status_code == 400, value
+            else:
+                raise AssertionError(f"{value!r} was accepted")
+
+def test_plan_tiers():
+    limiter = controller()
+    # nothing measured yet: nothing to degrade on
+    assert limiter.plan("hybrid-bm25", 10, 0.001) == ()
+
+    observe(limiter, "hybrid-bm25", (), 0.5)
+    assert limiter.plan("hybrid-bm25", 10, 1.0) == ()
+    # too slow, shrink_k wasn't measured yet so it is tried alone first
+    assert limiter.plan("hybrid-bm25", 10, 0.4) == ("shrink_k",)
+    # a batch needs weight times the time
+    assert limiter.plan("hybrid-bm25", 10, 0.6, weight=2) == ("shrink_k",)
+
+    observe(limiter, "hybrid-bm25", ("shrink_k",), 0.3)
+    assert limiter.plan("hybrid-bm25", 10, 0.35) == ("shrink_k",)
+    assert limiter.plan("hybrid-bm25", 10, 0.2) == ("shrink_k", "hybrid_to_baseline")
+
+    # hybrid-bm25 shrinks its candidate pool whatever its k, baseline only shrinks a k above the degraded k
+    assert limiter.plan("hybrid-bm25", 2, 0.4) == ("shrink_k",)
+    observe(limiter, "baseline", (), 0.5)
+    assert limiter.plan("baseline", 3, 0.1) == ()
+    assert limiter.plan("baseline", 10, 0.1) == ("shrink_k",)
+    # baseline never gets hybrid_to_baseline
+    observe(limiter, "baseline", ("shrink_k",), 0.4)
+    assert limiter.plan("baseline", 10, 0.1) == ("shrink_k",)
+
+def test_apply_degradations():
+    everything = ("shrink_k", "hybrid_to_baseline")
+    item, applied = apply_degradations(QnAModel(query="What is OSHA?", k=10, mode="hybrid-bm25"), everything)
+    assert (item.mode, item.k, applied) == ("baseline", config.QNA_DEGRADED_K, everything)
+
+    small = QnAModel(query="What is OSHA?", k=config.QNA_DEGRADED_K, mode="baseline")
+    item, applied = apply_degradations(small, everything)
+    assert item is small and applied == ()
+
+    item, applied = apply_degradations(QnAModel(query="What is OSHA?", k=config.QNA_DEGRADED_K + 5), ("shrink_k",))
+    assert (item.mode, item.k, applied) == ("baseline", config.QNA_DEGRADED_K, ("shrink_k",))
+
+    # a small hybrid k stays, only its candidate pool shrinks
+    item, applied = apply_degradations(QnAModel(query="What is OSHA?", k=1, mode="hybrid-bm25"), ("shrink_k",))
+    assert (item.k, applied) == (1, ("shrink_k",))
+
+    item, applied = apply_degradations(small, ())
+    assert item is small and applied == ()
+
+def test_queue_full_is_shed():
+    limiter = controller(max_concurrency=2, max_queue=4)
+    with fake_clock(100.0):
+        limiter.in_flight = 6
+        assert shed_reason(limiter, "baseline", 5, 110.0) == (429, "1")
+        limiter.in_flight = 5
+        assert shed_reason(limiter, "baseline", 5, 110.0) is None
+    assert limiter.in_flight == 5 and limiter.rejected == 1
+
+def test_deadline_is_shed():
+    limiter = controller(max_concurrency=2, max_queue=10)
+    observe(limiter, "baseline", (), 1.0)
+    observe(limiter, "baseline", ("shrink_k",), 0.5)
+    with fake_clock(100.0):
+        # 4 ahead, at the cheapest baseline plan 2 slots serve them in 1s
+        limiter.in_flight = 5
+        assert limiter.estimated_wait(fastest=True) == 1.0
+        assert shed_reason(limiter, "hybrid-bm25", 5, 100.9) == (429, "1")
+        assert shed_reason(limiter, "hybrid-bm25", 5, 101.5) is None
+        # an empty queue waits for nothing
+        limiter.in_flight = 0
+        assert shed_reason(limiter, "hybrid-bm25", 5, 100.01) is None
+    assert limiter.rejected == 1
+
+def test_queue_timeout_is_shed():
+    limiter = controller(max_concurrency=1, max_queue=4)
+
+    async def run():
+        await limiter._semaphore.acquire() # the only slot is taken and stays taken
+        async with limiter.admit("baseline", 5, concurrency.time.perf_counter() + 0.02):
+            pass
+
+    try:
+        asyncio.run(run())
+    except HTTPException as e:
+        assert e.status_code == 429
+    else:
+        raise AssertionError("admitted without a free slot")
+    assert limiter.in_flight == 0 and limiter.rejected == 1
+
+def test_admit_plans_and_measures():
+    limiter = controller(max_concurrency=2, max_queue=4, default_timeout_ms=1000)
+    observe(limiter, "hybrid-bm25", (), 0.5)
+
+    async def run(clock, deadline, seconds):
+        async with limiter.admit("hybrid-bm25", 10, deadline) as degradations:
+            clock.now += seconds
+            return degradations
+
+    with fake_clock(100.0) as clock:
+        assert asyncio.run(run(clock, 101.0, 0.5)) == ()
+        # 0.3s left, the full plan (0.5s) doesn't fit
+        assert asyncio.run(run(clock, clock.now + 0.3, 0.2)) == ("shrink_k",)
+    assert math.isclose(limiter.estimate("hybrid-bm25", ("shrink_k",)), 0.2)
+    assert limiter.degraded == 1 and limiter.in_flight == 0
+
+if __name__ == '__main__':
+    test_deadline_parsing()
+    test_plan_tiers()
+    test_apply_degradations()
+    test_queue_full_is_shed()
+    test_deadline_is_shed()
+    test_queue_timeout_is_shed()
+    test_admit_plans_and_measures()
+    print("admission control behaves as planned")
@@ -1,5 +1,118 @@
-from chunk_db.chunk_data import chunk_data
-# Test function
+# The chunker has to split exactly like the original rfind based chunker (frozen below), whole text or streamed in
+# pieces, on random text full of separators, at random chunk sizes and overlaps.
+#   python -m pytest debug/test_chunking.py -q
+
+import random
+from typing import List
+from chunk_db.chunk_data import chunk_data, chunk_spans, iter_chunks
+
+def reference_chunk_data(text, chunk_size: int = 400, chunk_overlap: int = 100, separators: List[str] = None):
+    """
+    The original chunk_data, copied verbatim as the golden reference.
+    Simple and reliable chunker that respects sentence boundaries when possible.
+    
+    Args:
+        text: Document text to split
+        chunk_size: Maximum chunk size in characters (default: 400)
+        chunk_overlap: Number of characters to overlap (default: 100)
+        separators: List of separators to try in order (optional)
+    
+    Returns:
+        List of text chunks
+    """
+    if not text or len(text) <= chunk_size:
+        return [text.strip()] if text.strip() else []
+    
+    # Default separators prioritize sentence boundaries
+    if separators is None:
+        separators = [". ", "! ", "? ", "• ", "\n\n", "\n", "; ", ", "]
+    
+    chunks = []
+    start = 0
+    text_len = len(text)
+    last_end = 0
+    
+    while start < text_len:
+        # Calculate end position
+        end = min(start + chunk_size, text_len)
+        
+        # If we're at the end, just take what's left
+        if end == text_len:
+            chunk = text[start:end].strip()
+            if chunk and len(chunk) > 10:
+                chunks.append(chunk)
+            break
+        
+        # Try to find the BEST break point using separators
+        best_split = end  # Default to hard cut
+        best_separator_priority = len(separators)  # Lower is better
+        
+        for i, separator in enumerate(separators):
+            split_pos = text.rfind(separator, start, end)
+            if split_pos > start:
+                # Prefer splits closer to our target size, but respect separator priority
+                distance_from_target = abs((split_pos + len(separator)) - end)
+                
+                # Only consider this split if:
+                # 1. It's a higher priority separator, OR
+                # 2. It's the same priority but closer to target size
+                if (i < best_separator_priority or 
+                    (i == best_separator_priority and distance_from_target < abs(best_split - end))):
+                    best_split = split_pos + len(separator)
+                    best_separator_priority = i
+        
+        # Extract chunk
+        chunk = text[start:best_split].strip()
+        
+        # Only add chunks that are substantial (avoid tiny fragments)
+        min_chunk_size = max(50, chunk_size // 8)  # At least 50 chars or 1/8 of target size
+        if chunk and len(chunk) >= min_chunk_size:
+            chunks.append(chunk)
+        
+        # Calculate next start position with overlap
+        if chunk_overlap > 0 and best_split > start + chunk_overlap:
+            start = best_split - chunk_overlap
+        else:
+            start = best_split
+        
+        # Safety check to prevent infinite loops
+        if start <= last_end:
+            start = last_end + 1
+        
+        last_end = best_split
+    
+    return chunks
+
+# pieces that hit every default separator, overlapping ones ("\n\n\n"), and whitespace strip() removes
+CHUNK_PIECES = [
+    "word", "Safety guards", "a", " ", "  ", "\t", "\n", "\n\n", "\n\n\n", ". ", ".", "! ", "? ", "• ", "; ", ", ",
+    "..  ", "\xa0", "\u2003", "Machinery must be guarded", "EN ISO 13849-1", "ñ", "€"
+]
+SEPARATOR_CHOICES = [None, None, [". ", "\n"], ["\n\n", ". ", " "], [", "], ["..", "."], ["; ", ""]]
+
+def random_text(rng):
+    return "".join(rng.choice(CHUNK_PIECES) for _ in range(rng.randint(0, 400)))
+
+def random_pieces(rng, text):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(rng.randint(0, 8), len(text) + 1)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+def test_random_text_matches_reference():
+    rng = random.Random(1200)
+    for _ in range(3000):
+        text = random_text(rng)
+        chunk_size = rng.choice([20, 50, 64, 150, 400])
+        chunk_overlap = rng.choice([0, 5, 10, 40, 100, chunk_size, chunk_size + 7])
+        separators = rng.choice(SEPARATOR_CHOICES)
+        args = (chunk_size, chunk_overlap, separators)
+        expected = reference_chunk_data(text, *args)
+
+        assert chunk_data(text, *args) == expected, (text, args)
+        if len(text) > chunk_size:
+            assert [text[start:end] for start, end in chunk_spans(text, *args)] == expected, (text, args)
+        streamed = list(iter_chunks(random_pieces(rng, text), *args))
+        assert [chunk for _, _, chunk in streamed] == expected, (text, args)
+        assert all(text[start:end] == chunk for start, end, chunk in streamed), (text, args)
 
 def test_chunker():
     """Test the data chunker with sample text."""
@@ -30,4 +143,5 @@ def test_chunker():
     #     print(f"Chunk {i+1} ({len(chunk)} chars): {chunk[:50]}...")
 
 if __name__ == '__main__':
+    test_random_text_matches_reference()
     test_chunker()
\ No newline at end of file
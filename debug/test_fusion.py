@@ -0,0 +1,102 @@
+# Min-max fusion has to give the same scores as the original hybrid blend, alpha * norm(vector) + (1 - alpha) *
+# norm(lexical) over the vector candidates (frozen below), on random rows and on flat (constant / all zero) rows.
+# A scoped search whose sources have no BM25 partition (no lexical column at all) falls back to the vector side.
+#   python -m pytest debug/test_fusion.py -q
+
+import random
+import numpy as np
+from types import SimpleNamespace
+from hybrid_reranker.bm25_reranker import hybrid_reranking_batch
+from hybrid_reranker.fusion import FUSION_STRATEGIES, align_candidates, fuse_scores, top_k_columns
+
+def reference_normalize_scores(scores) -> np.ndarray:
+    """The original normalize_scores, copied verbatim as the golden reference."""
+    scores = np.array(scores, dtype=float)
+    max_v = scores.max()
+    min_v = scores.min()
+    if max_v == min_v:
+        # this is to avoid 0 division, return an array of same dimension of 1s
+        return np.ones_like(scores)
+    range_v = max_v - min_v
+
+    return (scores - min_v) / range_v
+
+def reference_blend(vec_scores, lex_scores, alpha):
+    return alpha * reference_normalize_scores(vec_scores) + (1 - alpha) * reference_normalize_scores(lex_scores)
+
+def random_lex_row(rng, width):
+    """BM25-like scores of the vector candidates: non negative, often 0 (no term overlap), sometimes flat."""
+    kind = rng.choice(["random", "random", "zero", "constant", "sparse"])
+    if kind == "zero":
+        return [0.0] * width
+    if kind == "constant":
+        return [rng.choice([0.5, 1.0, 7.25])] * width
+    if kind == "sparse":
+        return [rng.choice([0.0, 0.0, rng.uniform(0.1, 12)]) for _ in range(width)]
+    return [round(rng.uniform(0, 12), rng.choice([0, 1, 3])) for _ in range(width)]
+
+def test_minmax_matches_old_blend():
+    rng = random.Random(2200)
+    for _ in range(2000):
+        n_queries, width = rng.randint(1, 6), rng.randint(1, 12)
+        alpha = rng.choice([0.0, 0.3, 0.6, 1.0])
+        vec_scores = np.array([
+            [rng.uniform(-0.2, 1)] * width if rng.random() < 0.1 else [rng.uniform(-0.2, 1) for _ in range(width)]
+            for _ in range(n_queries)
+        ])
+        lex_scores = np.array([random_lex_row(rng, width) for _ in range(n_queries)])
+
+        # the vector candidates' own BM25 scores (what the old blend fused), every lexical hit is a vector hit
+        vec_ids = np.tile(np.arange(width), (n_queries, 1))
+        lex_valid = lex_scores > 0
+        lex_columns, in_use = align_candidates(vec_ids, vec_ids, lex_valid)
+        fused = fuse_scores(vec_scores, lex_scores, lex_columns, lex_valid, in_use, "minmax", alpha)
+
+        assert in_use[:, :width].all() and not in_use[:, width:].any()
+        for i in range(n_queries):
+            expected = reference_blend(vec_scores[i], lex_scores[i], alpha)
+            assert np.allclose(fused[i, :width], expected), (vec_scores[i], lex_scores[i], alpha)
+
+def test_flat_lexical_rows():
+    vec_scores = np.array([[0.9, 0.5, 0.1], [0.9, 0.5, 0.1]])
+    lex_scores = np.array([[0.0, 0.0, 0.0], [2.0, 2.0, 2.0]])
+    vec_ids = np.tile(np.arange(3), (2, 1))
+    lex_valid = lex_scores > 0
+    lex_columns, in_use = align_candidates(vec_ids, vec_ids, lex_valid)
+    fused = fuse_scores(vec_scores, lex_scores, lex_columns, lex_valid, in_use, "minmax", 0.6)
+    # both rows are flat, every candidate gets the full lexical part
+    assert np.allclose(fused[:, :3], [[1.0, 0.7, 0.4], [1.0, 0.7, 0.4]])
+
+def test_no_lexical_columns():
+    vec_scores = np.array([[0.9, 0.5, 0.1], [0.3, 0.3, 0.3]])
+    vec_ids = np.array([[1, 2, 3], [4, 5, 6]])
+    lex_scores = np.empty((2, 0), dtype=np.float32)
+    lex_valid = lex_scores > 0
+    lex_columns, in_use = align_candidates(vec_ids, np.empty((2, 0), dtype=int), lex_valid)
+    for strategy in FUSION_STRATEGIES:
+        fused = fuse_scores(vec_scores, lex_scores, lex_columns, lex_valid, in_use, strategy, 0.6)
+        assert fused.shape == (2, 3) and np.isfinite(fused).all(), strategy
+        columns, _ = top_k_columns(fused, 2)
+        assert columns.tolist() == [[0, 1], [0, 1]], strategy
+
+def test_scope_without_lexical_partition():
+    """None of the requested sources has a BM25 partition: only the vector hits are ranked."""
+    service = SimpleNamespace(lexical_index=object(), lexical_partitions={"other-manual": None})
+    vector_results = [{
+        "documents": [["guards", "helmets", "ladders"]],
+        "metadatas": [[{"chunk_id": "a-0"}, {"chunk_id": "a-1"}, {"chunk_id": "a-2"}]],
+        "distances": [[0.2, 0.4, 0.6]]
+    }]
+    for strategy in FUSION_STRATEGIES:
+        results = hybrid_reranking_batch(
+            ["machine guarding"], k=2, service=service, vector_results=vector_results,
+            strategy=strategy, sources=["manual-without-bm25"]
+        )
+        assert [meta["chunk_id"] for _, meta, _ in results[0]] == ["a-0", "a-1"], strategy
+
+if __name__ == '__main__':
+    test_minmax_matches_old_blend()
+    test_flat_lexical_rows()
+    test_no_lexical_columns()
+    test_scope_without_lexical_partition()
+    print("min-max fusion matches the old blend, a missing lexical side falls back to the vector hits")
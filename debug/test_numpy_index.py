@@ -0,0 +1,124 @@
+# The numpy export against a fake Chroma collection: quantized codes always belong to the matrix they were written
+# with, an export without a quantization removes that quantization's old codes and stale codes are refused.
+# A re-export never touches the files an open backend has memory-mapped, and the retrieval service only switches to
+# the new export and BM25 index once ingestion stamps a new corpus version.
+#   python -m pytest debug/test_numpy_index.py -q
+
+import os, tempfile
+import numpy as np
+from hybrid_reranker.bm25_index import build_bm25_index
+from utils.common_utils import write_corpus_version
+from vector_db.retrieval_service import RetrievalService
+from vector_db.vector_backends import INT8_FILE, BINARY_FILE, NumpyBackend, export_numpy_index, exported_quantizations
+
+class FakeCollection:
+    """The part of a Chroma collection export_numpy_index reads, `n` random rows spread over a few sources."""
+    metadata = {"hnsw:space": "l2"}
+
+    def __init__(self, n: int, dim: int = 64, seed: int = 0, n_sources: int = 3):
+        rng = np.random.default_rng(seed)
+        self.embeddings = rng.standard_normal((n, dim)).astype(np.float32)
+        self.metadatas = [{"chunk_id": str(i), "source_id": f"src{i % n_sources:02d}"} for i in range(n)]
+
+    def count(self):
+        return len(self.metadatas)
+
+    def get(self, where=None, limit=None, offset=0, include=()):
+        rows = [i for i, meta in enumerate(self.metadatas) if where is None or meta["source_id"] == where["source_id"]]
+        rows = rows[offset:offset + limit]
+        return {
+            "ids": [str(i) for i in rows],
+            "embeddings": [self.embeddings[i] for i in rows],
+            "documents": [f"chunk {i}" for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows]
+        }
+
+def expect_value_error(function, *args, **kwargs):
+    try:
+        function(*args, **kwargs)
+    except ValueError as e:
+        return str(e)
+    raise AssertionError(f"{function.__name__} didn't raise")
+
+def test_reexport_drops_unrequested_codes():
+    index_path = os.path.join(tempfile.mkdtemp(), "numpy_index")
+    export_numpy_index(FakeCollection(205), index_path, quantizations=["int8", "binary"])
+    assert sorted(exported_quantizations(index_path)) == ["binary", "int8"]
+    assert NumpyBackend(index_path, quantization="binary").query(np.ones((1, 64)), 3)["ids"][0]
+
+    export_numpy_index(FakeCollection(10, seed=1), index_path)
+    assert exported_quantizations(index_path) == []
+    assert not os.path.exists(os.path.join(index_path, INT8_FILE))
+    assert not os.path.exists(os.path.join(index_path, BINARY_FILE))
+    assert "no int8 codes" in expect_value_error(NumpyBackend, index_path, quantization="int8")
+
+def test_stale_codes_are_refused():
+    index_path = os.path.join(tempfile.mkdtemp(), "numpy_index")
+    export_numpy_index(FakeCollection(205), index_path, quantizations=["int8"])
+    # codes of some other matrix, with the sidecar still listing int8
+    np.save(os.path.join(index_path, INT8_FILE), np.zeros((7, 64), dtype=np.int8))
+    assert "codes for 7 rows but 205 embeddings" in expect_value_error(NumpyBackend, index_path, quantization="int8")
+
+def test_reexport_leaves_open_backends_alone():
+    parent = tempfile.mkdtemp()
+    index_path = os.path.join(parent, "numpy_index")
+    export_numpy_index(FakeCollection(205), index_path, quantizations=["int8"])
+    backend = NumpyBackend(index_path)
+    query = np.random.default_rng(5).standard_normal((2, 64))
+    before = backend.query(query, 5)
+
+    export_numpy_index(FakeCollection(10, seed=1), index_path)
+    assert os.path.islink(index_path)
+    # still the 205 rows it opened, codes first loaded after the re-export included
+    assert backend.query(query, 5) == before
+    assert backend.query(query, 5, quantization="int8")["ids"] == before["ids"]
+    # once its version is deleted too, what it has mapped stays readable
+    for seed in (2, 3):
+        export_numpy_index(FakeCollection(10, seed=seed), index_path)
+    assert backend.query(query, 5) == before
+    assert len(NumpyBackend(index_path).chunks) == 10
+    # the newest export and the one before it
+    assert len([entry for entry in os.listdir(parent) if os.path.isdir(os.path.join(parent, entry)) and entry != "numpy_index"]) == 2
+
+def test_unversioned_export_is_replaced():
+    index_path = os.path.join(tempfile.mkdtemp(), "numpy_index")
+    os.makedirs(index_path)
+    open(os.path.join(index_path, INT8_FILE), "wb").close()
+    export_numpy_index(FakeCollection(20), index_path)
+    assert os.path.islink(index_path) and not os.path.exists(os.path.join(index_path, INT8_FILE))
+    assert len(NumpyBackend(index_path).chunks) == 20
+
+def ingest(collection, numpy_index_path, bm25_index_path):
+    """What an ingestion run leaves behind for the service, minus the corpus version stamp."""
+    export_numpy_index(collection, numpy_index_path)
+    rows = collection.get(limit=collection.count(), include=["documents", "metadatas"])
+    build_bm25_index(rows["documents"], rows["metadatas"], bm25_index_path)
+
+def test_service_reopens_indexes_on_new_corpus_version():
+    root = tempfile.mkdtemp()
+    numpy_index_path, bm25_index_path = os.path.join(root, "numpy_index"), os.path.join(root, "bm25_index")
+    version_path = os.path.join(root, "corpus_version.json")
+    ingest(FakeCollection(30, n_sources=3), numpy_index_path, bm25_index_path)
+    write_corpus_version(version_path)
+    service = RetrievalService(
+        embedding_function=lambda queries: np.ones((len(queries), 64), dtype=np.float32), bm25_index_path=bm25_index_path,
+        backend="numpy", numpy_index_path=numpy_index_path, version_path=version_path
+    )
+    assert len(service.search(np.ones((1, 64)), 100)["ids"][0]) == 30
+    assert sorted(service.lexical_partitions) == ["src00", "src01", "src02"]
+
+    ingest(FakeCollection(12, seed=1, n_sources=2), numpy_index_path, bm25_index_path)
+    # not stamped yet, ingestion may still be writing
+    assert len(service.search(np.ones((1, 64)), 100)["ids"][0]) == 30
+    write_corpus_version(version_path)
+    assert len(service.query(["chunk"], 100)["ids"][0]) == 12
+    assert sorted(service.lexical_partitions) == ["src00", "src01"]
+    assert not service.refresh()
+
+if __name__ == '__main__':
+    test_reexport_drops_unrequested_codes()
+    test_stale_codes_are_refused()
+    test_reexport_leaves_open_backends_alone()
+    test_unversioned_export_is_replaced()
+    test_service_reopens_indexes_on_new_corpus_version()
+    print("quantized codes always match the exported matrix")
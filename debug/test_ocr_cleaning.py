@@ -0,0 +1,165 @@
+# Golden output tests for the compiled OCR cleaning engine: its output has to stay byte for byte the same as the
+# original chain of re.sub calls (frozen below), on hand written samples, on random OCR-ish text and on the real PDFs.
+# Streamed (page by page) cleaning has to match cleaning the joined pages the same way.
+#   python -m pytest debug/test_ocr_cleaning.py -q
+
+import os, random, re
+import pytest
+from chunk_db.chunk_data import clean_ocr_text, iter_clean_text, iter_pages
+
+DATA_PATH = "sourced_data"
+
+def reference_clean_ocr_text(text: str) -> str:
+    """The original clean_ocr_text, copied verbatim as the golden reference."""
+    # Step 1: Fix hyphenated line breaks
+    text = re.sub(r'-\s*\n\s*', '', text)
+
+    # Fix single char cutoffs
+    text = re.sub(r'\b([a-zA-Z])\s*\n', r'\1', text)
+
+    # Step 2: Remove table of contents lines (dots + page numbers)
+    text = re.sub(r'^.*\.{3,}.*?\d+\s*$', '', text, flags=re.MULTILINE)
+
+    # Step 3: Remove standalone page numbers and section numbers
+    text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*\d+\.\d+\s*$', '', text, flags=re.MULTILINE)
+
+    # Step 4: Fix broken lines
+    text = re.sub(r'(?<![.!?:])\n(?!\s*[•\-\d])', ' ', text)
+
+    # Step 5: Clean OCR artifacts
+    text = re.sub(r'\xa0', ' ', text)
+    text = re.sub(r'\u2003', ' ', text)
+    text = re.sub(r'[\u2000-\u200f]', ' ', text)
+    text = re.sub(r'[\u2010-\u2015]', '-', text)
+
+    # Step 6: Fix common OCR letter substitutions
+    text = re.sub(r'\bngerous\b', 'dangerous', text)
+    text = re.sub(r'\bo new\b', 'no new', text)
+
+    # Step 7: Clean up scientific notation
+    text = re.sub(r'(\d+)\s*·\s*(\d+)', r'\1 × \2', text)
+    text = re.sub(r'(\d+)-(\d+)', r'\1^-\2', text)
+
+    # Step 8: Normalize bullets and numbered lists
+    text = re.sub(r'^\s*[•▪▫‣⁃]\s*', '• ', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*[-]\s+', '• ', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*(\d+)\.\s+', r'\1. ', text, flags=re.MULTILINE)
+
+    # Step 9: Fix figure/table references
+    text = re.sub(r'Figure\s+(\d+)\.(\d+):', r'Figure \1.\2:', text)
+    text = re.sub(r'Table\s+(\d+)\.(\d+):', r'Table \1.\2:', text)
+
+    # Step 10: Whitespace normalization
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r' {2,}', ' ', text)
+    text = re.sub(r'\t+', ' ', text)
+
+    # Step 11: Remove short OCR junk lines
+    lines = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if len(line) > 5 or any(marker in line.lower() for marker in ['figure', 'table', '•', 'pl ']):
+            lines.append(line)
+    text = '\n'.join(lines)
+
+    return text.strip()
+
+SAMPLES = [
+    "",
+    "Machinery safe-\nguards must be fitted.\n\n12\n\n1.5\n\nContents.......... 4\n",
+    "• first item\n▪ second\n - third\n3.  numbered item\n\nFigure  2.1: guard\nTable\t3.4: limits\n",
+    "The ngerous part has o new guards.\u2003Values 10·3 and 5-6 apply\xa0here \u2013 see 1-2-3.\n\n\n\n\nEnd.",
+    "a\nb\nc\n  x \n\t\ttabbed    spaced   text\n pl \nok",
+    "Risk assessment:\n- identify hazards\n- evaluate risks\n\n12.\n  7\n4 . 2\nEN ISO 13849-1:2015 requirements",
+    "▪\n- foo\n12\n1.5\nabc\n3.\n5\nabc word-\n\n  next\u2010line \u200b zero width",
+]
+
+# pieces that hit every rule and its edge cases (anchors, multi line \s*, rule interplay)
+FUZZ_PIECES = [
+    "word", "Safety", "a", "B", " ", "  ", "\t", "\n", "\n\n", "\n\n\n", "-", " - ", "-\n", "- \n ", ".", "...", "....... 12",
+    "!", "?", ":", "12", "3.4", "7.", "1·2", "3 · 4", "5-6", "•", "▪", "‣", "⁃", "▫", "Figure 1.2:", "Figure  3.4:",
+    "Table 5.6:", "ngerous", "o new", "no new", "pl ", "\xa0", " ", " ", "​", "‐", "–", "―",
+    "x\n", "EN 954-1", "ISO 13849", "(a)", "Note.", "§", "ñ"
+]
+
+def test_samples_match_reference():
+    for sample in SAMPLES:
+        assert clean_ocr_text(sample) == reference_clean_ocr_text(sample), repr(sample)
+
+def test_random_text_matches_reference():
+    rng = random.Random(1230)
+    for _ in range(5000):
+        text = "".join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(1, 60)))
+        assert clean_ocr_text(text) == reference_clean_ocr_text(text), repr(text)
+
+# block endings that make a page boundary safe to cut at, or exactly not (hyphen, broken line, list number)
+BLOCK_ENDINGS = [
+    "Guarding of moving parts must be checked.", "protective equipment is worn!", "Is it safe?", "protec-",
+    "Guarding of moving", "12.", "3.", "Next page", "Table 5.6:"
+]
+
+def random_pages(rng):
+    """Pages shaped like iter_pages output: stripped blocks, each followed by a blank line."""
+    pages = []
+    for _ in range(rng.randint(1, 6)):
+        blocks = []
+        for _ in range(rng.randint(1, 5)):
+            block = "".join(rng.choice(FUZZ_PIECES + BLOCK_ENDINGS * 3) for _ in range(rng.randint(1, 12)))
+            if rng.random() < 0.5:
+                block += rng.choice(BLOCK_ENDINGS)
+            if block.strip():
+                blocks.append(block.strip() + "\n\n")
+        if blocks:
+            pages.append("".join(blocks))
+    return pages
+
+def test_streamed_cleaning_matches_whole_text():
+    pages = ["Workers must wear protec-\n\ntive equipment at all times.\n\nGuarding of moving\n\n", "parts is required.\n\n"]
+    assert "".join(iter_clean_text(pages)) == clean_ocr_text("".join(pages))
+
+    rng = random.Random(1010)
+    for _ in range(2000):
+        pages = random_pages(rng)
+        assert "".join(iter_clean_text(pages)) == clean_ocr_text("".join(pages)), repr(pages)
+    # pages that aren't block shaped at all
+    for _ in range(2000):
+        pages = ["".join(rng.choice(FUZZ_PIECES + BLOCK_ENDINGS) for _ in range(rng.randint(1, 30))) for _ in range(rng.randint(1, 5))]
+        assert "".join(iter_clean_text(pages)) == clean_ocr_text("".join(pages)), repr(pages)
+
+def test_streamed_cleaning_without_sentence_ends():
+    """Table/heading pages never give a safe cut, the carry is cut anyway once it outgrows max_carry."""
+    rng = random.Random(1011)
+    pages = [
+        "".join(f"Table {rng.randint(1, 9)}.{rng.randint(1, 9)}: Guard type {rng.randint(100, 999)} clearance mm\n\n"
+                f"Section heading {page} {block}\n\n" for block in range(20))
+        for page in range(300)
+    ]
+    segments = list(iter_clean_text(pages, max_carry=20_000))
+    assert len(segments) > 10
+    assert all(len(segment) <= 20_000 + max(map(len, pages)) for segment in segments)
+    # only the line breaks at the forced cuts differ from cleaning the joined pages
+    assert "".join(segments).split() == clean_ocr_text("".join(pages)).split()
+
+def source_pdfs() -> list:
+    """The PDFs downloaded into sourced_data/, if any."""
+    if not os.path.isdir(DATA_PATH):
+        return []
+    return sorted(file_name for file_name in os.listdir(DATA_PATH) if file_name.endswith(".pdf"))
+
+def test_real_pdfs_match_reference():
+    """Skipped unless the source PDFs were downloaded into sourced_data/."""
+    if not source_pdfs():
+        pytest.skip("sourced_data PDFs not present")
+    for file_name in source_pdfs():
+        text = "".join(iter_pages(os.path.join(DATA_PATH, file_name)))
+        assert clean_ocr_text(text) == reference_clean_ocr_text(text), file_name
+
+if __name__ == '__main__':
+    test_samples_match_reference()
+    test_random_text_matches_reference()
+    test_streamed_cleaning_matches_whole_text()
+    test_streamed_cleaning_without_sentence_ends()
+    if source_pdfs():
+        test_real_pdfs_match_reference()
+    print("clean_ocr_text matches the reference output")
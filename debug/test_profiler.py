@@ -0,0 +1,54 @@
+# Slow request profiles: a slow request only queues its samples, the sampling thread writes them, and a full
+# queue drops profiles instead of growing.
+#   python -m pytest debug/test_profiler.py -q
+
+import os, tempfile, threading, time
+from utils.profiler import SlowRequestProfiler
+
+def busy(until: float):
+    while time.perf_counter() < until:
+        sum(range(1000))
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_slow_request_profile_is_written_off_the_request():
+    output_dir = tempfile.mkdtemp()
+    profiler = SlowRequestProfiler(interval_ms=1, slow_ms=50, output_dir=output_dir)
+    profiler.enable()
+    try:
+        started = time.perf_counter()
+        busy(started + 0.1)
+        finished = time.perf_counter()
+        # fast requests are ignored
+        assert not profiler.request_finished("/ask", finished - 0.01, finished)
+        assert profiler.request_finished("/ask", started, finished)
+        assert wait_for(lambda: profiler.profiles_written == 1)
+    finally:
+        profiler.disable()
+    (name,) = os.listdir(output_dir)
+    assert name.endswith(".folded") and "-ask-" in name
+    with open(os.path.join(output_dir, name), encoding="utf-8") as profile:
+        assert any("test_profiler.py:busy" in line for line in profile)
+
+def test_full_queue_drops_profiles():
+    profiler = SlowRequestProfiler(slow_ms=0, output_dir=tempfile.mkdtemp(), max_pending=2)
+    # enabled, but without a sampling thread draining the queue
+    profiler._thread = threading.current_thread()
+    profiler._samples.extend([(1.0, "a;b"), (2.0, "a;c"), (3.0, "a;b"), (4.0, "a;d")])
+    for _ in range(4):
+        profiler.request_finished("/ask", 1.5, 3.0)
+    assert profiler.profiles_dropped == 2
+    # only the samples inside the request, newest first
+    assert [stacks for *_, stacks in profiler._pending] == [["a;b", "a;c"]] * 2
+    profiler._thread = None
+    profiler._write_pending()
+    assert profiler.profiles_written == 2 and len(os.listdir(profiler.output_dir)) == 2
+
+if __name__ == '__main__':
+    test_slow_request_profile_is_written_off_the_request()
+    test_full_queue_drops_profiles()
+    print("slow request profiles are written by the sampling thread")
@@ -0,0 +1,88 @@
+import os, shutil
+import numpy as np
+from collections import defaultdict
+from bm25s import tokenize, BM25
+
+# corpus wide BM25 index, built once at ingestion (see vector_db/ingest_chunks.py) and memory-mapped at query time
+BM25_INDEX_PATH = "bm25_index"
+# one more index per source under the corpus index, what source scoped queries search
+PARTITIONS_DIR = "sources"
+
+def _index_and_save(docs, metas, index_path: str):
+    # this uses the same method as scikit learn's Count Vectorizer, and this BM25 lib uses scipy under the hood
+    tokenized_docs = tokenize(docs, show_progress=False)
+    index = BM25()
+    index.index(tokenized_docs, show_progress=False)
+
+    # the corpus entries are what lexical_search hands back, so a lexical only hit can still be cited
+    corpus = [{"document": doc, "metadata": meta} for doc, meta in zip(docs, metas)]
+    index.save(index_path, corpus=corpus, show_progress=False)
+
+def build_bm25_index(docs, metas, index_path: str = BM25_INDEX_PATH):
+    """
+    Index every chunk with BM25 and save it (plus the chunk text/metadata as its corpus) to disk, then the chunks
+    of every source on their own as that source's partition (a chunk is in its alternate sources' partitions too).
+    """
+    _index_and_save(docs, metas, index_path)
+
+    by_source = defaultdict(list)
+    for doc, meta in zip(docs, metas):
+        for source_id in [meta["source_id"], *meta.get("alt_source_ids", ())]:
+            by_source[source_id].append((doc, meta))
+    partitions_path = os.path.join(index_path, PARTITIONS_DIR)
+    # rebuilt from scratch, a source that lost all its chunks loses its partition too
+    shutil.rmtree(partitions_path, ignore_errors=True)
+    for source_id, chunks in by_source.items():
+        _index_and_save([doc for doc, _ in chunks], [meta for _, meta in chunks], os.path.join(partitions_path, source_id))
+    print(f"Indexed {len(docs)} chunks ({len(by_source)} source partitions) with BM25 and saved at {index_path}")
+
+def load_bm25_index(index_path: str = BM25_INDEX_PATH):
+    """Memory-map a saved BM25 index (and its corpus), returns None if it wasn't built yet."""
+    if not os.path.isdir(index_path):
+        print(f"No BM25 index found at {index_path}, hybrid search will only rerank vector hits")
+        return None
+    return BM25.load(index_path, mmap=True, load_corpus=True, show_progress=False)
+
+def load_bm25_partitions(index_path: str = BM25_INDEX_PATH) -> dict:
+    """Memory-map every source partition of a saved BM25 index, source id -> index ({} if none were built)."""
+    partitions_path = os.path.join(index_path, PARTITIONS_DIR)
+    if not os.path.isdir(partitions_path):
+        print(f"No BM25 source partitions found at {partitions_path}, source scoped queries will only rerank vector hits")
+        return {}
+    return {
+        source_id: BM25.load(os.path.join(partitions_path, source_id), mmap=True, load_corpus=True, show_progress=False)
+        for source_id in sorted(os.listdir(partitions_path))
+    }
+
+def lexical_search(index: BM25, queries, k: int):
+    """
+    Top-k BM25 hits over the whole corpus for a batch of queries (scored together).
+    Returns a (queries x k) array of corpus entries ({"document", "metadata"}) and a matching array of scores.
+    """
+    # plain string tokens so the queries are mapped onto the index vocabulary
+    query_tokens = tokenize(queries, return_ids=False, show_progress=False)
+    k = min(k, len(index.corpus))
+    hits, scores = index.retrieve(query_tokens, k=k, show_progress=False)
+
+    return hits, scores
+
+def scoped_lexical_search(partitions: dict, queries, k: int, sources):
+    """
+    lexical_search over only the partitions of `sources` (resolved source ids), the other sources' postings are
+    never read. Hits of several sources are merged on score into the top-k per query. Scores use each partition's
+    own statistics (term rarity within that source), like a search of just those manuals.
+    """
+    hits, scores = [], []
+    for source_id in sources:
+        if source_id in partitions:
+            source_hits, source_scores = lexical_search(partitions[source_id], queries, k)
+            hits.append(source_hits)
+            scores.append(source_scores)
+    if not hits:
+        return np.empty((len(queries), 0), dtype=object), np.empty((len(queries), 0), dtype=np.float32)
+    if len(hits) == 1:
+        return hits[0], scores[0]
+
+    hits, scores = np.concatenate(hits, axis=1), np.concatenate(scores, axis=1)
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(hits, top, axis=1), np.take_along_axis(scores, top, axis=1)
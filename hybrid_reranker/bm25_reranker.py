@@ -1,44 +1,101 @@
 from bm25s import tokenize, BM25
-from vector_db.baseline_search import cosine_search, filter_results_by_threshold
+from vector_db.baseline_search import filter_results_by_threshold, slice_query_result
+from vector_db.retrieval_service import get_retrieval_service
+from hybrid_reranker.bm25_index import lexical_search, scoped_lexical_search
+from hybrid_reranker.fusion import align_candidates, fuse_scores, top_k_columns
 import numpy as np
 import random
-from utils.normalize_scores import normalize_scores
 from utils.retrieval_utils import query_result_with_citations
+from utils.instrumentation import METRICS, span
 
 random.seed(42) # seed to force deterministic answers from reranking
 
-def hybrid_reranking(query:str, k:int=30, alpha:float=0.6):
-    res = cosine_search(query, k)
+# how many candidates each side (vector / lexical) brings into the fusion
+HYBRID_CANDIDATE_K = 30
 
-    # Apply abstinence filter - if query is off-topic, return empty
-    filtered_res = filter_results_by_threshold(res)
-    if filtered_res['documents'] == [[]]:  # If abstained
-        return []
-    
-    docs, metas, distances = res['documents'][0], res['metadatas'][0], res['distances'][0]
-    # 1. we need scores and normalized (0-1) current distance is closer/lower = better , scores are higher = better so we flip 1 - dist
-    vec_scores = 1 - np.array(distances)
-    vec_scores_norm = normalize_scores(vec_scores)
-
-    # this uses the same method as scikit learn's Count Vectorizer, and this BM25 lib uses scipy under the hood
-    tokenized_docs = tokenize(docs)
+def rerank_candidates_bm25(query:str, docs):
+    """Fallback when no corpus BM25 index is built: score only the vector candidates (old behaviour)."""
+    tokenized_docs = tokenize(docs, show_progress=False)
     reranker = BM25()
-    reranker.index(tokenized_docs)
-    query_tokens = tokenize(query)
+    reranker.index(tokenized_docs, show_progress=False)
+    query_tokens = tokenize([query], return_ids=False, show_progress=False)
+
+    return reranker.get_scores(query_tokens[0])
+
+def hybrid_reranking(query:str, k:int=HYBRID_CANDIDATE_K, alpha:float=0.6, service=None, vector_results=None,
+                     strategy:str="minmax", candidate_k:int=HYBRID_CANDIDATE_K, sources=None):
+    # vector_results lets callers that already searched (e.g. the API's query batcher) skip a second search
+    return hybrid_reranking_batch(
+        [query], k, alpha, service,
+        vector_results=[vector_results] if vector_results is not None else None,
+        strategy=strategy, candidate_k=candidate_k, sources=sources
+    )[0]
+
+def hybrid_reranking_batch(queries, k:int=HYBRID_CANDIDATE_K, alpha:float=0.6, service=None, vector_results=None,
+                           strategy:str="minmax", candidate_k:int=HYBRID_CANDIDATE_K, sources=None):
+    """
+    Hybrid (vector + BM25) reranking for a batch of queries.
+    Each side brings `candidate_k` candidates per query, they are fused with `strategy` ("minmax" / "zscore" blends
+    weighted by alpha, or "rrf", see hybrid_reranker/fusion.py) and the best `k` are returned.
+    Embedding, the chroma query and BM25 scoring each run once for the whole batch, alignment, fusion and
+    top-k selection are array operations, only the winning candidates become python tuples.
+    `sources` (resolved source ids) scopes both sides: the vector search is filtered in the backend and BM25 runs
+    on those sources' partitions. vector_results passed in must come from a search with the same scope.
 
-    reranker_scores = reranker.retrieve(query_tokens, k=len(docs)).scores[0]
-    reranker_scores_norm = normalize_scores(reranker_scores)
+    Returns one [(doc, meta, score), ...] list per query, [] if that query abstained.
+    """
+    service = service or get_retrieval_service()
+    if vector_results is None:
+        res = service.query(queries, candidate_k, sources=sources)
+        vector_results = [slice_query_result(res, row, candidate_k) for row in range(len(queries))]
 
-    # blend scores
-    blended_scores = alpha * vec_scores_norm + (1 - alpha) * reranker_scores_norm
+    # Apply abstinence filter - if query is off-topic, return empty
+    answered = [
+        row for row, res in enumerate(vector_results)
+        if filter_results_by_threshold(res)['documents'] != [[]]
+    ]
+    reranked_results = [[] for _ in queries]
+    if not answered:
+        return reranked_results
+
+    # 1. distance is closer/lower = better, scores are higher = better so we flip 1 - dist
+    vec_ids = np.array([[meta['chunk_id'] for meta in vector_results[row]['metadatas'][0]] for row in answered])
+    vec_scores = 1 - np.array([vector_results[row]['distances'][0] for row in answered])
 
+    # 2. lexical retrieval runs on its own over the whole corpus (or the scope's partitions), so it can find chunks vector search missed
+    with span("bm25"):
+        if service.lexical_index is not None and (sources is None or service.lexical_partitions):
+            answered_queries = [queries[row] for row in answered]
+            if sources is None:
+                lex_hits, lex_scores = lexical_search(service.lexical_index, answered_queries, candidate_k)
+            else:
+                lex_hits, lex_scores = scoped_lexical_search(service.lexical_partitions, answered_queries, candidate_k, sources)
+            lex_ids = np.array([[hit["metadata"]["chunk_id"] for hit in row_hits] for row_hits in lex_hits])
+        else:
+            lex_hits, lex_ids = None, vec_ids
+            lex_scores = np.array([rerank_candidates_bm25(queries[row], vector_results[row]['documents'][0]) for row in answered])
 
-    # sort 
-    reranked_results = sorted(
-        zip(docs, metas, blended_scores),
-        key= lambda x: x[2],
-        reverse=True
-    )
+    # 3. line both sides up on chunk id, fuse, keep the best k per query
+    with span("fusion"):
+        lex_valid = lex_scores > 0 # no term overlap with the query
+        lex_columns, in_use = align_candidates(vec_ids, lex_ids, lex_valid)
+        fused = fuse_scores(vec_scores, lex_scores, lex_columns, lex_valid, in_use, strategy, alpha)
+        columns, scores = top_k_columns(fused, k)
+
+        n_vec = vec_ids.shape[1]
+        for i, row in enumerate(answered):
+            METRICS.observe("qna_fusion_candidates", int(in_use[i].sum()))
+            documents, metadatas = vector_results[row]['documents'][0], vector_results[row]['metadatas'][0]
+            ranked = []
+            for col, score in zip(columns[i].tolist(), scores[i].tolist()):
+                if score == -np.inf:
+                    break # fewer than k candidates
+                if col < n_vec:
+                    ranked.append((documents[col], metadatas[col], score))
+                else:
+                    hit = lex_hits[i][col - n_vec]
+                    ranked.append((hit["document"], hit["metadata"], score))
+            reranked_results[row] = ranked
 
     return reranked_results
 
@@ -47,4 +104,3 @@ if __name__ == '__main__':
     #testing
     print(query_result_with_citations(res))
 
-
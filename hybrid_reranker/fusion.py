@@ -0,0 +1,80 @@
+import numpy as np
+from utils.normalize_scores import normalize_scores, standardize_scores
+
+# Fusion of the vector and lexical candidate lists of a batch of queries. Everything is a (queries x candidates)
+# array: candidate columns are the V vector hits followed by the L lexical hits, a lexical hit that is also a
+# vector hit lands in the vector hit's column. Callers only turn the top k columns back into python objects.
+
+FUSION_STRATEGIES = ("minmax", "zscore", "rrf")
+# rank offset of reciprocal rank fusion, keeps the first few ranks from dominating the sum
+RRF_K = 60
+
+def align_candidates(vec_ids, lex_ids, lex_valid):
+    """
+    Line both candidate lists up on chunk id. vec_ids (queries x V) and lex_ids (queries x L) are chunk ids,
+    lex_valid marks the lexical hits to use (the ones with any term overlap).
+    Returns the column of every lexical hit (queries x L) and which of the V + L columns hold a candidate.
+    """
+    n_vec, n_lex = vec_ids.shape[1], lex_ids.shape[1]
+    same = lex_ids[:, :, None] == vec_ids[:, None, :]
+    matched = same.any(axis=2)
+    lex_columns = np.where(matched, same.argmax(axis=2), n_vec + np.arange(n_lex))
+    in_use = np.concatenate([np.ones(vec_ids.shape, dtype=bool), lex_valid & ~matched], axis=1)
+    return lex_columns, in_use
+
+def fuse_scores(vec_scores, lex_scores, lex_columns, lex_valid, in_use, strategy: str = "minmax", alpha: float = 0.6):
+    """
+    (queries x V + L) fused scores, -inf for unused columns.
+    - "minmax": alpha * min-max(vector) + (1 - alpha) * min-max(lexical), a side missing a candidate gives it 0,
+      except a query without any lexical hit: its flat lexical row min-maxes to 1s for every candidate (as the
+      old blend of the two normalized rows did)
+    - "zscore": the same blend on z-scores, a side missing a candidate gives it that side's lowest z-score
+    - "rrf": reciprocal rank fusion, alpha / (RRF_K + vector rank) + (1 - alpha) / (RRF_K + lexical rank)
+    """
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy {strategy!r}, expected one of {FUSION_STRATEGIES}")
+    n_queries, n_vec = vec_scores.shape
+    width = in_use.shape[1]
+
+    if strategy == "rrf":
+        vec_part = 1.0 / (RRF_K + 1 + np.arange(n_vec))
+        lex_part = np.broadcast_to(1.0 / (RRF_K + 1 + np.arange(lex_scores.shape[1])), lex_scores.shape)
+        vec_floor = lex_floor = np.zeros((n_queries, 1))
+    else:
+        normalize = normalize_scores if strategy == "minmax" else standardize_scores
+        # no lexical column at all when none of a scoped search's sources has a BM25 partition
+        vec_part = normalize(vec_scores)
+        lex_part = normalize(lex_scores) if lex_scores.shape[1] else lex_scores
+        if strategy == "minmax":
+            vec_floor = np.zeros((n_queries, 1))
+            lex_floor = np.where(lex_valid.any(axis=1, keepdims=True), 0.0, 1.0)
+        else:
+            vec_floor = vec_part.min(axis=1, keepdims=True)
+            lex_floor = np.where(lex_valid, lex_part, np.inf).min(axis=1, keepdims=True, initial=np.inf)
+            lex_floor = np.where(np.isfinite(lex_floor), lex_floor, 0.0)
+
+    vec_matrix = np.repeat(vec_floor, width, axis=1)
+    vec_matrix[:, :n_vec] = vec_part
+    lex_matrix = np.repeat(lex_floor, width, axis=1)
+    rows, hits = np.nonzero(lex_valid)
+    lex_matrix[rows, lex_columns[rows, hits]] = np.broadcast_to(lex_part, lex_scores.shape)[rows, hits]
+
+    fused = alpha * vec_matrix + (1 - alpha) * lex_matrix
+    fused[~in_use] = -np.inf
+    return fused
+
+def top_k_columns(scores, k: int):
+    """Row-wise columns and scores of the k highest scores, best first, ties keep column order (vector hits first)."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        # everything above the k-th best score, plus as many of the ties with it as fit, the first columns first
+        # (argpartition alone would pick among ties arbitrarily)
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+        above, ties = scores > kth, scores == kth
+        chosen = above | (ties & (np.cumsum(ties, axis=1) <= k - above.sum(axis=1, keepdims=True)))
+        columns = np.nonzero(chosen)[1].reshape(len(scores), k)
+    else:
+        columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top_scores = np.take_along_axis(scores, columns, axis=1)
+    order = np.lexsort((columns, -top_scores), axis=-1)
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
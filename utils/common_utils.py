@@ -1,4 +1,4 @@
-import sqlite3, json
+import sqlite3, json, time, uuid, hashlib
 
 def load_data_source(file_path:str="sources.json"):
     """Load the sources JSON file."""
@@ -10,4 +10,36 @@ def get_conn_and_cursor(db_path:str):
     connection = sqlite3.connect(db_path)
     cursor = connection.cursor()
 
-    return connection, cursor
\ No newline at end of file
+    return connection, cursor
+
+# ingestion stamps a new corpus version whenever the chunk DB / Chroma collection changes,
+# anything caching query results keys on it so stale answers are dropped automatically
+CORPUS_VERSION_PATH = "corpus_version.json"
+
+def write_corpus_version(version_path:str=CORPUS_VERSION_PATH) -> str:
+    """Stamp a new corpus version after ingestion changed the chunk DB or the vector store."""
+    version = uuid.uuid4().hex
+    with open(version_path, "w", encoding="utf-8") as version_file:
+        json.dump({"version": version, "updated_at": time.time()}, version_file)
+    return version
+
+def read_corpus_version(version_path:str=CORPUS_VERSION_PATH) -> str:
+    """Current corpus version, 'unversioned' if ingestion never wrote a stamp."""
+    try:
+        with open(version_path, "r", encoding="utf-8") as version_file:
+            return json.load(version_file)["version"]
+    except (OSError, ValueError, KeyError):
+        return "unversioned"
+
+
+def hash_text(text:str) -> str:
+    """Content hash of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(file_path:str) -> str:
+    """Content hash of a (source PDF) file, read in blocks so big manuals don't sit in memory."""
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as data_file:
+        for block in iter(lambda: data_file.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
@@ -0,0 +1,168 @@
+import threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Hot path instrumentation: `span("stage")` times a stage into a latency histogram and into the current request's
+# timings (what the API sends back as Server-Timing), counters/histograms render in the Prometheus text format.
+# Plain dicts behind one lock, no client library : a span costs two perf_counter calls and a dict update.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 30, 40, 60, 100)
+
+
+class MetricsRegistry:
+    """Counters, gauges and fixed bucket histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}        # name -> (type, help)
+        self._counters = {}    # (name, labels) -> value
+        self._gauges = {}
+        self._histograms = {}  # (name, labels) -> [count per bucket..., count above the last bucket, sum, count]
+        self._buckets = {}     # name -> upper bounds
+
+    def describe(self, name: str, metric_type: str, help_text: str, buckets=None):
+        self._help[name] = (metric_type, help_text)
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._buckets.get(name, LATENCY_BUCKETS)
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(buckets) + 3)
+            # counts per bucket here, made cumulative when rendered
+            histogram[bisect_left(buckets, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        with self._lock:
+            counters, gauges = dict(self._counters), dict(self._gauges)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+
+        lines, described = [], set()
+        def header(name, default_type):
+            if name not in described:
+                described.add(name)
+                metric_type, help_text = self._help.get(name, (default_type, ""))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), values in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self._buckets.get(name, LATENCY_BUCKETS), values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ") + '"' for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("qna_stage_seconds", "histogram", "Time spent per retrieval stage")
+METRICS.describe("qna_request_seconds", "histogram", "End to end request latency")
+METRICS.describe("qna_requests_total", "counter", "Requests served")
+METRICS.describe("qna_abstentions_total", "counter", "Answers abstained on (nothing passed the distance threshold)")
+METRICS.describe("qna_vector_candidates", "histogram", "Vector hits passing the distance threshold per query", COUNT_BUCKETS)
+METRICS.describe("qna_process_memory_bytes", "gauge", "Resident memory of this worker process (rss, pss, shared, private)")
+METRICS.describe("qna_fusion_candidates", "histogram", "Candidates blended per query by hybrid fusion", COUNT_BUCKETS)
+METRICS.describe("qna_degradations_total", "counter", "Degradations applied by admission control to meet request deadlines")
+METRICS.describe("qna_shed_total", "counter", "Requests shed with a 429 (queue full or the deadline would pass while queued)")
+
+def process_memory() -> dict:
+    """
+    This process' resident memory in bytes from /proc/self/smaps_rollup (Linux only, {} elsewhere): rss, pss (shared
+    pages split between the processes mapping them), shared (pages other processes map too, e.g. the mmapped
+    indexes) and private (what this process alone costs).
+    """
+    fields = {"Rss:": "rss", "Pss:": "pss", "Shared_Clean:": "shared", "Shared_Dirty:": "shared",
+              "Private_Clean:": "private", "Private_Dirty:": "private"}
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as smaps:
+            for line in smaps:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    name = fields[parts[0]]
+                    memory[name] = memory.get(name, 0) + int(parts[1]) * 1024
+    except OSError:
+        pass
+    return memory
+
+# stage -> seconds of the request being served, None outside a request
+_request_timings = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> dict:
+    """Begin collecting stage timings for the current request (context), returns the dict they land in."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def request_timings():
+    return _request_timings.get()
+
+def add_request_timings(timings: dict):
+    """Merge timings measured elsewhere (e.g. in a shared batch) into the current request's."""
+    current = _request_timings.get()
+    if current is not None and timings:
+        for stage, elapsed in timings.items():
+            current[stage] = current.get(stage, 0.0) + elapsed
+
+def collect_timings(fn, *args, **kwargs):
+    """Run fn in its own timings scope, returns (result, {stage: seconds}), for work shared by several requests."""
+    token = _request_timings.set({})
+    try:
+        result = fn(*args, **kwargs)
+        return result, _request_timings.get()
+    finally:
+        _request_timings.reset(token)
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into the stage histogram and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe("qna_stage_seconds", elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def server_timing_header(timings: dict, total: float = None) -> str:
+    """Server-Timing header value, durations in ms."""
+    entries = [f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
@@ -1,13 +1,22 @@
 import numpy as np
 
 def normalize_scores(scores) -> np.ndarray:
-    """A normalizer made for the doc_scores (array)"""
+    """A normalizer made for the doc_scores (array), a 2D array (one row per query) is normalized row by row"""
     scores = np.array(scores, dtype=float)
-    max_v = scores.max()
-    min_v = scores.min()
-    if max_v == min_v:
-        # this is to avoid 0 division, return an array of same dimension of 1s
-        return np.ones_like(scores)
+    max_v = scores.max(axis=-1, keepdims=True)
+    min_v = scores.min(axis=-1, keepdims=True)
     range_v = max_v - min_v
+    # this is to avoid 0 division, rows where every score is the same become 1s
+    flat_rows = range_v == 0
+    range_v = np.where(flat_rows, 1, range_v)
 
-    return (scores - min_v) / range_v
\ No newline at end of file
+    return np.where(flat_rows, 1.0, (scores - min_v) / range_v)
+
+def standardize_scores(scores) -> np.ndarray:
+    """z-scores ((score - mean) / std), row by row for a 2D array, rows where every score is the same become 0s"""
+    scores = np.array(scores, dtype=float)
+    mean_v = scores.mean(axis=-1, keepdims=True)
+    std_v = scores.std(axis=-1, keepdims=True)
+    flat_rows = std_v == 0
+
+    return np.where(flat_rows, 0.0, (scores - mean_v) / np.where(flat_rows, 1, std_v))
@@ -0,0 +1,122 @@
+import os, sys, threading, time
+from collections import Counter, deque
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests, off unless enabled (at startup or at runtime through the API).
+    While enabled one background thread samples the stack of every other thread each `interval_ms` into a ring
+    buffer. When a request finishes slower than `slow_ms`, the samples taken during it are written as collapsed
+    stacks ("frame;frame;frame count" lines, what flamegraph.pl / speedscope read) to `output_dir`.
+    The request only copies its samples out of the buffer, the sampling thread counts and writes them between two
+    samples: under overload every request is slow, writing on the event loop would stall it further. Profiles
+    queued past `max_pending` are dropped.
+    """
+
+    def __init__(self, interval_ms: float = 5, slow_ms: float = 500, output_dir: str = "profiles", max_samples: int = 50000,
+                 max_pending: int = 64):
+        self.interval = interval_ms / 1000
+        self.slow_ms = slow_ms
+        self.output_dir = output_dir
+        self.max_pending = max_pending
+        self.profiles_written = 0
+        self.profiles_dropped = 0
+
+        self._samples = deque(maxlen=max_samples) # (perf_counter, collapsed stack), oldest first
+        self._pending = deque() # (name, started, finished, stacks) of slow requests still to write
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def enable(self, slow_ms: float = None, interval_ms: float = None):
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if interval_ms is not None:
+            self.interval = interval_ms / 1000
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+
+    def disable(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._write_pending() # queued after the thread's last pass
+            with self._lock:
+                self._samples.clear()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            stacks = [_collapse(frame) for thread_id, frame in sys._current_frames().items() if thread_id != own_id]
+            with self._lock:
+                self._samples.extend((now, stack) for stack in stacks)
+            self._write_pending()
+
+    def request_finished(self, name: str, started: float, finished: float) -> bool:
+        """
+        Called with perf_counter timestamps at the end of every request, queues a profile if it was slow.
+        Only copies the request's samples (walking back from the newest), returns True if a profile was queued.
+        """
+        if self._thread is None or (finished - started) * 1000 < self.slow_ms:
+            return False
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.profiles_dropped += 1
+                return False
+            stacks = []
+            for sampled_at, stack in reversed(self._samples):
+                if sampled_at < started:
+                    break
+                if sampled_at <= finished:
+                    stacks.append(stack)
+            if not stacks:
+                return False
+            self._pending.append((name, started, finished, stacks))
+        return True
+
+    def _write_pending(self):
+        """Count and write the queued profiles (on the sampling thread)."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                name, started, finished, stacks = self._pending.popleft()
+            os.makedirs(self.output_dir, exist_ok=True)
+            safe_name = "".join(char if char.isalnum() else "_" for char in name.strip("/")) or "request"
+            # the count keeps profiles written in the same millisecond apart
+            path = os.path.join(
+                self.output_dir,
+                f"{int(time.time() * 1000)}-{self.profiles_written}-{safe_name}-{(finished - started) * 1000:.0f}ms.folded"
+            )
+            with open(path, "w", encoding="utf-8") as profile:
+                for stack, count in Counter(stacks).most_common():
+                    profile.write(f"{stack} {count}\n")
+            self.profiles_written += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "slow_ms": self.slow_ms,
+            "interval_ms": self.interval * 1000,
+            "buffered_samples": len(self._samples),
+            "profiles_written": self.profiles_written,
+            "profiles_dropped": self.profiles_dropped,
+            "output_dir": self.output_dir
+        }
+
+
+def _collapse(frame) -> str:
+    """Root first `file:function:line;...` form of a thread's stack."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
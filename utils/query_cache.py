@@ -0,0 +1,163 @@
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+from utils.common_utils import CORPUS_VERSION_PATH, read_corpus_version
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace insensitive form of a query, so trivially different spellings share an entry."""
+    return " ".join(query.casefold().split())
+
+def make_cache_key(query: str, mode: str, k: int, **params) -> str:
+    """Cache key from the normalized query, mode, k and any other option that changes the result."""
+    key_parts = {"query": normalize_query(query), "mode": mode, "k": k, **params}
+    return json.dumps(key_parts, sort_keys=True)
+
+
+class CorpusVersionWatcher:
+    """Tells a cache when ingestion stamped a new corpus version (a cheap stat unless the stamp file changed)."""
+
+    def __init__(self, version_path: str = CORPUS_VERSION_PATH):
+        self.version_path = version_path
+        self.version = None
+        self._mtime = None
+
+    def changed(self) -> bool:
+        try:
+            mtime = os.stat(self.version_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and self.version is not None:
+            return False
+
+        self._mtime = mtime
+        version = read_corpus_version(self.version_path)
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+
+class QueryCache:
+    """
+    In-process LRU cache for /ask responses with an optional TTL and an optional on-disk (SQLite) tier.
+    Every entry belongs to a corpus version, when ingestion stamps a new one all entries are dropped.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = None, disk_path: str = None,
+                 version_path: str = CORPUS_VERSION_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_path = version_path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict() # key -> (created_at, value), oldest first
+        self._lock = threading.Lock()
+        self._corpus = CorpusVersionWatcher(version_path)
+        self.corpus_version = None
+
+        self._disk = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_cache (
+                cache_key TEXT PRIMARY KEY,
+                corpus_version TEXT,
+                created_at REAL,
+                value TEXT
+                );
+                """
+            )
+            self._disk.commit()
+
+        self._check_corpus_version()
+
+    def _check_corpus_version(self):
+        """Clear everything if ingestion wrote a new corpus version stamp."""
+        if self._corpus.changed():
+            self.corpus_version = self._corpus.version
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM query_cache WHERE corpus_version != ?", (self.corpus_version,))
+                self._disk.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str):
+        """Cached value for a key or None, counts a hit/miss."""
+        with self._lock:
+            self._check_corpus_version()
+
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT created_at, value FROM query_cache WHERE cache_key = ? AND corpus_version = ?",
+                    (key, self.corpus_version)
+                ).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    value = json.loads(row[1])
+                    self._put_in_memory(key, row[0], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        """Store a (JSON serializable) value under a key."""
+        with self._lock:
+            self._check_corpus_version()
+            created_at = time.time()
+            self._put_in_memory(key, created_at, value)
+
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO query_cache (cache_key, corpus_version, created_at, value) VALUES (?, ?, ?, ?)",
+                    (key, self.corpus_version, created_at, json.dumps(value, default=float))
+                )
+                self._disk.commit()
+
+    def _put_in_memory(self, key: str, created_at: float, value):
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM query_cache")
+                self._disk.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "corpus_version": self.corpus_version
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
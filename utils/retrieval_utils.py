@@ -1,7 +1,13 @@
 import re
+from functools import lru_cache
 # for word completion fixing
 from spellchecker import SpellChecker
 
+@lru_cache(maxsize=1)
+def get_spell_checker() -> SpellChecker:
+    """Load the spellchecker dictionary once per process, it's by far the slowest part of formatting."""
+    return SpellChecker()
+
 def format_answer(text:str, n_sentences:int=2, minimum_word_count:int=4) -> str:
     """Format out a 2-3 sentence answer from the provided document text"""
     formatted_answer = []
@@ -27,7 +33,7 @@ def fix_first_word_cutoff(text: str) -> str:
     # If first word starts with lowercase and is likely a cutoff, try to fix it
     # i.e. its not a proper noun or acronym
     if first_word[0].islower() and len(first_word) > 2:
-        spell = SpellChecker()
+        spell = get_spell_checker()
         clean_word = "".join(ch for ch in first_word if ch.isalpha())
         
         if clean_word.lower() not in spell:
@@ -41,6 +47,54 @@ def fix_first_word_cutoff(text: str) -> str:
     return " ".join(words)
 
 
+def build_snippet(text: str) -> str:
+    """The 2 sentence, first-word-repaired answer snippet for one chunk, computed at ingestion and stored with it."""
+    return fix_first_word_cutoff(format_answer(text, n_sentences=2))
+
+
+def ranked_chunks(result, limit: int = 3) -> list:
+    """
+    The top `limit` chunks of a search result in rank order, as [(doc, meta, score), ...].
+    `result` is either hybrid_reranking's [(doc, meta, score), ...] or a cosine_search result dict
+    ('documents' / 'metadatas' / 'distances'), whose distances are flipped into scores (1 - dist).
+    """
+    if isinstance(result, list):
+        # Format from hybrid_reranking
+        return result[:limit]
+
+    # Format from baseline search
+    docs = result.get('documents', [[]])[0][:limit]
+    metas = result.get('metadatas', [[]])[0][:limit]
+    distances = result.get('distances', [[]])[0][:limit]
+    return [(doc, meta, 1 - dist) for doc, meta, dist in zip(docs, metas, distances)]
+
+
+def build_citation(doc: str, meta: dict, score) -> tuple:
+    """(answer snippet, citation) for one ranked chunk."""
+    # snippets are precomputed at ingestion, only chunks ingested before that get formatted here
+    answer = meta['snippet'] if 'snippet' in meta else build_snippet(doc)
+
+    citation = {
+        'chunk_id': meta.get('chunk_id', 'Unknown'),
+        'src_id': meta.get('source_id', 'unknown'),
+        'title': meta.get('title', 'Unknown Document'),
+        'url': meta.get('url', ''),
+        'score': score
+    }
+    # [start, end) of the chunk in its source's cleaned text, for chunks ingested with offsets
+    if 'chunk_start' in meta:
+        citation['span'] = [meta['chunk_start'], meta['chunk_end']]
+    # the same passage (near duplicates collapsed at ingestion) also appears in these sources
+    if meta.get('alt_source_ids'):
+        citation['alt_src_ids'] = list(meta['alt_source_ids'])
+    return answer, citation
+
+
+def combine_answer(snippets) -> str:
+    """Join the per chunk snippets and shorten them further for readability (citations are kept as they are)."""
+    return format_answer(' '.join(snippets))
+
+
 def query_result_with_citations(result) -> dict:
     """
     Format an answer + citation from top 3 results.
@@ -57,54 +111,19 @@ def query_result_with_citations(result) -> dict:
             'scores': list
         }
     """
-    # Handle different input formats
-    if isinstance(result, list):
-        # Format from hybrid_reranking
-        if not result:
-            return {'answer': None, 'citations': [], 'scores': []}
-        
-        top_chunks = result[:3]
-        docs = [chunk[0] for chunk in top_chunks]
-        metas = [chunk[1] for chunk in top_chunks]
-        scores = [chunk[2] for chunk in top_chunks]
-    else:
-        # Format from baseline search
-        docs = result.get('documents', [[]])[0][:3]
-        metas = result.get('metadatas', [[]])[0][:3]
-        distances = result.get('distances', [[]])[0][:3]
-        scores = [1 - dist for dist in distances]
-    
-    if not docs:
+    top_chunks = ranked_chunks(result)
+    if not top_chunks:
         return {'answer': None, 'citations': [], 'scores': []}
-    
-    # Process multiple chunks
+
     formatted_answers = []
     citations = []
-    
-    for doc, meta, score in zip(docs, metas, scores):
-        # Format answer and fix text issues
-        answer = format_answer(doc, n_sentences=2)
-        answer = fix_first_word_cutoff(answer)
+    for doc, meta, score in top_chunks:
+        answer, citation = build_citation(doc, meta, score)
         formatted_answers.append(answer)
-        
-        # Create citation for this chunk
-        citation = {
-            'chunk_id': meta.get('chunk_id', 'Unknown'),
-            'src_id': meta.get('source_id', 'unknown'),
-            'title': meta.get('title', 'Unknown Document'), 
-            'url': meta.get('url', ''),
-            'score': score
-        }
         citations.append(citation)
-    
-    # Combine all answers
-    final_answer = ' '.join(formatted_answers)
-
-    # shorten the answer further for readability but retain citations.
-    short_answer = format_answer(final_answer)
 
     return {
-        'answer': short_answer,
+        'answer': combine_answer(formatted_answers),
         'citations': citations,
-        'scores': scores
+        'scores': [score for _, _, score in top_chunks]
     }
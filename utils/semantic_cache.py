@@ -0,0 +1,121 @@
+import json, threading
+from utils.common_utils import CORPUS_VERSION_PATH
+from utils.query_cache import CorpusVersionWatcher
+
+def semantic_scope(mode: str, k: int, **params) -> str:
+    """Everything but the query that changes a response, cached queries only answer queries with the same scope."""
+    return json.dumps({"mode": mode, "k": k, **params}, sort_keys=True)
+
+
+class SemanticQueryCache:
+    """
+    Near duplicate query cache ("What is OSHA?" / "what's osha"): responses are stored under the query's embedding
+    and a lookup answers from the most similar cached query of the same scope if their cosine similarity is at least
+    `threshold`. The embeddings live in one fixed (max_entries x dim) matrix, a lookup is one matrix-vector product
+    and a full cache overwrites its least recently used slot. Cleared whenever ingestion stamps a new corpus version.
+    numpy is only imported once a cache is created (by the API's warm up), `semantic_scope` alone doesn't need it.
+    """
+
+    def __init__(self, max_entries: int = 1024, threshold: float = 0.95, version_path: str = CORPUS_VERSION_PATH):
+        import numpy as np
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.similarity_sum = 0.0 # over hits
+
+        self._lock = threading.Lock()
+        self._corpus = CorpusVersionWatcher(version_path)
+        self._vectors = None # allocated on the first set, once the embedding size is known
+        self._scope_ids = np.full(max_entries, -1, dtype=np.int64) # -1 = empty slot
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._values = [None] * max_entries
+        # scope -> id, only for scopes some slot holds, so varying k/alpha/sources can't grow it past max_entries
+        self._scopes = {}
+        self._scope_names = {} # id -> scope
+        self._next_scope_id = 0
+        self._clock = 0
+        self._corpus.changed()
+
+    def _check_corpus_version(self):
+        if self._corpus.changed():
+            self._scope_ids[:] = -1
+            self._values = [None] * self.max_entries
+            self._scopes.clear()
+            self._scope_names.clear()
+
+    @staticmethod
+    def _normalize(embedding):
+        import numpy as np
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def get(self, embedding, scope: str):
+        """Response of the closest cached query with the same scope if it is similar enough, else None."""
+        import numpy as np
+        with self._lock:
+            self._check_corpus_version()
+            scope_id = self._scopes.get(scope)
+            if self._vectors is None or scope_id is None:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors @ self._normalize(embedding)
+            similarities[self._scope_ids != scope_id] = -np.inf
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._clock += 1
+            self._last_used[slot] = self._clock
+            self.hits += 1
+            self.similarity_sum += float(similarities[slot])
+            return self._values[slot]
+
+    def set(self, embedding, scope: str, value):
+        """Cache a response under its query embedding, in an empty slot or the least recently used one."""
+        import numpy as np
+        embedding = self._normalize(embedding)
+        with self._lock:
+            self._check_corpus_version()
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+
+            empty = np.flatnonzero(self._scope_ids < 0)
+            if len(empty):
+                slot = int(empty[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            evicted_scope_id = int(self._scope_ids[slot])
+            scope_id = self._scopes.get(scope)
+            if scope_id is None:
+                scope_id = self._scopes[scope] = self._next_scope_id
+                self._scope_names[scope_id] = scope
+                self._next_scope_id += 1
+
+            self._clock += 1
+            self._vectors[slot] = embedding
+            self._scope_ids[slot] = scope_id
+            # the evicted query's scope goes once no other slot holds it
+            if evicted_scope_id >= 0 and evicted_scope_id != scope_id and not np.any(self._scope_ids == evicted_scope_id):
+                del self._scopes[self._scope_names.pop(evicted_scope_id)]
+            self._last_used[slot] = self._clock
+            self._values[slot] = value
+
+    def stats(self) -> dict:
+        import numpy as np
+        lookups = self.hits + self.misses
+        return {
+            "entries": int(np.count_nonzero(self._scope_ids >= 0)),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mean_hit_similarity": self.similarity_sum / self.hits if self.hits else 0.0
+        }
@@ -1,22 +1,32 @@
-from chromadb import PersistentClient
 from collections import defaultdict
 from utils.retrieval_utils import query_result_with_citations
+from vector_db.retrieval_service import get_retrieval_service
+from utils.instrumentation import METRICS, span
 
-# like in ingestion we can query chromadb directly and it will embed our query text automatically using all-MiniLM
+# the retrieval service keeps the collection and all-MiniLM open, so we don't reopen chroma on every query
 
-def cosine_search(query: str, k: int):
-    client = PersistentClient(path="chroma_db")
-    collection = client.get_collection("qna_data")
-
-    results = collection.query(
-        query_texts=[query],
-        n_results=k,
-        include=["metadatas", "documents", "distances"]
-    )
+def cosine_search(query: str, k: int, service=None, quantization: str = None, sources=None):
+    # quantization ("int8" / "binary") searches the quantized codes and rescores exactly, numpy backend only
+    # sources (resolved source ids) limits the search to those sources' chunks
+    service = service or get_retrieval_service()
+    results = service.query([query], k, quantization=quantization, sources=sources)
 
     return results
 
+def slice_query_result(results, row: int, k: int):
+    """Pull one query's top-k out of a multi-query chroma result, keeping the same 2D layout cosine_search returns."""
+    return {
+        key: [results[key][row][:k]]
+        for key in ("ids", "documents", "metadatas", "distances")
+    }
+
 def filter_results_by_threshold(results, threshold:float=0.9):
+    with span("filter"):
+        filtered = _filter_results_by_threshold(results, threshold)
+    METRICS.observe("qna_vector_candidates", len(filtered["documents"][0]))
+    return filtered
+
+def _filter_results_by_threshold(results, threshold:float):
 
     filtered_results = defaultdict(list)
 
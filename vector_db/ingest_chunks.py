@@ -1,68 +1,234 @@
-from utils.common_utils import get_conn_and_cursor, load_data_source
+import argparse, os, queue, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.common_utils import get_conn_and_cursor, load_data_source, write_corpus_version
+from chunk_db.schema import DB_PATH, create_schema
 from typing import Tuple
 from chromadb import PersistentClient
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
 from tqdm import tqdm
+from hybrid_reranker.bm25_index import build_bm25_index
+from vector_db.vector_backends import NUMPY_INDEX_PATH, QUANTIZATIONS, export_numpy_index, exported_quantizations
+from vector_db.retrieval_service import VECTOR_DB_PATH, COLLECTION_NAME
+from utils.retrieval_utils import build_snippet
 
 # NOTE : since we're using chromadb and it uses all-MiniLM-L6-v2 as the default embedding model
 # we don't need sentence-transformers and its dependencies.
 
-DB_PATH = "chunk_db/document_chunks.db"
 SOURCES = load_data_source()
-    
-def load_chunks_from_db():
-    """Fetch all chunk rows from Chunk DB"""
+# group sources by src_id once, now we dont have to loop and check (or rebuild this) per chunk
+SOURCES_BY_ID = {src["id"]: src for src in SOURCES}
+
+# rows per embedding batch (one model call), and embedding batches computed at once
+EMBED_BATCH_SIZE = 128
+EMBED_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+
+def load_chunks_from_db(pending_only: bool = False):
+    """
+    Fetch all canonical chunk rows from Chunk DB (near duplicates are left out of the indexes),
+    or only the ones that are new/changed since they were last embedded
+    """
     try:
         conn, cur = get_conn_and_cursor(DB_PATH)
-        cur.execute("SELECT chunk_id, chunk_src, chunk FROM document_chunks;")
+        # upgrades Chunk DBs from before snippets/hashes were stored
+        create_schema(cur)
+        conn.commit()
+        query = "SELECT chunk_id, chunk_src, chunk, snippet, chunk_start, chunk_end, alt_sources FROM document_chunks WHERE duplicate_of IS NULL"
+        if pending_only:
+            query += " AND embedded_hash IS NOT chunk_hash"
+        cur.execute(query + ";")
         rows = cur.fetchall()
         conn.close()
         return rows
     except Exception as e:
         print(f"Encountered an issue loading chunks from {DB_PATH} : {e}")
         return []
-    
-def create_metadata(chunk_id: int, source_id: str):
-    """Create a metadata object for a source ID (as structured in the sources file)"""
 
-    # group sources by src_id for efficiency, now we dont have to loop and check
-    source_grouped = {src["id"]: src for src in SOURCES}
-    source_info = source_grouped.get(source_id, {})
-    return {
+def iter_chunk_batches(batch_size: int = EMBED_BATCH_SIZE, pending_only: bool = False):
+    """Stream chunk rows from Chunk DB in batches with a cursor instead of loading them all (see load_chunks_from_db)"""
+    conn, cur = get_conn_and_cursor(DB_PATH)
+    try:
+        create_schema(cur)
+        conn.commit()
+        query = "SELECT chunk_id, chunk_src, chunk, snippet, chunk_start, chunk_end, alt_sources FROM document_chunks WHERE duplicate_of IS NULL"
+        if pending_only:
+            query += " AND embedded_hash IS NOT chunk_hash"
+        cur.execute(query + " ORDER BY chunk_id;")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+def load_deleted_chunk_ids():
+    """Chunk ids chunk ingestion removed (or collapsed as near duplicates), whose vectors still sit in Chroma"""
+    conn, cur = get_conn_and_cursor(DB_PATH)
+    # first thing the embedding run reads, so this is where older Chunk DBs get upgraded
+    create_schema(cur)
+    conn.commit()
+    chunk_ids = [row[0] for row in cur.execute("SELECT chunk_id FROM deleted_chunks;")]
+    conn.close()
+    return chunk_ids
+
+def mark_chunks_embedded(chunk_ids, deleted_ids):
+    """Record that these chunks are in Chroma as they are now and forget the deleted ids we just removed"""
+    conn, cur = get_conn_and_cursor(DB_PATH)
+    cur.executemany("UPDATE document_chunks SET embedded_hash = chunk_hash WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+    cur.executemany("DELETE FROM deleted_chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in deleted_ids])
+    conn.commit()
+    conn.close()
+    
+def create_metadata(chunk_id: int, source_id: str, snippet: str = None, chunk_start: int = None, chunk_end: int = None,
+                    alt_source_ids=None):
+    """
+    Create a metadata object for a source ID (as structured in the sources file), plus the chunk's answer snippet,
+    its offsets in the source text and the other sources its near duplicates came from
+    """
+    source_info = SOURCES_BY_ID.get(source_id, {})
+    metadata = {
         "chunk_id" : chunk_id,
         "source_id" : source_id,
         "title" : source_info.get("title", f"Unknown source {source_id}"),
         "url" : source_info.get("url", "")
     }
+    if snippet is not None:
+        metadata["snippet"] = snippet
+    # chunks ingested before offsets were stored have none
+    if chunk_start is not None and chunk_end is not None:
+        metadata["chunk_start"] = chunk_start
+        metadata["chunk_end"] = chunk_end
+    # a list, so scoped queries can match it with chroma's $contains
+    if alt_source_ids:
+        metadata["alt_source_ids"] = list(alt_source_ids)
+    return metadata
 
 
-def encode_and_add_to_chroma(rows: Tuple[int, str, str]):
-    """We use ChromaDB to embed the chunk rows and add them to a persistent DB on disk."""
-    VECTOR_DB_PATH = "chroma_db"
-    docs, metas, ids = [], [], []
-    chroma_client = PersistentClient(path=VECTOR_DB_PATH)
+def chunk_metadata(row: Tuple[int, str, str, str, int, int, str]):
+    """Metadata for a chunk row, rows from before snippets were stored in the Chunk DB get theirs computed now"""
+    chunk_id, chunk_src, chunk, snippet, chunk_start, chunk_end, alt_sources = row
+    return create_metadata(
+        chunk_id, chunk_src, snippet if snippet is not None else build_snippet(chunk), chunk_start, chunk_end,
+        alt_sources.split(",") if alt_sources else None
+    )
 
-    for chunk_id, chunk_src, chunk in rows:
-        docs.append(chunk)
-        metas.append(create_metadata(chunk_id, chunk_src))
-        ids.append(str(chunk_id))
 
-    # in case of default embedding, we dont need to provide it anything for embedding_function
+def encode_and_add_to_chroma(row_batches, deleted_ids=(), workers: int = EMBED_WORKERS, embedding_function=None):
+    """
+    Embed batches of chunk rows and upsert them with their precomputed embeddings into a persistent ChromaDB on disk,
+    vectors of deleted chunks are removed first. Batches are embedded by a pool of `workers` threads (the ONNX model
+    releases the GIL) while a separate writer thread upserts the finished ones, so embedding and Chroma's indexing overlap.
+    Returns (ids of the chunks that made it into Chroma, True if everything did).
+    """
+    chroma_client = PersistentClient(path=VECTOR_DB_PATH)
+    # same model as chroma's default embedding function, one instance for the whole run
+    embedding_function = embedding_function or ONNXMiniLM_L6_V2()
+    written_ids = []
+
     try:
-        vector_store = chroma_client.create_collection("qna_data")
-        # we couldn't see any progress + dataset is large so batching is a good fix
-
-        for i in tqdm(range(0, len(docs), 200), desc="Adding docs to ChromaDB"):
-            batch_ids, batch_metas, batch_docs = ids[i:i+200], metas[i:i+200], docs[i:i+200]
-            vector_store.add(
-            ids= batch_ids,
-            documents= batch_docs,
-            metadatas=batch_metas
-            )
-
-        print(f"Embedded and added {len(docs)} documents to ChromaDB and saved at {VECTOR_DB_PATH}")
+        # re-runs reuse the collection, upsert only (re-)embeds the rows we were given
+        vector_store = chroma_client.get_or_create_collection(COLLECTION_NAME)
+        if deleted_ids:
+            vector_store.delete(ids=[str(chunk_id) for chunk_id in deleted_ids])
+            print(f"Deleted {len(deleted_ids)} stale vectors from ChromaDB")
+
+        # bounded, so embedding never runs too far ahead of the writer
+        write_queue = queue.Queue(maxsize=workers * 2)
+        write_errors = []
+        progress = tqdm(desc="Adding docs to ChromaDB", unit="chunk")
+
+        def write_batches():
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    return
+                if write_errors:
+                    continue # keep draining so the embedding side never blocks
+                rows, embeddings = item
+                try:
+                    vector_store.upsert(
+                    ids=[str(row[0]) for row in rows],
+                    embeddings=embeddings,
+                    documents=[row[2] for row in rows],
+                    metadatas=[chunk_metadata(row) for row in rows]
+                    )
+                    written_ids.extend(row[0] for row in rows)
+                    progress.update(len(rows))
+                except Exception as e:
+                    write_errors.append(e)
+
+        # the model (and its tokenizer and ONNX session) loads lazily on the first call, without a lock, so load it
+        # here once instead of letting every worker race to do it
+        embedding_function(["warm up"])
+
+        writer = threading.Thread(target=write_batches, name="chroma-writer", daemon=True)
+        writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+                in_flight = deque() # (rows, embedding future), in row order
+                for rows in row_batches:
+                    in_flight.append((rows, pool.submit(embedding_function, [row[2] for row in rows])))
+                    if len(in_flight) >= workers:
+                        rows, embeddings = in_flight.popleft()
+                        write_queue.put((rows, embeddings.result()))
+                    if write_errors:
+                        break
+                while in_flight and not write_errors:
+                    rows, embeddings = in_flight.popleft()
+                    write_queue.put((rows, embeddings.result()))
+        finally:
+            write_queue.put(None)
+            writer.join()
+            progress.close()
+        if write_errors:
+            raise write_errors[0]
+
+        print(f"Embedded and added {len(written_ids)} documents to ChromaDB and saved at {VECTOR_DB_PATH}")
+        return written_ids, True
     except Exception as e:
         print(f"Encountered an issue while embedding and ingesting docs : {e}")
+        return written_ids, False
+
+def rebuild_search_indexes(numpy_index: bool = False, quantizations=()):
+    """
+    Rebuild the indexes derived from the whole corpus once Chroma is up to date: the BM25 index (and its source
+    partitions) and the numpy export (with numpy_index=True, or if there is one already), before the run stamps
+    a new corpus version.
+    """
+    # BM25 is cheap to rebuild and its IDF depends on the whole corpus anyway
+    all_rows = load_chunks_from_db()
+    build_bm25_index(
+        [row[2] for row in all_rows],
+        [chunk_metadata(row) for row in all_rows]
+    )
+    # an existing export is refreshed too, so the numpy backend never serves an older corpus than chroma
+    if numpy_index or os.path.isdir(NUMPY_INDEX_PATH):
+        export_numpy_index(
+            PersistentClient(path=VECTOR_DB_PATH).get_collection(COLLECTION_NAME),
+            quantizations=set(quantizations) | set(exported_quantizations())
+        )
 
 if __name__ == '__main__':
-    rows = load_chunks_from_db()
-    encode_and_add_to_chroma(rows)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Embed the Chunk DB into ChromaDB and build the BM25 index")
+    parser.add_argument("--incremental", action="store_true", help="only embed new/changed chunks and delete vectors of removed ones")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help=f"chunks per embedding batch (default: {EMBED_BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help=f"batches embedded concurrently (default: {EMBED_WORKERS})")
+    parser.add_argument("--numpy-index", action="store_true", help=f"also export the embeddings for the numpy vector backend to {NUMPY_INDEX_PATH}/")
+    parser.add_argument("--quantize", nargs="+", choices=QUANTIZATIONS, default=[], help="with --numpy-index, also store int8 and/or binary codes for quantized search")
+    args = parser.parse_args()
+    if args.quantize and not args.numpy_index:
+        parser.error("--quantize needs --numpy-index")
+
+    deleted_ids = load_deleted_chunk_ids()
+    row_batches = iter_chunk_batches(args.batch_size, pending_only=args.incremental)
+    written_ids, complete = encode_and_add_to_chroma(row_batches, deleted_ids, workers=args.workers)
+    row_batches.close() # ends the read transaction if the pipeline stopped early
+    # whatever made it in is recorded, an interrupted run picks up the rest with --incremental
+    mark_chunks_embedded(written_ids, deleted_ids if complete else ())
+
+    rebuild_search_indexes(args.numpy_index, args.quantize)
+
+    # invalidates any cached /ask results
+    if written_ids or deleted_ids:
+        write_corpus_version()
@@ -0,0 +1,100 @@
+import asyncio, time
+from vector_db.baseline_search import slice_query_result
+from utils.instrumentation import add_request_timings, collect_timings, span
+
+class QueryBatcher:
+    """
+    Coalesces queries that arrive within a small window (or until the batch is full) into one
+    embedding forward pass and one multi-row `collection.query` (one per source scope), then hands each caller its own rows.
+    With a semantic cache, every query is looked up by its embedding first and only the misses are searched.
+    """
+
+    def __init__(self, service, max_wait_ms: float = 5, max_batch_size: int = 32, executor=None, semantic_cache=None):
+        self.service = service
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        # where the blocking embed + query runs, None is the loop's default thread pool
+        self.executor = executor
+        self.semantic_cache = semantic_cache
+        self.batches = 0
+        self.batched_queries = 0
+
+        self._pending = [] # (query, k, semantic cache scope, source scope, future)
+        self._flush_timer = None
+
+    async def search(self, query: str, k: int, sources=None):
+        """Same result as `cosine_search(query, k, sources=sources)`, but shares the model/index call with concurrent queries."""
+        _, vector_results, _ = await self.search_or_cached(query, k, sources=sources)
+        return vector_results
+
+    async def search_or_cached(self, query: str, k: int, scope: str = None, sources=None):
+        """
+        (cached response, vector results, query embedding): a semantic cache hit for `scope` comes back as the cached
+        response (and no vector results, the search was skipped), otherwise the search results (limited to
+        `sources`, resolved source ids, if given). The embedding is what the caller caches its response under.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, k, scope, sources, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.max_wait, self._flush)
+
+        started = time.perf_counter()
+        result, batch_timings = await future
+        # the batch's embed/search time counts for every query in it, whatever is left over was spent waiting for it
+        waited = time.perf_counter() - started - sum(batch_timings.values())
+        add_request_timings({"batch_wait": max(waited, 0.0), **batch_timings})
+        return result
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    def _embed_and_search(self, batch):
+        """Blocking part of a batch: one embedding pass, semantic cache lookups, one backend query per source scope for the misses."""
+        embeddings = self.service.embed([query for query, _, _, _, _ in batch])
+        cached = [None] * len(batch)
+        if self.semantic_cache is not None:
+            with span("semantic_cache"):
+                cached = [
+                    self.semantic_cache.get(embedding, scope) if scope is not None else None
+                    for embedding, (_, _, scope, _, _) in zip(embeddings, batch)
+                ]
+
+        misses = {} # source scope -> rows that missed the cache
+        for row, response in enumerate(cached):
+            if response is None:
+                misses.setdefault(batch[row][3], []).append(row)
+        results = [(response, None, embedding) for response, embedding in zip(cached, embeddings)]
+        for sources, rows in misses.items():
+            # one query with the largest k, everyone else just takes their top rows
+            max_k = max(batch[row][1] for row in rows)
+            raw_results = self.service.search([embeddings[row] for row in rows], max_k, sources=sources)
+            for i, row in enumerate(rows):
+                results[row] = (None, slice_query_result(raw_results, i, batch[row][1]), embeddings[row])
+        return results
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        self.batches += 1
+        self.batched_queries += len(batch)
+
+        try:
+            results, timings = await loop.run_in_executor(self.executor, collect_timings, self._embed_and_search, batch)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for result, (*_, future) in zip(results, batch):
+            if not future.done(): # caller may have gone away (cancelled)
+                future.set_result((result, timings))
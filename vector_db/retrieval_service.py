@@ -0,0 +1,99 @@
+import os, threading
+from chromadb import PersistentClient
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+from hybrid_reranker.bm25_index import BM25_INDEX_PATH, load_bm25_index, load_bm25_partitions
+from vector_db.vector_backends import NUMPY_INDEX_PATH, ChromaBackend, NumpyBackend
+from utils.common_utils import CORPUS_VERSION_PATH
+from utils.instrumentation import span
+from utils.query_cache import CorpusVersionWatcher
+
+VECTOR_DB_PATH = "chroma_db"
+COLLECTION_NAME = "qna_data"
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+# NOTE : chroma's DefaultEmbeddingFunction builds a fresh ONNXMiniLM_L6_V2 (and reloads the model) on every call,
+# so we hold on to one instance ourselves and hand chroma the query embeddings directly.
+
+class RetrievalService:
+    """
+    Long-lived retrieval state: the vector backend (the Chroma collection, or the exported numpy matrix),
+    the loaded embedding model and the BM25 index (plus its per source partitions).
+    Ingestion rebuilds the BM25 index and the numpy export before it stamps a new corpus version, every search
+    first checks the stamp (a stat) and reopens them when it changed, like the caches drop their entries.
+    The Chroma collection isn't reopened, a server on the chroma backend has to be restarted after ingesting.
+    """
+
+    def __init__(self, vector_db_path: str = VECTOR_DB_PATH, collection_name: str = COLLECTION_NAME,
+                 embedding_function=None, bm25_index_path: str = BM25_INDEX_PATH, backend: str = "chroma",
+                 numpy_index_path: str = NUMPY_INDEX_PATH, quantization: str = None,
+                 version_path: str = CORPUS_VERSION_PATH):
+        if backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend {backend!r}, expected one of {VECTOR_BACKENDS}")
+        self.backend_name = backend
+        self.bm25_index_path = bm25_index_path
+        self.numpy_index_path = numpy_index_path
+        self.quantization = quantization
+        self.client, self.collection = None, None
+        # the indexes opened below are the current corpus version's
+        self._corpus = CorpusVersionWatcher(version_path)
+        self._corpus.changed()
+        self._reload_lock = threading.Lock()
+        if backend == "numpy":
+            # exact search over the memory-mapped export (or quantized search + rescoring), chroma isn't opened at all
+            self.backend = NumpyBackend(numpy_index_path, quantization=quantization)
+        else:
+            self.client = PersistentClient(path=vector_db_path)
+            # collection was created with chroma's default embedding function (all-MiniLM-L6-v2), same model as below
+            self.collection = self.client.get_collection(collection_name)
+            self.backend = ChromaBackend(self.collection)
+        self.embedding_function = embedding_function or ONNXMiniLM_L6_V2()
+        self._load_lexical_indexes()
+
+    def _load_lexical_indexes(self):
+        # corpus wide BM25 index (memory-mapped), None until ingestion has built one
+        lexical_index = load_bm25_index(self.bm25_index_path)
+        # source id -> BM25 index of just that source's chunks, for source scoped queries
+        self.lexical_partitions = load_bm25_partitions(self.bm25_index_path) if lexical_index is not None else {}
+        self.lexical_index = lexical_index
+
+    def refresh(self) -> bool:
+        """Reopen the BM25 index and the numpy export if ingestion stamped a new corpus version since they were opened."""
+        with self._reload_lock:
+            if not self._corpus.changed():
+                return False
+            self._load_lexical_indexes()
+            if self.backend_name == "numpy":
+                self.backend = NumpyBackend(self.numpy_index_path, quantization=self.quantization)
+            return True
+
+    def embed(self, queries):
+        """Embed a list of query texts in a single model forward pass."""
+        with span("embed"):
+            return self.embedding_function(queries)
+
+    def query(self, queries, k: int, quantization: str = None, sources=None):
+        """
+        Run one multi-row vector backend query for a list of query texts,
+        `quantization` ("int8"/"binary", numpy backend only) overrides the backend's default for this query,
+        `sources` (resolved source ids, see vector_db/source_filters.py) only searches those sources' chunks.
+        """
+        return self.search(self.embed(queries), k, quantization=quantization, sources=sources)
+
+    def search(self, query_embeddings, k: int, quantization: str = None, sources=None):
+        """Vector backend query for already embedded queries."""
+        self.refresh()
+        with span("vector_search"):
+            return self.backend.query(query_embeddings, k, quantization=quantization, sources=sources)
+
+
+_default_service = None
+
+def get_retrieval_service() -> RetrievalService:
+    """Process wide service for scripts and `__main__` blocks that don't go through the API lifespan."""
+    global _default_service
+    if _default_service is None:
+        _default_service = RetrievalService(
+            backend=os.getenv("QNA_VECTOR_BACKEND", "chroma"),
+            quantization=os.getenv("QNA_VECTOR_QUANTIZATION") or None
+        )
+    return _default_service
@@ -0,0 +1,35 @@
+from functools import lru_cache
+from utils.common_utils import load_data_source
+
+# Source scoped search: a query can be limited to some manuals (by source id or title). The scope is pushed down
+# into every index, a `where` clause on chroma, the source's row range of the numpy export and the source's own
+# BM25 partition, so a scoped query never scores chunks of other sources. A chunk whose near duplicates were
+# collapsed at ingestion belongs to its alternate sources too (`alt_source_ids`).
+
+@lru_cache(maxsize=1)
+def source_catalogue() -> dict:
+    """source id -> title, from the sources file ingestion builds the metadata from."""
+    return {source["id"]: source["title"] for source in load_data_source()}
+
+def resolve_sources(sources=None, titles=None):
+    """
+    Sorted tuple of the source ids a search is limited to: the given ids plus the sources with one of the given
+    titles (case insensitive), None when neither is given (the whole corpus). Unknown ids or titles raise ValueError.
+    """
+    if not sources and not titles:
+        return None
+    catalogue = source_catalogue()
+    unknown = [source_id for source_id in sources or () if source_id not in catalogue]
+    if unknown:
+        raise ValueError(f"Unknown source ids: {', '.join(unknown)}")
+
+    ids_by_title = {title.casefold(): source_id for source_id, title in catalogue.items()}
+    unknown = [title for title in titles or () if title.casefold() not in ids_by_title]
+    if unknown:
+        raise ValueError(f"Unknown source titles: {', '.join(unknown)}")
+
+    return tuple(sorted(set(sources or ()) | {ids_by_title[title.casefold()] for title in titles or ()}))
+
+def where_clause(sources) -> dict:
+    """Chroma metadata filter for a resolved source scope, chunks of those sources or with one as an alternate source."""
+    return {"$or": [{"source_id": {"$in": list(sources)}}] + [{"alt_source_ids": {"$contains": source_id}} for source_id in sources]}
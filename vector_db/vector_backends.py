@@ -0,0 +1,416 @@
+import json, mmap, os, shutil, tempfile
+import numpy as np
+from vector_db.source_filters import where_clause
+
+# Vector backends behind RetrievalService.query (and so cosine_search): they take query embeddings and return
+# chroma shaped results ({ids, documents, metadatas, distances}, one row per query) so everything downstream,
+# filter_results_by_threshold included, doesn't care which one answered.
+
+NUMPY_INDEX_PATH = "numpy_index"
+EMBEDDINGS_FILE = "embeddings.npy"     # (n_chunks x dim) float32, row i is chunk ids[i]
+SQUARED_NORMS_FILE = "squared_norms.npy" # ||x||^2 per row, so l2 distances don't need a pass over the matrix
+SIDECAR_FILE = "chunks.json"           # distance space, row count, the row range of every source, the rows
+                                       # each source shares as a collapsed near duplicate (alternate source)
+                                       # and the quantized copies written with the matrix
+CHUNKS_FILE = "chunks.jsonl"           # one {"id", "document", "metadata"} line per row, memory-mapped
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy" # byte offset of every line in CHUNKS_FILE, plus the end of the file
+EXPORT_PAGE_SIZE = 1000
+
+# quantized copies of the matrix, searched in memory to pick candidates that are then rescored on the float32 rows
+QUANTIZATIONS = ("int8", "binary")
+INT8_FILE = "embeddings_int8.npy"       # per dimension symmetric scalar quantization
+INT8_SCALES_FILE = "int8_scales.npy"
+BINARY_FILE = "embeddings_binary.npy"   # sign bits, 8 dimensions per byte
+# candidates rescored per result, binary codes lose a lot more than int8 so they need a bigger pool
+OVERSAMPLE = {"int8": 4, "binary": 10}
+# rows of int8 codes widened to float32 at a time when scoring, bounds the temporary copy
+INT8_SCORE_BLOCK = 16384
+# set bits of every byte value, for Hamming distances on the packed codes (numpy < 2 has no bitwise_count)
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+class ChromaBackend:
+    """Approximate (HNSW) search through the Chroma collection, the default backend."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_embeddings, k: int, quantization: str = None, sources=None):
+        # sources (resolved source ids) become a metadata pre-filter, chroma only searches the matching vectors
+        if quantization:
+            raise ValueError("Quantized search needs the numpy vector backend")
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=k,
+            where=where_clause(sources) if sources is not None else None,
+            include=["metadatas", "documents", "distances"]
+        )
+
+
+def collection_space(collection) -> str:
+    """Distance the collection was built with ('l2', 'cosine' or 'ip'), chroma defaults to squared l2."""
+    configuration = getattr(collection, "configuration", None) or {}
+    space = (configuration.get("hnsw") or {}).get("space")
+    return space or (collection.metadata or {}).get("hnsw:space", "l2")
+
+
+def quantize_int8(matrix):
+    """int8 codes and per dimension scales, x ~= codes * scales."""
+    scales = np.abs(matrix).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def quantize_binary(matrix):
+    """1 bit per dimension (its sign), packed 8 to a byte."""
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+def hamming_distances(codes, bits):
+    """Differing bits between every packed code row and one packed query code."""
+    if hasattr(np, "bitwise_count") and codes.shape[1] % 8 == 0:
+        # numpy >= 2 : xor/popcount 64 bits at a time
+        xor = np.bitwise_xor(codes.view(np.uint64), bits.view(np.uint64))
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[np.bitwise_xor(codes, bits)].sum(axis=1, dtype=np.int32)
+
+def exported_quantizations(index_path: str = NUMPY_INDEX_PATH):
+    """Quantized copies an existing export was written with (as its sidecar records them), so refreshing it keeps them."""
+    try:
+        with open(os.path.join(index_path, SIDECAR_FILE), "r", encoding="utf-8") as sidecar:
+            return [mode for mode in json.load(sidecar).get("quantizations", []) if mode in QUANTIZATIONS]
+    except (OSError, ValueError):
+        return []
+
+
+class ChunkStore:
+    """
+    ids, documents and metadatas of the exported rows, as JSON lines in one memory-mapped file. A row is only parsed
+    when a result needs it, so worker processes share the file's pages instead of each holding the whole corpus.
+    """
+
+    def __init__(self, index_path: str = NUMPY_INDEX_PATH):
+        self.offsets = np.load(os.path.join(index_path, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(index_path, CHUNKS_FILE), "rb") as chunks_file:
+            self._lines = mmap.mmap(chunks_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> dict:
+        return json.loads(self._lines[self.offsets[row]:self.offsets[row + 1]])
+
+
+def export_numpy_index(collection, index_path: str = NUMPY_INDEX_PATH, page_size: int = EXPORT_PAGE_SIZE, quantizations=()):
+    """
+    Copy every embedding of a Chroma collection into one contiguous float32 .npy matrix (written through a memmap,
+    page by page) plus the ids, documents and metadatas of its rows as a ChunkStore.
+    Rows are written grouped by source, so every source is one contiguous row range (its partition) that source
+    scoped queries scan on their own.
+    `quantizations` ("int8" and/or "binary") also writes quantized copies of the matrix.
+
+    Running workers have the current export's files memory-mapped, so they are never rewritten: the export goes to
+    a new directory next to `index_path`, which then becomes a symlink to it (swapped atomically with os.replace).
+    Workers keep reading the version they opened, the one it replaced is kept until the next export.
+    """
+    parent = os.path.dirname(os.path.abspath(index_path))
+    os.makedirs(parent, exist_ok=True)
+    export_path = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(index_path) + ".")
+    os.chmod(export_path, 0o755)
+    try:
+        exported = _write_numpy_index(collection, export_path, page_size, quantizations)
+    except BaseException:
+        shutil.rmtree(export_path, ignore_errors=True)
+        raise
+    if not exported:
+        shutil.rmtree(export_path, ignore_errors=True)
+        print(f"Collection is empty, nothing to export to {index_path}")
+        return
+    _swap_in(index_path, export_path)
+    print(f"Exported {exported} embeddings to {index_path}")
+
+
+def _swap_in(index_path: str, export_path: str):
+    """Point index_path at export_path, delete the versions older than the one it pointed at."""
+    parent, name = os.path.dirname(export_path), os.path.basename(index_path)
+    previous = os.path.realpath(index_path) if os.path.lexists(index_path) else None
+    if os.path.isdir(index_path) and not os.path.islink(index_path):
+        # an export from before exports were versioned, moved aside like any replaced version
+        previous = export_path + ".replaced"
+        os.rename(index_path, previous)
+
+    link = export_path + ".link"
+    os.symlink(os.path.basename(export_path), link)
+    os.replace(link, index_path)
+
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if (entry.startswith(name + ".") and os.path.isdir(path) and not os.path.islink(path)
+                and os.path.realpath(path) not in (os.path.realpath(export_path), previous)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_numpy_index(collection, index_path: str, page_size: int, quantizations) -> int:
+    """The export itself, into an empty directory. Returns the number of rows written (0 for an empty collection)."""
+    n_chunks = collection.count()
+    offsets = [0]
+    partitions = {} # source id -> [first row, end row)
+    alternates = {} # source id -> rows of other sources' chunks it has near duplicates of
+    matrix = None
+
+    # a metadata only pass for the source ids, then every source's chunks in turn
+    source_ids = set()
+    for offset in range(0, n_chunks, page_size):
+        source_ids.update(meta.get("source_id") for meta in collection.get(limit=page_size, offset=offset, include=["metadatas"])["metadatas"])
+    source_ids.discard(None)
+
+    with open(os.path.join(index_path, CHUNKS_FILE), "wb") as chunks_file:
+        for source_id in sorted(source_ids):
+            start = len(offsets) - 1
+            offset = 0
+            while True:
+                page = collection.get(
+                    where={"source_id": source_id}, limit=page_size, offset=offset,
+                    include=["embeddings", "documents", "metadatas"]
+                )
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                if matrix is None:
+                    matrix = np.lib.format.open_memmap(
+                        os.path.join(index_path, EMBEDDINGS_FILE), mode="w+", dtype=np.float32, shape=(n_chunks, embeddings.shape[1])
+                    )
+                matrix[len(offsets) - 1:len(offsets) - 1 + len(embeddings)] = embeddings
+                for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    for alt_source_id in metadata.get("alt_source_ids") or ():
+                        alternates.setdefault(alt_source_id, []).append(len(offsets) - 1)
+                    line = json.dumps({"id": chunk_id, "document": document, "metadata": metadata}).encode("utf-8") + b"\n"
+                    chunks_file.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            partitions[source_id] = [start, len(offsets) - 1]
+
+    if len(offsets) - 1 != n_chunks:
+        raise ValueError(f"{n_chunks - (len(offsets) - 1)} chunks in the collection have no source_id, they can't be exported by source")
+
+    if matrix is None:
+        return 0
+    matrix.flush()
+    np.save(os.path.join(index_path, SQUARED_NORMS_FILE), np.einsum("ij,ij->i", matrix, matrix))
+    if "int8" in quantizations:
+        codes, scales = quantize_int8(matrix)
+        np.save(os.path.join(index_path, INT8_FILE), codes)
+        np.save(os.path.join(index_path, INT8_SCALES_FILE), scales)
+    if "binary" in quantizations:
+        np.save(os.path.join(index_path, BINARY_FILE), quantize_binary(matrix))
+    del matrix
+
+    np.save(os.path.join(index_path, CHUNK_OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(index_path, SIDECAR_FILE), "w", encoding="utf-8") as sidecar:
+        json.dump({
+            "space": collection_space(collection), "count": len(offsets) - 1, "sources": partitions, "alternates": alternates,
+            "quantizations": sorted(mode for mode in QUANTIZATIONS if mode in quantizations)
+        }, sidecar)
+    return len(offsets) - 1
+
+
+class NumpyBackend:
+    """
+    Exact brute force search over the exported embedding matrix, memory-mapped read only: opening it is instant and
+    every worker process shares the same pages through the OS page cache. One matrix product scores all rows,
+    argpartition picks the top-k. Distances follow the collection's space so thresholds tuned on Chroma still hold.
+
+    With a quantization ("int8" or "binary") only the quantized codes are scanned: they pick an oversampled
+    candidate pool (int8 dot products / Hamming distances on the sign bits) which is rescored exactly against
+    the float32 rows, read from disk for just those candidates.
+
+    Everything is opened read only through mmap (codes and chunk text included), so N worker processes on one
+    host hold a single copy of the index in the page cache.
+
+    Rows are grouped by source, a source scoped query only scores (and pages in) the row ranges of its sources
+    (plus the rows its sources share as alternate sources of collapsed near duplicates).
+    """
+
+    def __init__(self, index_path: str = NUMPY_INDEX_PATH, quantization: str = None):
+        # the export version index_path points at now, codes loaded later come from the same one
+        self.index_path = os.path.realpath(index_path)
+        self.embeddings = np.load(os.path.join(self.index_path, EMBEDDINGS_FILE), mmap_mode="r")
+        self.squared_norms = np.load(os.path.join(self.index_path, SQUARED_NORMS_FILE), mmap_mode="r")
+        with open(os.path.join(self.index_path, SIDECAR_FILE), "r", encoding="utf-8") as sidecar:
+            info = json.load(sidecar)
+        if "count" not in info or "sources" not in info:
+            raise ValueError(f"{index_path} was exported in an older layout, re-export it with --numpy-index")
+        self.space = info["space"]
+        self.partitions = {source_id: tuple(rows) for source_id, rows in info["sources"].items()}
+        self.alternates = {source_id: np.array(rows, dtype=np.int64) for source_id, rows in info.get("alternates", {}).items()}
+        # quantized copies written with this matrix, any other codes in the directory are not to be trusted
+        self.quantizations = info.get("quantizations", [])
+        self.chunks = ChunkStore(self.index_path)
+
+        self.quantization = quantization
+        self._int8 = None   # (codes, scales)
+        self._binary = None
+        if quantization:
+            self._load_quantized(quantization)
+
+    def _load_quantized(self, quantization: str):
+        """Codes of a quantization, memory-mapped on first use (pages are shared with other processes)."""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        if quantization not in self.quantizations:
+            raise ValueError(f"{self.index_path} has no {quantization} codes, export it with --quantize {quantization}")
+        try:
+            if quantization == "int8":
+                if self._int8 is None:
+                    int8 = (np.load(os.path.join(self.index_path, INT8_FILE), mmap_mode="r"),
+                            np.load(os.path.join(self.index_path, INT8_SCALES_FILE)))
+                    self._check_rows(quantization, int8[0])
+                    self._int8 = int8
+                return self._int8
+            if self._binary is None:
+                binary = np.load(os.path.join(self.index_path, BINARY_FILE), mmap_mode="r")
+                self._check_rows(quantization, binary)
+                self._binary = binary
+            return self._binary
+        except FileNotFoundError:
+            raise ValueError(f"{self.index_path} has no {quantization} codes, export it with --quantize {quantization}") from None
+
+    def _check_rows(self, quantization: str, codes):
+        if codes.shape[0] != self.embeddings.shape[0]:
+            raise ValueError(
+                f"{self.index_path} has {quantization} codes for {codes.shape[0]} rows but {self.embeddings.shape[0]} "
+                f"embeddings, re-export it with --quantize {quantization}"
+            )
+
+    def _space_distances(self, queries, dots, squared_norms):
+        """Distances in the collection's space from query . row dot products."""
+        if self.space == "ip":
+            return 1.0 - dots
+        if self.space == "cosine":
+            query_norms = np.linalg.norm(queries, axis=-1, keepdims=True)
+            return 1.0 - dots / np.maximum(query_norms * np.sqrt(squared_norms), 1e-12)
+        # squared l2, like chroma : ||q||^2 + ||x||^2 - 2 q.x
+        query_squared_norms = np.einsum("...j,...j->...", queries, queries)[..., None]
+        return np.maximum(query_squared_norms + squared_norms - 2.0 * dots, 0.0)
+
+    def source_scope(self, sources):
+        """
+        (ranges, rows) of the given sources: the [first row, end row) ranges of their partitions in file order
+        (adjacent ones merged) and the sorted rows outside them they share as alternate sources.
+        A scoped search scores the ranges' rows then these rows, laid end to end.
+        """
+        ranges = []
+        for start, end in sorted(self.partitions[source_id] for source_id in sources if source_id in self.partitions):
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        rows = np.unique(np.concatenate([self.alternates.get(source_id, np.empty(0, dtype=np.int64)) for source_id in sources]))
+        for start, end in ranges:
+            rows = rows[(rows < start) | (rows >= end)]
+        return ranges, rows
+
+    def distances(self, query_embeddings, scope=None):
+        """
+        (queries x chunks) exact distances in the collection's space, only to the rows of a `source_scope` if given
+        (scored range by range on views of the memory-mapped matrix, nothing outside the scope is read).
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if scope is None:
+            return self._space_distances(queries, queries @ self.embeddings.T, self.squared_norms)
+        ranges, rows = scope
+        return np.concatenate([
+            self._space_distances(queries, queries @ self.embeddings[start:end].T, self.squared_norms[start:end])
+            for start, end in ranges
+        ] + [self._space_distances(queries, queries @ self.embeddings[rows].T, self.squared_norms[rows])], axis=1)
+
+    def candidates(self, query_embeddings, n_candidates: int, quantization: str, scope=None):
+        """
+        (queries x n_candidates) indices of the closest rows by the quantized codes (unordered), among the rows of
+        a `source_scope` (laid end to end) if given.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        ranges, rows = scope if scope is not None else ([(0, len(self.chunks))], np.empty(0, dtype=np.int64))
+        if quantization == "int8":
+            codes, scales = self._load_quantized("int8")
+            scaled_queries = queries * scales
+            dots = np.concatenate([
+                scaled_queries @ codes[block:min(block + INT8_SCORE_BLOCK, end)].T.astype(np.float32)
+                for start, end in ranges for block in range(start, end, INT8_SCORE_BLOCK)
+            ] + [scaled_queries @ codes[rows].T.astype(np.float32)], axis=1)
+            squared_norms = np.concatenate([self.squared_norms[start:end] for start, end in ranges] + [self.squared_norms[rows]])
+            approx = self._space_distances(queries, dots, squared_norms)
+        else:
+            codes = self._load_quantized("binary")
+            # Hamming distance between sign bit codes, one query at a time keeps the XOR buffer at (chunks x bytes)
+            approx = np.stack([
+                np.concatenate([hamming_distances(codes[start:end], bits) for start, end in ranges] + [hamming_distances(codes[rows], bits)])
+                for bits in quantize_binary(queries)
+            ])
+        return np.argpartition(approx, n_candidates - 1, axis=1)[:, :n_candidates]
+
+    def query(self, query_embeddings, k: int, quantization: str = None, sources=None):
+        # sources (resolved source ids) limits the search to their partitions
+        quantization = quantization or self.quantization
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        scope = self.source_scope(sources) if sources is not None else None
+        n_rows = len(self.chunks) if scope is None else sum(end - start for start, end in scope[0]) + len(scope[1])
+        k = min(k, n_rows)
+        if k == 0:
+            return {key: [[] for _ in range(len(queries))] for key in ("ids", "documents", "metadatas", "distances")}
+
+        n_candidates = min(n_rows, k * OVERSAMPLE[quantization]) if quantization else 0
+        if not quantization or n_candidates == n_rows:
+            return self._top_k_results(self.distances(queries, scope), k, scope)
+
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query, rows in zip(queries, self.candidates(queries, n_candidates, quantization, scope)):
+            # exact rescoring, reading only the candidate rows (in file order) from the memory-mapped matrix
+            rows = np.sort(_scope_rows(scope, rows))
+            distances = self._space_distances(query[None], query @ self.embeddings[rows].T, self.squared_norms[rows])
+            top, top_distances = self._top_k(distances, k)
+            self._append_rows(results, rows[top[0]], top_distances[0])
+        return results
+
+    def _top_k(self, distances, k: int):
+        """Row-wise indices and distances of the k smallest distances, closest first."""
+        # unordered top-k per row, then sort just those k
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_distances, order, axis=1)
+
+    def _top_k_results(self, distances, k: int, scope=None):
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        top, top_distances = self._top_k(distances, k)
+        for rows, row_distances in zip(top, top_distances):
+            self._append_rows(results, _scope_rows(scope, rows), row_distances)
+        return results
+
+    def _append_rows(self, results, rows, distances):
+        """Add one query's result row in chroma's layout."""
+        chunks = [self.chunks[i] for i in rows.tolist()]
+        results["ids"].append([chunk["id"] for chunk in chunks])
+        results["documents"].append([chunk["document"] for chunk in chunks])
+        results["metadatas"].append([chunk["metadata"] for chunk in chunks])
+        results["distances"].append(distances.tolist())
+
+    def memory_footprint(self, quantization: str = None) -> int:
+        """Bytes of vectors a query has to scan: the float32 matrix, or the quantized codes."""
+        if quantization == "int8":
+            codes, scales = self._load_quantized("int8")
+            return codes.nbytes + scales.nbytes
+        if quantization == "binary":
+            return self._load_quantized("binary").nbytes
+        return self.embeddings.nbytes
+
+
+def _scope_rows(scope, indices):
+    """Matrix rows of indices into the rows of a `source_scope` laid end to end (None for the whole matrix)."""
+    if scope is None:
+        return indices
+    ranges, rows = scope
+    # every extra row is a range of one
+    starts = np.concatenate([np.array([start for start, _ in ranges], dtype=np.int64), rows])
+    offsets = np.cumsum([0] + [end - start for start, end in ranges] + [1] * len(rows))
+    which = np.searchsorted(offsets, indices, side="right") - 1
+    return starts[which] + indices - offsets[which]